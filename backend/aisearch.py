@@ -1,14 +1,20 @@
+import argparse
+import asyncio
+import base64
+import hashlib
 import json
 import logging
 import os
 import subprocess
+import threading
 import time
 
-from azure.core.exceptions import ResourceExistsError
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
 from azure.identity import AzureDeveloperCliCredential, DefaultAzureCredential, ManagedIdentityCredential
 from azure.search.documents.indexes import SearchIndexClient, SearchIndexerClient
 from azure.search.documents.indexes.models import (
     AzureOpenAIEmbeddingSkill,
+    BinaryQuantizationCompression,
     AzureOpenAIVectorizerParameters,
     AzureOpenAIVectorizer,
     FieldMapping,
@@ -17,6 +23,9 @@ from azure.search.documents.indexes.models import (
     IndexProjectionMode,
     InputFieldMappingEntry,
     OutputFieldMappingEntry,
+    RescoringOptions,
+    ScalarQuantizationCompression,
+    ScalarQuantizationParameters,
     SearchableField,
     SearchField,
     SearchFieldDataType,
@@ -38,15 +47,63 @@ from azure.search.documents.indexes.models import (
     SplitSkill,
     VectorSearch,
     VectorSearchAlgorithmMetric,
+    VectorSearchCompression,
+    VectorSearchCompressionRescoreStorageMethod,
     VectorSearchProfile,
 )
-from azure.storage.blob import BlobServiceClient
+from azure.identity.aio import DefaultAzureCredential as AsyncDefaultAzureCredential
+from azure.storage.blob import BlobBlock, BlobServiceClient, ContentSettings
+from azure.storage.blob.aio import BlobServiceClient as AsyncBlobServiceClient
 from dotenv import load_dotenv
-from typing import List
+from typing import Dict, List, Optional, Tuple
 from fastapi import UploadFile
 # from rich.logging import RichHandler
 
 EMBEDDINGS_DIMENSIONS = 3072
+# characters per chunk and overlap between chunks, of the skillset and the client-side pipeline
+SPLIT_PAGE_LENGTH = 2000
+SPLIT_PAGE_OVERLAP = 500
+
+# /upload streams every file to Blob storage in blocks of this size, so memory per file stays constant
+UPLOAD_BLOCK_SIZE = int(os.getenv("UPLOAD_BLOCK_SIZE", 4 * 1024 * 1024))
+# files of one /upload request that are uploaded at the same time
+UPLOAD_MAX_CONCURRENCY = int(os.getenv("UPLOAD_MAX_CONCURRENCY", "4"))
+# blob metadata with the sha256 of the uploaded content; unchanged files are not uploaded again
+CONTENT_HASH_METADATA = "content_sha256"
+# seconds an index is remembered as fully provisioned, repeat uploads within it skip all lookups
+SEARCH_RESOURCE_CACHE_TTL = float(os.getenv("SEARCH_RESOURCE_CACHE_TTL", "600"))
+
+
+class ProvisionedIndexCache:
+    """(search endpoint, index name) -> time setup_index last found or created all of its resources
+    (container, data source, index, skillset, indexer)."""
+
+    def __init__(self, ttl: float = SEARCH_RESOURCE_CACHE_TTL):
+        self.ttl = ttl
+        self._provisioned: Dict[Tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: Tuple[str, str]) -> bool:
+        with self._lock:
+            provisioned = self._provisioned.get(key)
+            if provisioned is None:
+                return False
+            if time.monotonic() - provisioned > self.ttl:
+                del self._provisioned[key]
+                return False
+            return True
+
+    def add(self, key: Tuple[str, str]) -> None:
+        with self._lock:
+            self._provisioned[key] = time.monotonic()
+
+    def invalidate(self, key: Tuple[str, str]) -> None:
+        with self._lock:
+            self._provisioned.pop(key, None)
+
+
+provisioned_indexes = ProvisionedIndexCache()
+
 
 def load_azd_env():
     # """Get path to current azd env file and load file using python-dotenv"""
@@ -65,7 +122,157 @@ def load_azd_env():
     load_dotenv("../.env", override=True)
 
 
-def setup_index(azure_credential, azure_storage_endpoint, uami_resource_id,  index_name, azure_search_endpoint, azure_storage_connection_string, azure_storage_container, azure_openai_embedding_endpoint, azure_openai_embedding_deployment, azure_openai_embedding_model, azure_openai_embeddings_dimensions):
+class VectorCompression:
+    """Compression of the text_vector field of new indexes.
+
+    kind: "none" (full precision floats), "scalar" (int8) or "binary" (1 bit per dimension) quantization.
+    truncation_dimension: keep only the first dimensions of the compressed vectors (text-embedding-3
+    models are trained for this), e.g. 1024 of 3072; needs a quantization kind.
+    oversampling: candidates fetched per requested neighbour, rescored with the original vectors.
+    preserve_originals: keep the full precision vectors for rescoring (more storage, better recall).
+    stored: whether the original vectors are also kept retrievable.
+
+    Settings (environment): SEARCH_VECTOR_COMPRESSION, SEARCH_VECTOR_TRUNCATION_DIMENSION,
+    SEARCH_VECTOR_OVERSAMPLING, SEARCH_VECTOR_RESCORE_STORAGE (preserveOriginals | discardOriginals),
+    SEARCH_VECTOR_STORED (true | false). Compression can not be added to an existing index; compare
+    settings with benchmarks/vector_compression.py.
+    """
+    KINDS = ("none", "scalar", "binary")
+    DEFAULT_OVERSAMPLING = {"scalar": 4.0, "binary": 10.0}
+
+    def __init__(self, kind: str = "none", truncation_dimension: Optional[int] = None, oversampling: Optional[float] = None,
+                 preserve_originals: bool = True, stored: bool = True):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown vector compression '{kind}', use one of: {', '.join(self.KINDS)}")
+        if truncation_dimension and kind == "none":
+            raise ValueError("Vector truncation needs scalar or binary compression")
+        self.kind = kind
+        self.truncation_dimension = truncation_dimension or None
+        self.oversampling = oversampling or self.DEFAULT_OVERSAMPLING.get(kind)
+        self.preserve_originals = preserve_originals
+        self.stored = stored
+
+    @classmethod
+    def from_env(cls) -> "VectorCompression":
+        return cls(
+            kind=os.getenv("SEARCH_VECTOR_COMPRESSION", "none"),
+            truncation_dimension=int(os.getenv("SEARCH_VECTOR_TRUNCATION_DIMENSION", "0")),
+            oversampling=float(os.getenv("SEARCH_VECTOR_OVERSAMPLING", "0")),
+            preserve_originals=os.getenv("SEARCH_VECTOR_RESCORE_STORAGE", "preserveOriginals") != "discardOriginals",
+            stored=os.getenv("SEARCH_VECTOR_STORED", "true").lower() != "false",
+        )
+
+    @classmethod
+    def parse(cls, spec: str) -> "VectorCompression":
+        """From "kind[:truncation_dimension]", e.g. "binary:1024"."""
+        kind, _, truncation_dimension = spec.partition(":")
+        return cls(kind, int(truncation_dimension) if truncation_dimension else None)
+
+    @property
+    def name(self) -> str:
+        return f"{self.kind}-{self.truncation_dimension}" if self.truncation_dimension else self.kind
+
+    def compression(self) -> Optional[VectorSearchCompression]:
+        if self.kind == "none":
+            return None
+        options = dict(
+            compression_name=self.name,
+            truncation_dimension=self.truncation_dimension,
+            rescoring_options=RescoringOptions(
+                enable_rescoring=True,
+                default_oversampling=self.oversampling,
+                rescore_storage_method=VectorSearchCompressionRescoreStorageMethod.PRESERVE_ORIGINALS if self.preserve_originals
+                else VectorSearchCompressionRescoreStorageMethod.DISCARD_ORIGINALS,
+            ),
+        )
+        if self.kind == "scalar":
+            return ScalarQuantizationCompression(parameters=ScalarQuantizationParameters(quantized_data_type="int8"), **options)
+        return BinaryQuantizationCompression(**options)
+
+
+def search_index_definition(index_name, uami_resource_id, azure_openai_embedding_endpoint, azure_openai_embedding_deployment, azure_openai_embedding_model,
+                            vector_compression: Optional[VectorCompression] = None):
+    """The index the skillset projects chunks into, also used by the client-side pipeline (ingestion.py)."""
+    vector_compression = vector_compression or VectorCompression.from_env()
+    compression = vector_compression.compression()
+    return SearchIndex(
+        name=index_name,
+        fields=[
+            SearchableField(name="chunk_id", key=True, analyzer_name="keyword", sortable=True),
+            SimpleField(name="parent_id", type=SearchFieldDataType.String, filterable=True),
+            SearchableField(name="title"),
+            SearchableField(name="chunk"),
+            SearchField(
+                name="text_vector", 
+                type=SearchFieldDataType.Collection(SearchFieldDataType.Single),
+                vector_search_dimensions=EMBEDDINGS_DIMENSIONS,
+                vector_search_profile_name="vp",
+                stored=vector_compression.stored,
+                hidden=False)
+        ],
+        vector_search=VectorSearch(
+            algorithms=[
+                HnswAlgorithmConfiguration(name="algo", parameters=HnswParameters(metric=VectorSearchAlgorithmMetric.COSINE))
+            ],
+            vectorizers=[
+                AzureOpenAIVectorizer(
+                    vectorizer_name="openai_vectorizer",
+                    parameters=AzureOpenAIVectorizerParameters(
+                        resource_url=azure_openai_embedding_endpoint,
+                        auth_identity=SearchIndexerDataUserAssignedIdentity(resource_id=uami_resource_id),
+                        deployment_name=azure_openai_embedding_deployment,
+                        model_name=azure_openai_embedding_model
+                    )
+                )
+            ],
+            profiles=[
+                VectorSearchProfile(name="vp", algorithm_configuration_name="algo", vectorizer_name="openai_vectorizer",
+                                    compression_name=compression.compression_name if compression else None)
+            ],
+            compressions=[compression] if compression else None
+        ),
+        semantic_search=SemanticSearch(
+            configurations=[
+                SemanticConfiguration(
+                    name="default",
+                    prioritized_fields=SemanticPrioritizedFields(title_field=SemanticField(field_name="title"), content_fields=[SemanticField(field_name="chunk")])
+                )
+            ],
+            default_configuration_name="default"
+        )
+    )
+
+
+def _exists(get, name: str) -> bool:
+    try:
+        get(name)
+        return True
+    except ResourceNotFoundError:
+        return False
+
+
+def setup_index(azure_credential, azure_storage_endpoint, uami_resource_id,  index_name, azure_search_endpoint, azure_storage_connection_string, azure_storage_container, azure_openai_embedding_endpoint, azure_openai_embedding_deployment, azure_openai_embedding_model, azure_openai_embeddings_dimensions, vector_compression: Optional[VectorCompression] = None):
+    """Create the container, data source, index, skillset and indexer of index_name where missing.
+    Returns whether the indexer was created (and so is already running).
+
+    Indexes that were fully provisioned within SEARCH_RESOURCE_CACHE_TTL seconds are not looked up
+    again; the cache entry is dropped when provisioning fails."""
+    key = (azure_search_endpoint, index_name)
+    if key in provisioned_indexes:
+        logging.getLogger("dream-team").info(f"Index {index_name} was provisioned recently, not checking again")
+        return False
+    try:
+        created = _setup_index(azure_credential, azure_storage_endpoint, uami_resource_id, index_name, azure_search_endpoint,
+                               azure_storage_connection_string, azure_storage_container, azure_openai_embedding_endpoint,
+                               azure_openai_embedding_deployment, azure_openai_embedding_model, azure_openai_embeddings_dimensions, vector_compression)
+    except Exception:
+        provisioned_indexes.invalidate(key)
+        raise
+    provisioned_indexes.add(key)
+    return created
+
+
+def _setup_index(azure_credential, azure_storage_endpoint, uami_resource_id,  index_name, azure_search_endpoint, azure_storage_connection_string, azure_storage_container, azure_openai_embedding_endpoint, azure_openai_embedding_deployment, azure_openai_embedding_model, azure_openai_embeddings_dimensions, vector_compression=None):
     index_client = SearchIndexClient(azure_search_endpoint, azure_credential)
     indexer_client = SearchIndexerClient(azure_search_endpoint, azure_credential)
 
@@ -80,14 +287,14 @@ def setup_index(azure_credential, azure_storage_endpoint, uami_resource_id,  ind
         max_single_put_size=4 * 1024 * 1024
     )
     container_client = blob_client.get_container_client(azure_storage_container)
+    # one request instead of exists() + create
     try:
-        if not container_client.exists():
-            container_client.create_container()
-            logger.info(f"Created blob storage container: {azure_storage_container}")
-    except :
+        container_client.create_container()
+        logger.info(f"Created blob storage container: {azure_storage_container}")
+    except ResourceExistsError:
         logger.info(f"Blob storage container {azure_storage_container} already exists")
-    data_source_connections = indexer_client.get_data_source_connections()
-    if index_name in [ds.name for ds in data_source_connections]:
+    # get by name rather than listing all resources of the search service
+    if _exists(indexer_client.get_data_source_connection, index_name):
         logger.info(f"Data source connection {index_name} already exists, not re-creating")
     else:
         logger.info(f"Creating data source connection: {index_name}")
@@ -100,60 +307,14 @@ def setup_index(azure_credential, azure_storage_endpoint, uami_resource_id,  ind
                 container=SearchIndexerDataContainer(name=azure_storage_container)))
         
 
-    index_names = [index.name for index in index_client.list_indexes()]
-    if index_name in index_names:
+    if _exists(index_client.get_index, index_name):
         logger.info(f"Index {index_name} already exists, not re-creating")
     else:
         logger.info(f"Creating index: {index_name}")
-        index_client.create_index(
-            SearchIndex(
-                name=index_name,
-                fields=[
-                    SearchableField(name="chunk_id", key=True, analyzer_name="keyword", sortable=True),
-                    SimpleField(name="parent_id", type=SearchFieldDataType.String, filterable=True),
-                    SearchableField(name="title"),
-                    SearchableField(name="chunk"),
-                    SearchField(
-                        name="text_vector", 
-                        type=SearchFieldDataType.Collection(SearchFieldDataType.Single),
-                        vector_search_dimensions=EMBEDDINGS_DIMENSIONS,
-                        vector_search_profile_name="vp",
-                        stored=True,
-                        hidden=False)
-                ],
-                vector_search=VectorSearch(
-                    algorithms=[
-                        HnswAlgorithmConfiguration(name="algo", parameters=HnswParameters(metric=VectorSearchAlgorithmMetric.COSINE))
-                    ],
-                    vectorizers=[
-                        AzureOpenAIVectorizer(
-                            vectorizer_name="openai_vectorizer",
-                            parameters=AzureOpenAIVectorizerParameters(
-                                resource_url=azure_openai_embedding_endpoint,
-                                auth_identity=SearchIndexerDataUserAssignedIdentity(resource_id=uami_resource_id),
-                                deployment_name=azure_openai_embedding_deployment,
-                                model_name=azure_openai_embedding_model
-                            )
-                        )
-                    ],
-                    profiles=[
-                        VectorSearchProfile(name="vp", algorithm_configuration_name="algo", vectorizer_name="openai_vectorizer")
-                    ]
-                ),
-                semantic_search=SemanticSearch(
-                    configurations=[
-                        SemanticConfiguration(
-                            name="default",
-                            prioritized_fields=SemanticPrioritizedFields(title_field=SemanticField(field_name="title"), content_fields=[SemanticField(field_name="chunk")])
-                        )
-                    ],
-                    default_configuration_name="default"
-                )
-            )
-        )
+        index_client.create_index(search_index_definition(index_name, uami_resource_id, azure_openai_embedding_endpoint,
+                                                          azure_openai_embedding_deployment, azure_openai_embedding_model, vector_compression))
 
-    skillsets = indexer_client.get_skillsets()
-    if index_name in [skillset.name for skillset in skillsets]:
+    if _exists(indexer_client.get_skillset, index_name):
         logger.info(f"Skillset {index_name} already exists, not re-creating")
     else:
         logger.info(f"Creating skillset: {index_name}")
@@ -164,8 +325,8 @@ def setup_index(azure_credential, azure_storage_endpoint, uami_resource_id,  ind
                     SplitSkill(
                         text_split_mode="pages",
                         context="/document",
-                        maximum_page_length=2000,
-                        page_overlap_length=500,
+                        maximum_page_length=SPLIT_PAGE_LENGTH,
+                        page_overlap_length=SPLIT_PAGE_OVERLAP,
                         inputs=[InputFieldMappingEntry(name="text", source="/document/content")],
                         outputs=[OutputFieldMappingEntry(name="textItems", target_name="pages")]),
                     AzureOpenAIEmbeddingSkill(
@@ -196,9 +357,9 @@ def setup_index(azure_credential, azure_storage_endpoint, uami_resource_id,  ind
                     )
                 )))
 
-    indexers = indexer_client.get_indexers()
-    if index_name in [indexer.name for indexer in indexers]:
+    if _exists(indexer_client.get_indexer, index_name):
         logger.info(f"Indexer {index_name} already exists, not re-creating")
+        return False
     else:
         indexer_client.create_indexer(
             indexer=SearchIndexer(
@@ -209,6 +370,8 @@ def setup_index(azure_credential, azure_storage_endpoint, uami_resource_id,  ind
                 field_mappings=[FieldMapping(source_field_name="metadata_storage_name", target_field_name="title")]
             )
         )
+        # a new indexer runs right away
+        return True
 
 
 def upload_documents(azure_credential, source_folder, indexer_name, azure_search_endpoint, azure_storage_endpoint, azure_storage_container):
@@ -224,18 +387,25 @@ def upload_documents(azure_credential, source_folder, indexer_name, azure_search
     container_client = blob_client.get_container_client(azure_storage_container)
     if not container_client.exists():
         container_client.create_container()
-    existing_blobs = [blob.name for blob in container_client.list_blobs()]
 
     # Open each file in /data folder
+    changed = False
     for file in os.scandir(source_folder):
         with open(file.path, "rb") as opened_file:
             filename = os.path.basename(file.path)
-            # Check if blob already exists
-            if filename in existing_blobs:
-                logger.info("Blob already exists, skipping file: %s", filename)
+            content_hash = file_sha256(opened_file)
+            # Skip the file if the blob has the same content
+            if stored_content_hash(container_client.get_blob_client(filename)) == content_hash:
+                logger.info("Blob is unchanged, skipping file: %s", filename)
             else:
                 logger.info("Uploading blob for file: %s", filename)
-                blob_client = container_client.upload_blob(filename, opened_file, overwrite=True)
+                opened_file.seek(0)
+                blob_client = container_client.upload_blob(filename, opened_file, overwrite=True, metadata={CONTENT_HASH_METADATA: content_hash})
+                changed = True
+
+    if not changed:
+        logger.info("No new or changed documents, not starting the indexer")
+        return
 
     # Start the indexer
     try:
@@ -244,26 +414,134 @@ def upload_documents(azure_credential, source_folder, indexer_name, azure_search
     except ResourceExistsError:
         logger.info("Indexer already running, not starting again")
 
-def wait_for_indexing(azure_credential, azure_search_endpoint, indexer_name):
-    """Poll the indexer status every 5 seconds until indexing is complete."""
-    indexer_client = SearchIndexerClient(azure_search_endpoint, azure_credential)
-    logger = logging.getLogger("wait_for_indexing")
-    logger.setLevel(logging.INFO)
-    while True:
-        status_response = indexer_client.get_indexer_status(indexer_name)
-        # Assuming last_result.status returns a status string like "inProgress" when still indexing.
-        current_status = getattr(status_response.last_result, "status", None)
-        if current_status is not None and current_status.lower() != "inprogress":
-            logger.info("Indexing complete with status: %s", current_status)
-            break
-        logger.info("Indexing in progress, waiting 5 seconds...")
-        time.sleep(5)
-def process_upload_and_index(index_name: str, upload_files: List[UploadFile]):
-    # Store each file in the container named index_name
+
+def _throughput(size: int, seconds: float) -> float:
+    return round(size / (1024 * 1024) / seconds, 2) if seconds > 0 else 0.0
+
+
+def file_sha256(opened_file, block_size: int = UPLOAD_BLOCK_SIZE) -> str:
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: opened_file.read(block_size), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def upload_file_sha256(upload_file: UploadFile, block_size: int = UPLOAD_BLOCK_SIZE) -> str:
+    """sha256 of an uploaded file, read block by block; the file is rewound afterwards."""
+    digest = hashlib.sha256()
+    chunk = await upload_file.read(block_size)
+    while chunk:
+        digest.update(chunk)
+        chunk = await upload_file.read(block_size)
+    await upload_file.seek(0)
+    return digest.hexdigest()
+
+
+def stored_content_hash(blob_client) -> str:
+    """The content hash stored in the metadata of a blob, None if the blob or the hash is missing."""
+    try:
+        return blob_client.get_blob_properties().metadata.get(CONTENT_HASH_METADATA)
+    except ResourceNotFoundError:
+        return None
+
+
+async def stored_content_hash_async(blob_client) -> str:
+    try:
+        return (await blob_client.get_blob_properties()).metadata.get(CONTENT_HASH_METADATA)
+    except ResourceNotFoundError:
+        return None
+
+
+async def upload_stream(container_client, upload_file: UploadFile, block_size: int = UPLOAD_BLOCK_SIZE, metadata: dict = None) -> int:
+    """Upload one file to the (async) container, reading and staging it block by block.
+    Returns the number of bytes uploaded."""
+    blob_client = container_client.get_blob_client(upload_file.filename)
+    content_settings = ContentSettings(content_type=upload_file.content_type) if upload_file.content_type else None
+    chunk = await upload_file.read(block_size)
+    if len(chunk) < block_size:
+        # small file, a single request
+        await blob_client.upload_blob(chunk, overwrite=True, content_settings=content_settings, metadata=metadata)
+        return len(chunk)
+    block_list = []
+    size = 0
+    while chunk:
+        block_id = base64.b64encode(f"{len(block_list):08d}".encode()).decode()
+        await blob_client.stage_block(block_id, chunk)
+        block_list.append(BlobBlock(block_id=block_id))
+        size += len(chunk)
+        chunk = await upload_file.read(block_size)
+    await blob_client.commit_block_list(block_list, content_settings=content_settings, metadata=metadata)
+    return size
+
+
+async def upload_files_to_container(container_client, upload_files: List[UploadFile], max_concurrency: int = UPLOAD_MAX_CONCURRENCY, block_size: int = UPLOAD_BLOCK_SIZE) -> dict:
+    """Upload the files concurrently (at most `max_concurrency` at a time). Files whose content hash
+    matches the hash stored with the blob are skipped, changed files are uploaded again.
+    Returns throughput metrics."""
+    logger = logging.getLogger("process_upload_and_index")
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def upload(upload_file: UploadFile) -> dict:
+        filename = upload_file.filename
+        async with semaphore:
+            content_hash = await upload_file_sha256(upload_file, block_size)
+            if await stored_content_hash_async(container_client.get_blob_client(filename)) == content_hash:
+                logger.info("Blob is unchanged, skipping file: %s", filename)
+                return {"filename": filename, "skipped": True, "bytes": 0, "seconds": 0.0, "mb_per_s": 0.0}
+            logger.info("Uploading blob for file: %s", filename)
+            started = time.perf_counter()
+            size = await upload_stream(container_client, upload_file, block_size, metadata={CONTENT_HASH_METADATA: content_hash})
+            seconds = time.perf_counter() - started
+        return {"filename": filename, "skipped": False, "bytes": size, "seconds": round(seconds, 3), "mb_per_s": _throughput(size, seconds)}
+
+    started = time.perf_counter()
+    files = await asyncio.gather(*(upload(upload_file) for upload_file in upload_files))
+    seconds = time.perf_counter() - started
+    total_bytes = sum(f["bytes"] for f in files)
+    return {
+        "files": files,
+        "uploaded": sum(1 for f in files if not f["skipped"]),
+        "skipped": sum(1 for f in files if f["skipped"]),
+        "bytes": total_bytes,
+        "seconds": round(seconds, 3),
+        "mb_per_s": _throughput(total_bytes, seconds),
+        "max_concurrency": max_concurrency,
+        "block_size": block_size,
+    }
+
+
+async def upload_to_container(index_name: str, upload_files: List[UploadFile], max_concurrency: int = UPLOAD_MAX_CONCURRENCY, block_size: int = UPLOAD_BLOCK_SIZE) -> dict:
+    """Store each file in the container named index_name. Returns the upload throughput metrics."""
     logging.basicConfig(level=logging.WARNING, format="%(message)s", datefmt="[%X]")
     logger = logging.getLogger("process_upload_and_index")
     logger.setLevel(logging.INFO)
-    
+
+    AZURE_STORAGE_ENDPOINT =  os.getenv("AZURE_STORAGE_ACCOUNT_ENDPOINT")
+    azure_storage_container = index_name
+
+    async with AsyncDefaultAzureCredential() as async_credential, AsyncBlobServiceClient(
+        account_url=AZURE_STORAGE_ENDPOINT, credential=async_credential
+    ) as blob_client:
+        container_client = blob_client.get_container_client(azure_storage_container)
+        if not await container_client.exists():
+            try:
+                await container_client.create_container()
+                logger.info(f"Created blob storage container: {azure_storage_container}")
+            except ResourceExistsError:
+                pass
+        metrics = await upload_files_to_container(container_client, upload_files, max_concurrency, block_size)
+    logger.info(f"Uploaded {metrics['uploaded']} files ({metrics['bytes']} bytes) at {metrics['mb_per_s']} MB/s")
+    return metrics
+
+
+def provision_index(index_name: str, run_indexer: bool = True, vector_compression: Optional[VectorCompression] = None) -> bool:
+    """Set up the data source, index, skillset and indexer of index_name and run the indexer if
+    `run_indexer` (i.e. blobs changed). Returns whether the indexer is running.
+    A new index gets `vector_compression`, by default the one configured in the environment.
+    Does not wait for indexing, see indexing_jobs for tracking its progress."""
+    logger = logging.getLogger("process_upload_and_index")
+    logger.setLevel(logging.INFO)
+
     AZURE_OPENAI_EMBEDDING_ENDPOINT = os.environ["AZURE_OPENAI_ENDPOINT"]
     AZURE_OPENAI_EMBEDDING_DEPLOYMENT = os.environ["AZURE_OPENAI_EMBEDDING_MODEL"]
     AZURE_OPENAI_EMBEDDING_MODEL = os.environ["AZURE_OPENAI_EMBEDDING_MODEL"]
@@ -277,28 +555,8 @@ def process_upload_and_index(index_name: str, upload_files: List[UploadFile]):
     AZURE_STORAGE_CONNECTION_STRING =  f"ResourceId={os.getenv('AZURE_STORAGE_ACCOUNT_ID')}"
 
     azure_credential = DefaultAzureCredential()
-    azure_storage_container = index_name
-
-    blob_client = BlobServiceClient(
-        account_url=AZURE_STORAGE_ENDPOINT, credential=azure_credential,
-        max_single_put_size=4 * 1024 * 1024
-    )
-    container_client = blob_client.get_container_client(azure_storage_container)
-    if not container_client.exists():
-        container_client.create_container()
-        logger.info(f"Created blob storage container: {azure_storage_container}")
-    existing_blobs = [blob.name for blob in container_client.list_blobs()]
-
-    for file in upload_files:
-        file_contents = file.file.read()
-        filename = file.filename
-        if filename in existing_blobs:
-            logger.info("Blob already exists, skipping file: %s", filename)
-        else:
-            logger.info("Uploading blob for file: %s", filename)
-            container_client.upload_blob(filename, file_contents, overwrite=True)
 
-    setup_index(azure_credential,
+    created = setup_index(azure_credential,
                     azure_storage_endpoint=AZURE_STORAGE_ENDPOINT,
             index_name=f"{index_name}",
             # uami_id=UAMI_ID,
@@ -309,12 +567,95 @@ def process_upload_and_index(index_name: str, upload_files: List[UploadFile]):
             azure_openai_embedding_endpoint=AZURE_OPENAI_EMBEDDING_ENDPOINT,
             azure_openai_embedding_deployment=AZURE_OPENAI_EMBEDDING_DEPLOYMENT,
             azure_openai_embedding_model=AZURE_OPENAI_EMBEDDING_MODEL,
-            azure_openai_embeddings_dimensions=EMBEDDINGS_DIMENSIONS)
-    
-    wait_for_indexing(azure_credential, AZURE_SEARCH_ENDPOINT, index_name)
+            azure_openai_embeddings_dimensions=EMBEDDINGS_DIMENSIONS,
+            vector_compression=vector_compression)
+
+    # a new indexer runs on creation, an existing one has to be started for new or changed blobs
+    if created:
+        return True
+    if not run_indexer:
+        logger.info(f"No new or changed blobs, not running indexer {index_name}")
+        return False
+    try:
+        SearchIndexerClient(AZURE_SEARCH_ENDPOINT, azure_credential).run_indexer(index_name)
+        logger.info(f"Indexer {index_name} started")
+    except ResourceExistsError:
+        logger.info(f"Indexer {index_name} already running, not starting again")
+    except Exception:
+        # e.g. the indexer was deleted since it was cached, check all resources next time
+        provisioned_indexes.invalidate((AZURE_SEARCH_ENDPOINT, index_name))
+        raise
+    return True
+
+
+async def seed_index(index_name: str, source_folder: str, max_concurrency: int = UPLOAD_MAX_CONCURRENCY, block_size: int = UPLOAD_BLOCK_SIZE,
+                     vector_compression: Optional[VectorCompression] = None) -> dict:
+    """Upload the files of source_folder to the container of index_name, then provision the index
+    and run its indexer if anything changed. Returns the timings of both steps."""
+    started = time.perf_counter()
+    paths = [entry.path for entry in os.scandir(source_folder) if entry.is_file()]
+    upload_files = [UploadFile(open(path, "rb"), filename=os.path.basename(path)) for path in paths]
+    try:
+        upload = await upload_to_container(index_name, upload_files, max_concurrency, block_size)
+    finally:
+        for upload_file in upload_files:
+            upload_file.file.close()
+    provisioning_started = time.perf_counter()
+    indexing = await asyncio.to_thread(provision_index, index_name, upload["uploaded"] > 0, vector_compression)
+    finished = time.perf_counter()
+    return {
+        "index_name": index_name,
+        "uploaded": upload["uploaded"],
+        "skipped": upload["skipped"],
+        "bytes": upload["bytes"],
+        "upload_seconds": upload["seconds"],
+        "mb_per_s": upload["mb_per_s"],
+        "provision_seconds": round(finished - provisioning_started, 3),
+        "seconds": round(finished - started, 3),
+        "indexer_running": indexing,
+    }
+
+
+async def seed_indexes(source_directory: str, index_concurrency: int = 4, max_concurrency: int = UPLOAD_MAX_CONCURRENCY, block_size: int = UPLOAD_BLOCK_SIZE,
+                       vector_compression: Optional[VectorCompression] = None) -> List[dict]:
+    """Seed every folder of source_directory as an index, `index_concurrency` indexes at a time.
+    Returns the seed_index result of each index, or {"index_name", "error"} if it failed."""
+    semaphore = asyncio.Semaphore(index_concurrency)
+
+    async def seed(index_name: str) -> dict:
+        async with semaphore:
+            try:
+                return await seed_index(index_name, os.path.join(source_directory, index_name), max_concurrency, block_size, vector_compression)
+            except Exception as e:
+                logging.getLogger("dream-team").error(f"Seeding index {index_name} failed: {str(e)}")
+                return {"index_name": index_name, "error": str(e)}
+
+    folders = sorted(entry.name for entry in os.scandir(source_directory) if entry.is_dir())
+    return await asyncio.gather(*(seed(index_name) for index_name in folders))
+
+
+def print_seed_summary(results: List[dict], seconds: float) -> None:
+    print(f"{'index':<32} {'files':>7} {'skipped':>7} {'MB':>9} {'MB/s':>8} {'upload s':>9} {'setup s':>8} {'total s':>8}")
+    for result in results:
+        if "error" in result:
+            print(f"{result['index_name']:<32} failed: {result['error']}")
+            continue
+        print(f"{result['index_name']:<32} {result['uploaded']:>7} {result['skipped']:>7} {result['bytes'] / (1024 * 1024):>9.2f} "
+              f"{result['mb_per_s']:>8.2f} {result['upload_seconds']:>9.2f} {result['provision_seconds']:>8.2f} {result['seconds']:>8.2f}")
+    total_bytes = sum(result.get("bytes", 0) for result in results)
+    print(f"{len(results)} indexes, {total_bytes / (1024 * 1024):.2f} MB in {seconds:.2f}s ({_throughput(total_bytes, seconds)} MB/s overall)")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Set up the Azure AI Search indexes of the folders in data/ai-search-index and upload their documents.")
+    parser.add_argument("--bulk", action="store_true", help="provision the indexes concurrently and upload their files in parallel")
+    parser.add_argument("--index-concurrency", type=int, default=4, help="indexes seeded at the same time (--bulk)")
+    parser.add_argument("--max-concurrency", type=int, default=UPLOAD_MAX_CONCURRENCY, help="files uploaded at the same time per index (--bulk)")
+    parser.add_argument("--block-size", type=int, default=UPLOAD_BLOCK_SIZE, help="upload block size in bytes (--bulk)")
+    parser.add_argument("--compression", help="vector compression of new indexes, kind[:truncation_dimension] e.g. binary:1024 "
+                                              "(--bulk, default SEARCH_VECTOR_COMPRESSION)")
+    args = parser.parse_args()
+
     # logging.basicConfig(level=logging.WARNING, format="%(message)s", datefmt="[%X]", handlers=[RichHandler(rich_tracebacks=True)])
     logging.basicConfig(level=logging.WARNING, format="%(message)s", datefmt="[%X]")
     logger = logging.getLogger("dream-team")
@@ -352,6 +693,14 @@ if __name__ == "__main__":
     blob_service_client = BlobServiceClient(AZURE_STORAGE_ENDPOINT, azure_credential)
 
     source_directory = f"{os.path.dirname(__file__)}/./data/ai-search-index"
+
+    if args.bulk:
+        started = time.perf_counter()
+        vector_compression = VectorCompression.parse(args.compression) if args.compression else None
+        results = asyncio.run(seed_indexes(source_directory, args.index_concurrency, args.max_concurrency, args.block_size, vector_compression))
+        print_seed_summary(results, time.perf_counter() - started)
+        exit(1 if any("error" in result for result in results) else 0)
+
     entries = os.listdir(source_directory)
     folders = [entry for entry in entries if os.path.isdir(os.path.join(source_directory, entry))]
 
@@ -0,0 +1,285 @@
+# File: benchmarks/fakes.py
+'''
+Offline stand-ins for the Azure dependencies of the backend, used by the
+benchmark scripts in this folder. Nothing in here talks to the network.
+
+- FakeChatCompletionClient: scripted replacement for AzureOpenAIChatCompletionClient
+- NoOpCodeExecutor: replacement for the ACA / Docker code executors
+- FakeContainer / InMemoryCosmosDB: in-memory replacement for the Cosmos containers
+'''
+import asyncio
+import json
+import random
+import re
+import uuid
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+
+from autogen_core import CancellationToken, FunctionCall
+from autogen_core.code_executor import CodeBlock, CodeExecutor, CodeResult
+from autogen_core.models import (
+    ChatCompletionClient,
+    CreateResult,
+    FunctionExecutionResult,
+    FunctionExecutionResultMessage,
+    LLMMessage,
+    ModelInfo,
+    RequestUsage,
+)
+
+from database import CosmosDB
+
+FAKE_MODEL_INFO = {
+    "vision": True,
+    "function_calling": True,
+    "json_output": True,
+    "family": "gpt-4o"
+}
+
+FAKE_AGENT_REPLY = """Here is the code to run:
+
+```python
+print("hello from the fake model")
+```
+"""
+
+
+def _message_text(message: LLMMessage) -> str:
+    content = getattr(message, "content", "")
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        # text parts and tool results, images are not counted
+        return " ".join(part if isinstance(part, str) else part.content for part in content
+                        if isinstance(part, (str, FunctionExecutionResult)))
+    return str(content)
+
+
+class FakeChatCompletionClient(ChatCompletionClient):
+    """A scripted ChatCompletionClient that mimics a MagenticOne conversation.
+
+    Progress ledger calls (json_output=True) pick the next speaker round-robin and
+    report the request as satisfied after `turns` ledger steps. With `parallel`, the
+    ledger also lists every team member under "parallel_steps" when the prompt asks for it. Every other call
+    returns a fixed reply padded to `reply_chars`. With `tool_calls`, a call offered tools first
+    calls the first tool with the last message as its "query" argument. Each call sleeps for
+    `latency` seconds (+/- `jitter`) to simulate the model round-trip.
+
+    The constructor accepts and ignores the AzureOpenAIChatCompletionClient keyword
+    arguments, so it can be swapped in for the real client class.
+    """
+
+    def __init__(
+        self,
+        turns: int = 3,
+        latency: float = 0.05,
+        jitter: float = 0.0,
+        reply_chars: int = 0,
+        parallel: bool = False,
+        tool_calls: bool = False,
+        model_info: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> None:
+        self.turns = turns
+        self.latency = latency
+        self.jitter = jitter
+        self.reply_chars = reply_chars
+        self.parallel = parallel
+        self.tool_calls = tool_calls
+        self._model_info = model_info or FAKE_MODEL_INFO
+        self._ledger_calls = 0
+        self._speaker_index = 0
+        self._last_usage = RequestUsage(prompt_tokens=0, completion_tokens=0)
+        self._total_usage = RequestUsage(prompt_tokens=0, completion_tokens=0)
+        self.calls = 0
+
+    async def _sleep(self) -> None:
+        delay = self.latency
+        if self.jitter:
+            delay = max(0.0, delay + random.uniform(-self.jitter, self.jitter))
+        if delay:
+            await asyncio.sleep(delay)
+
+    def _ledger(self, prompt: str) -> str:
+        self._ledger_calls += 1
+        names_match = re.search(r"select from: ([^)]*)\)", prompt)
+        names = [n.strip() for n in names_match.group(1).split(",")] if names_match else [""]
+        speaker = names[self._speaker_index % len(names)]
+        self._speaker_index += 1
+        satisfied = self._ledger_calls > self.turns
+        ledger = {
+            "is_request_satisfied": {"reason": "scripted", "answer": satisfied},
+            "is_in_loop": {"reason": "scripted", "answer": False},
+            "is_progress_being_made": {"reason": "scripted", "answer": True},
+            "next_speaker": {"reason": "scripted", "answer": speaker},
+            "instruction_or_question": {"reason": "scripted", "answer": f"Please continue with step {self._ledger_calls}."},
+        }
+        if self.parallel and '"parallel_steps"' in prompt:
+            ledger["parallel_steps"] = {
+                "reason": "scripted",
+                "answer": [{"speaker": name, "instruction": f"Please continue with step {self._ledger_calls}."} for name in names],
+            }
+        return json.dumps(ledger)
+
+    def _reply(self) -> str:
+        reply = FAKE_AGENT_REPLY
+        if self.reply_chars > len(reply):
+            reply = reply + "x" * (self.reply_chars - len(reply))
+        return reply
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Any] = [],
+        json_output: Optional[Any] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        await self._sleep()
+        self.calls += 1
+        prompt = _message_text(messages[-1]) if messages else ""
+        if json_output or '"is_request_satisfied"' in prompt:
+            content = self._ledger(prompt)
+        elif self.tool_calls and tools and not isinstance(messages[-1], FunctionExecutionResultMessage):
+            tool_name = getattr(tools[0], "name", None) or tools[0]["name"]
+            content = [FunctionCall(id=str(uuid.uuid4()), name=tool_name, arguments=json.dumps({"query": prompt[-200:]}))]
+        else:
+            content = self._reply()
+        prompt_tokens = self.count_tokens(messages)
+        completion_tokens = len(content) // 4 if isinstance(content, str) else len(content[0].arguments) // 4
+        self._last_usage = RequestUsage(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        self._total_usage = RequestUsage(
+            prompt_tokens=self._total_usage.prompt_tokens + prompt_tokens,
+            completion_tokens=self._total_usage.completion_tokens + completion_tokens,
+        )
+        finish_reason = "stop" if isinstance(content, str) else "function_calls"
+        return CreateResult(finish_reason=finish_reason, content=content, usage=self._last_usage, cached=False)
+
+    async def create_stream(self, messages: Sequence[LLMMessage], **kwargs: Any):
+        result = await self.create(messages, **kwargs)
+        if isinstance(result.content, str):
+            yield result.content
+        yield result
+
+    async def close(self) -> None:
+        pass
+
+    def actual_usage(self) -> RequestUsage:
+        return self._last_usage
+
+    def total_usage(self) -> RequestUsage:
+        return self._total_usage
+
+    def count_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Any] = []) -> int:
+        return sum(len(_message_text(m)) for m in messages) // 4
+
+    def remaining_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Any] = []) -> int:
+        return max(0, 128000 - self.count_tokens(messages))
+
+    @property
+    def capabilities(self) -> Any:
+        return self._model_info
+
+    @property
+    def model_info(self) -> ModelInfo:
+        return self._model_info
+
+
+class NoOpCodeExecutor(CodeExecutor):
+    """A code executor that pretends every code block ran successfully.
+
+    Accepts and ignores the ACA / Docker executor keyword arguments."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        self._session_id = str(uuid.uuid4())
+        self.executed_blocks = 0
+
+    async def execute_code_blocks(
+        self, code_blocks: List[CodeBlock], cancellation_token: CancellationToken
+    ) -> CodeResult:
+        self.executed_blocks += len(code_blocks)
+        return CodeResult(exit_code=0, output="hello from the fake executor\n")
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    async def restart(self) -> None:
+        pass
+
+
+_WHERE_RE = re.compile(r"c\.(\w+)\s*=\s*(@\w+)")
+_ORDER_RE = re.compile(r"ORDER BY c\.(\w+)(?:\s+(ASC|DESC))?", re.IGNORECASE)
+_PAGE_RE = re.compile(r"OFFSET\s+(@\w+)\s+LIMIT\s+(@\w+)", re.IGNORECASE)
+_SELECT_RE = re.compile(r"SELECT\s+(.*?)\s+FROM c", re.IGNORECASE)
+
+
+class FakeContainer:
+    """In-memory replacement for a Cosmos ContainerProxy.
+
+    Understands the small SQL subset used by database.CosmosDB: equality filters joined
+    by AND, VALUE COUNT(1), column projections, ORDER BY and OFFSET/LIMIT."""
+
+    def __init__(self, partition_key: str = "user_id") -> None:
+        self.partition_key = partition_key
+        self.items: Dict[str, dict] = {}
+
+    def create_item(self, body: dict, **kwargs: Any) -> dict:
+        if body["id"] in self.items:
+            raise ValueError(f"Item {body['id']} already exists")
+        # Round-trip through JSON like the real service does
+        item = json.loads(json.dumps(body))
+        self.items[item["id"]] = item
+        return item
+
+    def upsert_item(self, body: dict, **kwargs: Any) -> dict:
+        item = json.loads(json.dumps(body))
+        self.items[item["id"]] = item
+        return item
+
+    def replace_item(self, item: str, body: dict, **kwargs: Any) -> dict:
+        if item not in self.items:
+            raise KeyError(item)
+        return self.upsert_item(body)
+
+    def delete_item(self, item: str, partition_key: Any = None, **kwargs: Any) -> None:
+        self.items.pop(item, None)
+
+    def query_items(self, query: str, parameters: Optional[List[dict]] = None, **kwargs: Any):
+        values = {p["name"]: p["value"] for p in (parameters or [])}
+        rows = list(self.items.values())
+        for field, param in _WHERE_RE.findall(query.split("ORDER BY")[0]):
+            rows = [r for r in rows if r.get(field) == values[param]]
+        select = _SELECT_RE.search(query).group(1).strip()
+        if select.upper() == "VALUE COUNT(1)":
+            return iter([len(rows)])
+        order = _ORDER_RE.search(query)
+        if order:
+            rows.sort(key=lambda r: r.get(order.group(1)) or "", reverse=(order.group(2) or "").upper() == "DESC")
+        page = _PAGE_RE.search(query)
+        if page:
+            skip, limit = values[page.group(1)], values[page.group(2)]
+            rows = rows[skip:skip + limit]
+        if select != "*":
+            columns = [c.strip().split(".", 1)[1] for c in select.split(",")]
+            rows = [{c: r.get(c) for c in columns} for r in rows]
+        return iter(rows)
+
+
+class InMemoryCosmosDB(CosmosDB):
+    """CosmosDB with the containers swapped for FakeContainer instances."""
+
+    def __init__(self):
+        self.client = None
+        self.database = None
+        self.containers = {
+            "ag_demo": FakeContainer(partition_key="user_id"),
+            "agent_teams": FakeContainer(partition_key="team_id"),
+        }
+
+    def get_container(self, container_name: str = "ag_demo"):
+        if container_name not in self.containers:
+            self.containers[container_name] = FakeContainer()
+        return self.containers[container_name]
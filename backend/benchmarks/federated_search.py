@@ -0,0 +1,125 @@
+# File: benchmarks/federated_search.py
+'''
+Federated RAG search (MagenticOneFederatedRAGAgent) over local hashing indexes, with the same
+documents indexed twice.
+
+Builds "manuals" and "manuals-copy" from the same synthetic documents plus an unrelated "notes"
+index. Like indexer-built Azure AI Search indexes, the copy gets its own parent_id / chunk_id
+keys, so only the content tells the duplicates apart. Reports per fusion mode the mean / p95
+latency of a federated search and the duplicate chunks left in the fused results, which must
+be 0 (the script exits with an error otherwise). The retrieval cache is disabled, so every
+request searches.
+
+Run from the backend folder:
+    python -m benchmarks.federated_search --requests 20 --top_k 5
+'''
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ["RAG_CACHE_TTL"] = "0"
+
+import local_index
+from benchmarks.fakes import FakeChatCompletionClient
+from benchmarks.load_test import percentile
+from benchmarks.rag_direct_return import WORDS, write_documents
+from magentic_one_custom_rag_agent import FUSIONS, MagenticOneFederatedRAGAgent, RAGSearchSettings, fuse_results
+
+INDEX_NAMES = ("manuals", "manuals-copy", "notes")
+
+
+def rekey_index(root: str, index_name: str) -> None:
+    """Give the chunks of an index their own keys, like an indexer run into a separate index."""
+    path = os.path.join(root, index_name, "chunks.json")
+    with open(path) as f:
+        chunks = json.load(f)
+    for chunk in chunks:
+        chunk["parent_id"] = f"{index_name}-{chunk['parent_id']}"
+        chunk["chunk_id"] = f"{index_name}-{chunk['chunk_id']}"
+    with open(path, "w") as f:
+        json.dump(chunks, f)
+
+
+def duplicates(results: list) -> int:
+    """Fused results that repeat the title and text of an earlier one."""
+    seen = set()
+    for result in results:
+        seen.add((result.get("title"), result["chunk"]))
+    return len(results) - len(seen)
+
+
+async def run_fusion(fusion: str, queries, top_k: int) -> dict:
+    settings = RAGSearchSettings(search_backend="local", top_k=top_k, fusion=fusion)
+    agent = MagenticOneFederatedRAGAgent("KnowledgeBase", FakeChatCompletionClient(), index_names=INDEX_NAMES,
+                                         AZURE_SEARCH_SERVICE_ENDPOINT="", search_settings=settings)
+    latencies, duplicated, both = [], 0, 0
+    for query in queries:
+        started = time.perf_counter()
+        # the searches and fusion of MagenticOneFederatedRAGAgent._search, without the formatting
+        rankings = await asyncio.gather(*(agent._retrieve(index_name, query) for index_name in agent.index_names))
+        results = fuse_results(dict(zip(agent.index_names, rankings)), top_k, fusion)
+        latencies.append(time.perf_counter() - started)
+        duplicated += duplicates(results)
+        both += sum("manuals,manuals-copy" in result["@index"] for result in results)
+    return {
+        "fusion": fusion,
+        "requests": len(queries),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "duplicate_results": duplicated,
+        "merged_results": both,
+    }
+
+
+async def run(requests: int, documents: int, top_k: int) -> dict:
+    root = tempfile.mkdtemp(prefix="dream-team-federated-index-")
+    sources = {name: tempfile.mkdtemp(prefix="dream-team-federated-docs-") for name in ("manuals", "notes")}
+    local_index._local_indexes = local_index.LocalIndexRegistry(root)
+    try:
+        write_documents(sources["manuals"], documents, words=800)
+        with open(os.path.join(sources["notes"], "notes.txt"), "w") as f:
+            f.write(" ".join(random.Random(2).choice(WORDS) for _ in range(800)))
+        for index_name in INDEX_NAMES:
+            await local_index.build_local_index(index_name, sources["notes" if index_name == "notes" else "manuals"], root=root)
+        rekey_index(root, "manuals-copy")
+        rng = random.Random(1)
+        queries = [" ".join(rng.choice(WORDS) for _ in range(6)) for _ in range(requests)]
+        results = [await run_fusion(fusion, queries, top_k) for fusion in FUSIONS]
+    finally:
+        await local_index.get_local_indexes().close()
+        shutil.rmtree(root, ignore_errors=True)
+        for source in sources.values():
+            shutil.rmtree(source, ignore_errors=True)
+    return {
+        "meta": {"requests": requests, "documents": documents, "top_k": top_k, "indexes": list(INDEX_NAMES),
+                 "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Federated RAG search over local indexes that share documents.")
+    parser.add_argument("--requests", type=int, default=20, help="Searches per fusion mode")
+    parser.add_argument("--documents", type=int, default=20, help="Synthetic documents, indexed twice")
+    parser.add_argument("--top_k", type=int, default=5, help="Chunks returned per search")
+    parser.add_argument("--output", "-o", type=str, default=None, help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args.requests, args.documents, args.top_k))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {len(report['results'])} results to {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+    if any(result["duplicate_results"] for result in report["results"]):
+        sys.exit("Fused results contain the same chunk more than once")
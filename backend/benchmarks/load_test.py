@@ -0,0 +1,315 @@
+# File: benchmarks/load_test.py
+'''
+Offline load test for the /start and /chat-stream endpoints.
+
+Drives main.app in-process (no network, no Azure) with a scripted fake model client,
+an in-memory CosmosDB and no-op code executors, and reports:
+- p50/p95/p99 time-to-first-event of /chat-stream
+- p50/p95 session duration and agent turns (team member messages) per session, so runs with
+  and without the orchestrator fan-out are compared at the same amount of agent work
+- events per second (aggregate and per session)
+- traced Python memory per concurrent session
+- event loop lag
+
+Run from the backend folder:
+    python -m benchmarks.load_test --sessions 50 --concurrency 10 --turns 3 --latency 0.05
+'''
+import argparse
+import asyncio
+import functools
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import FakeChatCompletionClient, InMemoryCosmosDB, NoOpCodeExecutor
+
+LOAD_TEST_AGENTS = [
+    {
+        "input_key": "0001",
+        "type": "MagenticOne",
+        "name": "Coder",
+        "system_message": "",
+        "description": "",
+        "icon": "👨‍💻"
+    },
+    {
+        "input_key": "0002",
+        "type": "MagenticOne",
+        "name": "Executor",
+        "system_message": "",
+        "description": "",
+        "icon": "💻"
+    },
+    {
+        "input_key": "0003",
+        "type": "Custom",
+        "name": "Analyst",
+        "system_message": "You are a helpful analyst.",
+        "description": "An analyst that summarizes findings.",
+        "icon": "🤖"
+    },
+]
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+LOAD_TEST_TEAM_ID = "team-loadtest"
+# event sources that are not agent turns
+NON_AGENT_SOURCES = ("user", "MagenticOneOrchestrator", "TaskResult")
+
+
+def install_fakes(turns: int, latency: float, jitter: float, reply_chars: int, orchestrator: dict = None):
+    """Patch the Azure dependencies of main.app with offline fakes. Returns the app.
+
+    `orchestrator` settings are stored on a fake team that every session is started with."""
+    os.environ.setdefault("POOL_MANAGEMENT_ENDPOINT", "http://localhost/fake-pool")
+
+    import crud
+    import image_store
+    import magentic_one_helper
+    import main
+
+    magentic_one_helper.AzureOpenAIChatCompletionClient = functools.partial(
+        FakeChatCompletionClient, turns=turns, latency=latency, jitter=jitter, reply_chars=reply_chars,
+        parallel=bool((orchestrator or {}).get("fan_out"))
+    )
+    magentic_one_helper.ACADynamicSessionsCodeExecutor = NoOpCodeExecutor
+    magentic_one_helper.DockerCommandLineCodeExecutor = NoOpCodeExecutor
+    crud.DATA_DIR = tempfile.mkdtemp(prefix="dream-team-load-")
+    image_store._image_store = image_store.LocalImageStore(tempfile.mkdtemp(prefix="dream-team-images-"))
+    main.app.state.db = InMemoryCosmosDB()
+    main.app.state.db.get_container("agent_teams").create_item({
+        "id": LOAD_TEST_TEAM_ID,
+        "team_id": LOAD_TEST_TEAM_ID,
+        "name": "Load test",
+        "agents": LOAD_TEST_AGENTS,
+        "orchestrator": orchestrator,
+    })
+    return main.app
+
+
+async def asgi_request(app, method: str, path: str, query: Dict[str, str] = None, body: dict = None, on_chunk=None):
+    """Call an ASGI app directly and return (status, body). `on_chunk` is called for every body chunk."""
+    payload = json.dumps(body).encode() if body is not None else b""
+    headers = [(b"host", b"loadtest")]
+    if body is not None:
+        headers.append((b"content-type", b"application/json"))
+        headers.append((b"content-length", str(len(payload)).encode()))
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": urlencode(query or {}).encode(),
+        "root_path": "",
+        "headers": headers,
+        "client": ("127.0.0.1", 0),
+        "server": ("loadtest", 80),
+        "state": {},
+    }
+    request_sent = False
+    response_done = asyncio.Event()
+    status = None
+    chunks = []
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        await response_done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunk = message.get("body", b"")
+            if chunk:
+                chunks.append(chunk)
+                if on_chunk:
+                    on_chunk(chunk)
+            if not message.get("more_body", False):
+                response_done.set()
+
+    await app(scope, receive, send)
+    response_done.set()
+    return status, b"".join(chunks)
+
+
+async def run_session(app, index: int, results: list, active: dict):
+    user_id = f"loadtest-user-{index}"
+    started = time.perf_counter()
+    status, body = await asgi_request(app, "POST", "/start", body={
+        "content": f"Load test task #{index}",
+        "agents": json.dumps(LOAD_TEST_AGENTS),
+        "user_id": user_id,
+        "team_id": LOAD_TEST_TEAM_ID,
+    })
+    start_latency = time.perf_counter() - started
+    if status != 200:
+        results.append({"error": f"/start returned {status}: {body[:200]!r}"})
+        return
+    session_id = json.loads(body)["response"]
+
+    first_event_at = None
+    events = 0
+
+    def on_chunk(chunk: bytes):
+        nonlocal first_event_at, events
+        count = chunk.count(b"data: ")
+        if count and first_event_at is None:
+            first_event_at = time.perf_counter()
+        events += count
+
+    stream_started = time.perf_counter()
+    active["now"] += 1
+    active["peak"] = max(active["peak"], active["now"])
+    try:
+        status, body = await asgi_request(
+            app, "GET", "/chat-stream",
+            query={"session_id": session_id, "user_id": user_id},
+            on_chunk=on_chunk,
+        )
+    except Exception as e:
+        results.append({"error": f"/chat-stream failed: {e!r}"})
+        return
+    finally:
+        active["now"] -= 1
+    stream_duration = time.perf_counter() - stream_started
+    agent_turns = 0
+    for frame in body.split(b"\n\n"):
+        if frame.startswith(b"data: "):
+            try:
+                source = json.loads(frame[len(b"data: "):]).get("source")
+            except ValueError:
+                continue
+            agent_turns += source not in NON_AGENT_SOURCES
+    results.append({
+        "start_latency": start_latency,
+        "ttfe": (first_event_at - stream_started) if first_event_at else None,
+        "events": events,
+        "duration": stream_duration,
+        "agent_turns": agent_turns,
+    })
+
+
+async def monitor_loop_lag(interval: float, samples: list, stop: asyncio.Event):
+    while not stop.is_set():
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - expected))
+
+
+async def run_load_test(app, sessions: int, concurrency: int, lag_interval: float) -> dict:
+    results: list = []
+    lag_samples: list = []
+    active = {"now": 0, "peak": 0}
+    semaphore = asyncio.Semaphore(concurrency)
+    stop = asyncio.Event()
+
+    async def bounded(i):
+        async with semaphore:
+            await run_session(app, i, results, active)
+
+    tracemalloc.start()
+    baseline_memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    monitor = asyncio.create_task(monitor_loop_lag(lag_interval, lag_samples, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(bounded(i) for i in range(sessions)))
+    wall = time.perf_counter() - started
+    stop.set()
+    await monitor
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    ok = [r for r in results if "error" not in r]
+    errors = [r["error"] for r in results if "error" in r]
+    ttfe = [r["ttfe"] for r in ok if r["ttfe"] is not None]
+    start_latency = [r["start_latency"] for r in ok]
+    total_events = sum(r["events"] for r in ok)
+    per_session_eps = [r["events"] / r["duration"] for r in ok if r["duration"] > 0]
+    durations = [r["duration"] for r in ok]
+
+    def ms(value):
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        "sessions": sessions,
+        "concurrency": concurrency,
+        "completed": len(ok),
+        "errors": len(errors),
+        "first_errors": errors[:3],
+        "wall_time_s": round(wall, 3),
+        "start_latency_ms": {"p50": ms(percentile(start_latency, 50)), "p95": ms(percentile(start_latency, 95)), "p99": ms(percentile(start_latency, 99))},
+        "ttfe_ms": {"p50": ms(percentile(ttfe, 50)), "p95": ms(percentile(ttfe, 95)), "p99": ms(percentile(ttfe, 99))},
+        "session_duration_s": {"p50": round(percentile(durations, 50), 3) if durations else None,
+                               "p95": round(percentile(durations, 95), 3) if durations else None},
+        "agent_turns_per_session": round(statistics.mean(r["agent_turns"] for r in ok), 1) if ok else None,
+        "events_total": total_events,
+        "events_per_second": round(total_events / wall, 2) if wall > 0 else None,
+        "events_per_second_per_session": round(statistics.mean(per_session_eps), 2) if per_session_eps else None,
+        "peak_concurrent_streams": active["peak"],
+        "memory_per_session_kb": round((peak_memory - baseline_memory) / max(1, active["peak"]) / 1024, 1),
+        "loop_lag_ms": {"p50": ms(percentile(lag_samples, 50)), "p99": ms(percentile(lag_samples, 99)), "max": ms(max(lag_samples) if lag_samples else None)},
+    }
+
+
+def print_report(report: dict):
+    print(f"Sessions: {report['completed']}/{report['sessions']} completed at concurrency {report['concurrency']} ({report['errors']} errors) in {report['wall_time_s']}s")
+    for error in report["first_errors"]:
+        print(f"  error: {error}")
+    print(f"/start latency ms     p50={report['start_latency_ms']['p50']} p95={report['start_latency_ms']['p95']} p99={report['start_latency_ms']['p99']}")
+    print(f"time-to-first-event ms p50={report['ttfe_ms']['p50']} p95={report['ttfe_ms']['p95']} p99={report['ttfe_ms']['p99']}")
+    print(f"session duration s    p50={report['session_duration_s']['p50']} p95={report['session_duration_s']['p95']} ({report['agent_turns_per_session']} agent turns per session)")
+    print(f"events: {report['events_total']} total, {report['events_per_second']}/s aggregate, {report['events_per_second_per_session']}/s per session")
+    print(f"memory per session: {report['memory_per_session_kb']} KB (peak {report['peak_concurrent_streams']} concurrent streams)")
+    print(f"event loop lag ms     p50={report['loop_lag_ms']['p50']} p99={report['loop_lag_ms']['p99']} max={report['loop_lag_ms']['max']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline load test of /start and /chat-stream against main.app.")
+    parser.add_argument("--sessions", type=int, default=20, help="Total number of sessions to run")
+    parser.add_argument("--concurrency", type=int, default=5, help="Maximum number of concurrent sessions")
+    parser.add_argument("--turns", type=int, default=3, help="Agent turns per session before the fake orchestrator finishes")
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated model latency per call in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random +/- jitter added to the simulated latency")
+    parser.add_argument("--reply_chars", type=int, default=0, help="Pad fake model replies to this many characters")
+    parser.add_argument("--lag_interval", type=float, default=0.01, help="Event loop lag sampling interval in seconds")
+    parser.add_argument("--orchestrator", type=str, default=None, help='Team orchestrator settings as JSON, e.g. \'{"fan_out": {"enabled": true}}\'')
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+
+    # python -m benchmarks.load_test --sessions 50 --concurrency 10
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.WARNING)
+
+    orchestrator = json.loads(args.orchestrator) if args.orchestrator else None
+    app = install_fakes(args.turns, args.latency, args.jitter, args.reply_chars, orchestrator)
+    report = asyncio.run(run_load_test(app, args.sessions, args.concurrency, args.lag_interval))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
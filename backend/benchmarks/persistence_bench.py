@@ -0,0 +1,251 @@
+# File: benchmarks/persistence_bench.py
+'''
+Micro-benchmarks for the persistence layer, run against local fakes:
+- crud.save_message: cost of appending one message to a conversation of N messages
+- crud.get_user_conversations: lookup of one user's conversations among S stored sessions
+- CosmosDB.store_conversation: formatting and storing a TaskResult of N messages
+- CosmosDB.fetch_user_conversatons: paginated listing among S stored sessions
+
+Conversations are generated without screenshots and with screenshots stored in the image store
+(referenced by URL, the current format). crud.save_message is also measured with screenshots
+inlined as base64 data URIs, the format before the image store, for the before/after comparison.
+The "screenshots" field of a result is "none", "store" or "base64". Results are printed (or
+written with --output) as JSON so they can be compared between builds.
+
+Run from the backend folder:
+    python -m benchmarks.persistence_bench --output persistence.json
+'''
+import argparse
+import base64
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from typing import Callable, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from autogen_agentchat.base import TaskResult
+from autogen_agentchat.messages import MultiModalMessage, TextMessage
+from autogen_core import Image
+from PIL import Image as PILImage
+
+from benchmarks.fakes import InMemoryCosmosDB
+from benchmarks.load_test import percentile
+import crud
+import image_store
+from schemas import AutoGenMessage
+
+SCREENSHOT_EVERY = 5
+# how screenshots are kept in the conversation, the "screenshots" field of a result
+SCREENSHOTS_NONE = "none"
+SCREENSHOTS_STORE = "store"
+SCREENSHOTS_BASE64 = "base64"
+
+
+def make_screenshot(width: int, height: int) -> Image:
+    """A noisy PNG, so it compresses about as badly as a real page screenshot."""
+    pil_image = PILImage.frombytes("RGB", (width, height), os.urandom(width * height * 3))
+    buffer = io.BytesIO()
+    pil_image.save(buffer, format="PNG")
+    return Image.from_base64(base64.b64encode(buffer.getvalue()).decode())
+
+
+def make_agent_messages(length: int, screenshot: Image = None) -> list:
+    messages = []
+    for i in range(length):
+        text = f"Message {i}: " + "lorem ipsum dolor sit amet " * 20
+        if screenshot is not None and i % SCREENSHOT_EVERY == SCREENSHOT_EVERY - 1:
+            messages.append(MultiModalMessage(source="WebSurfer", content=[text, screenshot]))
+        else:
+            messages.append(TextMessage(source="Coder", content=text))
+    return messages
+
+
+def make_crud_message(i: int, screenshot: Image = None, inline: bool = False) -> dict:
+    message = AutoGenMessage(
+        time="2025-01-01 00:00:00",
+        type="TextMessage",
+        source="Coder",
+        content=f"Message {i}: " + "lorem ipsum dolor sit amet " * 20,
+        session_id="bench-session",
+        session_user="bench-user",
+    )
+    if screenshot is not None and i % SCREENSHOT_EVERY == SCREENSHOT_EVERY - 1:
+        message.type = "MultiModalMessage"
+        message.content_image = screenshot.data_uri if inline else image_store.get_image_store().put_image(screenshot)
+    return message.to_json()
+
+
+def timed(fn: Callable, repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def summarize(name: str, samples: List[float], **params) -> dict:
+    return {
+        "bench": name,
+        **params,
+        "repeat": len(samples),
+        "mean_ms": round(statistics.mean(samples) * 1000, 3),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 95) * 1000, 3),
+        "min_ms": round(min(samples) * 1000, 3),
+    }
+
+
+def bench_save_message(length: int, screenshot: Image, repeat: int, inline: bool = False) -> dict:
+    user_id, session_id = "bench-user", "bench-session"
+    filepath = crud.get_conversation_filepath(user_id, session_id)
+    conversation = {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "session_id": session_id,
+        "messages": [make_crud_message(i, screenshot, inline) for i in range(length - 1)],
+        "agents": [],
+        "run_mode_locally": False,
+        "timestamp": "2025-01-01 00:00:00"
+    }
+    with open(filepath, "w") as f:
+        json.dump(conversation, f, indent=2)
+    message = make_crud_message(length - 1, screenshot, inline)
+
+    # Always measure the append of the N-th message; the file is reset between runs, untimed
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        crud.save_message(id=None, user_id=user_id, session_id=session_id, message=message,
+                          agents=None, run_mode_locally=None, timestamp="2025-01-01 00:00:00")
+        samples.append(time.perf_counter() - started)
+        file_bytes = os.path.getsize(filepath)
+        with open(filepath, "w") as f:
+            json.dump(conversation, f, indent=2)
+    os.remove(filepath)
+    screenshots = SCREENSHOTS_NONE if screenshot is None else SCREENSHOTS_BASE64 if inline else SCREENSHOTS_STORE
+    return summarize("crud.save_message", samples, messages=length, screenshots=screenshots, file_bytes=file_bytes)
+
+
+def populate_crud_sessions(sessions: int, users: int):
+    for i in range(sessions):
+        user_id = f"user{i % users}"
+        with open(crud.get_conversation_filepath(user_id, f"session-{i}"), "w") as f:
+            json.dump({
+                "id": str(i),
+                "user_id": user_id,
+                "session_id": f"session-{i}",
+                "messages": [make_crud_message(0)],
+                "agents": [],
+                "run_mode_locally": False,
+                "timestamp": "2025-01-01 00:00:00"
+            }, f)
+
+
+def bench_get_user_conversations(sessions: int, users: int, repeat: int) -> dict:
+    populate_crud_sessions(sessions, users)
+    found = len(crud.get_user_conversations("user0"))
+    samples = timed(lambda: crud.get_user_conversations("user0"), repeat)
+    shutil.rmtree(crud.DATA_DIR)
+    return summarize("crud.get_user_conversations", samples, sessions=sessions, users=users, returned=found)
+
+
+def bench_store_conversation(length: int, screenshot: Image, repeat: int) -> dict:
+    db = InMemoryCosmosDB()
+    result = TaskResult(messages=make_agent_messages(length, screenshot), stop_reason="bench")
+    details = AutoGenMessage(time="2025-01-01 00:00:00", session_id="bench-session", session_user="bench-user")
+    conversation = {"agents": []}
+    samples = timed(lambda: db.store_conversation(result, details, conversation), repeat)
+    document = next(iter(db.get_container("ag_demo").items.values()))
+    return summarize("CosmosDB.store_conversation", samples, messages=length,
+                     screenshots=SCREENSHOTS_NONE if screenshot is None else SCREENSHOTS_STORE,
+                     document_bytes=len(json.dumps(document)))
+
+
+def bench_fetch_user_conversations(sessions: int, users: int, repeat: int) -> dict:
+    db = InMemoryCosmosDB()
+    container = db.get_container("ag_demo")
+    for i in range(sessions):
+        container.items[str(i)] = {
+            "id": str(i),
+            "user_id": f"user{i % users}",
+            "session_id": f"session-{i}",
+            "messages": [],
+            "agents": [],
+            "run_mode_locally": False,
+            "timestamp": f"2025-01-01 00:00:{i % 60:02d}",
+        }
+    all_users = summarize("CosmosDB.fetch_user_conversatons", timed(lambda: db.fetch_user_conversatons(user_id=None), repeat),
+                          sessions=sessions, users=users, filter="all")
+    one_user = summarize("CosmosDB.fetch_user_conversatons", timed(lambda: db.fetch_user_conversatons(user_id="user0"), repeat),
+                         sessions=sessions, users=users, filter="user")
+    return [all_users, one_user]
+
+
+def run(lengths: List[int], session_counts: List[int], users: int, repeat: int, screenshot_size: str) -> dict:
+    width, height = (int(v) for v in screenshot_size.split("x"))
+    screenshot = make_screenshot(width, height)
+    crud.DATA_DIR = tempfile.mkdtemp(prefix="dream-team-bench-")
+    image_dir = tempfile.mkdtemp(prefix="dream-team-images-")
+    image_store._image_store = image_store.LocalImageStore(image_dir)
+    results = []
+    try:
+        for length in lengths:
+            for shot in (None, screenshot):
+                results.append(bench_save_message(length, shot, repeat))
+                results.append(bench_store_conversation(length, shot, repeat))
+            # format_message always stores screenshots now, only crud can still be fed inline ones
+            results.append(bench_save_message(length, screenshot, repeat, inline=True))
+        for sessions in session_counts:
+            results.append(bench_get_user_conversations(sessions, min(users, sessions), repeat))
+            results.extend(bench_fetch_user_conversations(sessions, min(users, sessions), repeat))
+    finally:
+        shutil.rmtree(crud.DATA_DIR, ignore_errors=True)
+        shutil.rmtree(image_dir, ignore_errors=True)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": repeat,
+            "screenshot_size": screenshot_size,
+            "screenshot_bytes": len(screenshot.data_uri),
+            "screenshot_every": SCREENSHOT_EVERY,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark crud and CosmosDB persistence paths against local fakes.")
+    parser.add_argument("--lengths", type=str, default="10,100,1000", help="Comma separated conversation lengths")
+    parser.add_argument("--sessions", type=str, default="10,1000,100000", help="Comma separated stored session counts")
+    parser.add_argument("--users", type=int, default=100, help="Number of distinct users the sessions are spread over")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetitions per measurement")
+    parser.add_argument("--screenshot_size", type=str, default="320x180", help="Screenshot size as WIDTHxHEIGHT")
+    parser.add_argument("--output", "-o", type=str, default=None, help="Write the JSON report to this file instead of stdout")
+
+    # python -m benchmarks.persistence_bench --lengths 10,100 --sessions 10,1000 -o persistence.json
+    args = parser.parse_args()
+
+    report = run(
+        lengths=[int(v) for v in args.lengths.split(",")],
+        session_counts=[int(v) for v in args.sessions.split(",")],
+        users=args.users,
+        repeat=args.repeat,
+        screenshot_size=args.screenshot_size,
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {len(report['results'])} results to {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
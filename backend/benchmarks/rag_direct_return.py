@@ -0,0 +1,111 @@
+# File: benchmarks/rag_direct_return.py
+'''
+Latency and token cost of the RAG agent with and without direct_return (no reflection call).
+
+Runs MagenticOneRAGAgent against a local hashing index (local_index.py) built from synthetic
+documents, with a scripted FakeChatCompletionClient that calls the search tool, and reports per
+mode: mean / p95 latency per request, model calls and prompt / completion tokens. The retrieval
+cache is disabled, so every request searches.
+
+Run from the backend folder:
+    python -m benchmarks.rag_direct_return --requests 20 --latency 0.5
+'''
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ["RAG_CACHE_TTL"] = "0"
+
+from autogen_agentchat.messages import TextMessage
+from autogen_core import CancellationToken
+
+import local_index
+from benchmarks.fakes import FakeChatCompletionClient
+from benchmarks.load_test import percentile
+from magentic_one_custom_rag_agent import MagenticOneRAGAgent, RAGSearchSettings
+
+WORDS = ("compressor vibration pressure temperature maintenance schedule bearing seal calibration sensor "
+         "alarm failure inspection lubrication valve turbine efficiency downtime repair warranty").split()
+INDEX_NAME = "bench-rag"
+
+
+def write_documents(folder: str, documents: int, words: int) -> None:
+    rng = random.Random(0)
+    for i in range(documents):
+        with open(os.path.join(folder, f"doc-{i}.txt"), "w") as f:
+            f.write(" ".join(rng.choice(WORDS) for _ in range(words)))
+
+
+async def run_mode(direct_return: bool, queries, top_k: int, latency: float) -> dict:
+    client = FakeChatCompletionClient(latency=latency, tool_calls=True)
+    settings = RAGSearchSettings(search_backend="local", top_k=top_k, direct_return=direct_return)
+    agent = MagenticOneRAGAgent("KnowledgeBase", client, index_name=INDEX_NAME, AZURE_SEARCH_SERVICE_ENDPOINT="", search_settings=settings)
+    latencies = []
+    for query in queries:
+        await agent.on_reset(CancellationToken())
+        started = time.perf_counter()
+        await agent.on_messages([TextMessage(content=query, source="user")], CancellationToken())
+        latencies.append(time.perf_counter() - started)
+    usage = client.total_usage()
+    return {
+        "mode": "direct_return" if direct_return else "reflect",
+        "requests": len(queries),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "model_calls": client.calls,
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+    }
+
+
+async def run(requests: int, documents: int, top_k: int, latency: float) -> dict:
+    source = tempfile.mkdtemp(prefix="dream-team-rag-docs-")
+    root = tempfile.mkdtemp(prefix="dream-team-rag-index-")
+    local_index._local_indexes = local_index.LocalIndexRegistry(root)
+    try:
+        write_documents(source, documents, words=800)
+        await local_index.build_local_index(INDEX_NAME, source, root=root)
+        rng = random.Random(1)
+        queries = [" ".join(rng.choice(WORDS) for _ in range(6)) for _ in range(requests)]
+        reflect = await run_mode(False, queries, top_k, latency)
+        direct = await run_mode(True, queries, top_k, latency)
+    finally:
+        shutil.rmtree(source, ignore_errors=True)
+        shutil.rmtree(root, ignore_errors=True)
+    return {
+        "meta": {"requests": requests, "documents": documents, "top_k": top_k, "model_latency_s": latency,
+                 "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "results": [reflect, direct],
+        "savings": {
+            "latency_ms_per_request": round(reflect["mean_ms"] - direct["mean_ms"], 1),
+            "model_calls": reflect["model_calls"] - direct["model_calls"],
+            "tokens": reflect["prompt_tokens"] + reflect["completion_tokens"] - direct["prompt_tokens"] - direct["completion_tokens"],
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the RAG agent with and without direct_return against a scripted model.")
+    parser.add_argument("--requests", type=int, default=20, help="Search requests per mode")
+    parser.add_argument("--documents", type=int, default=20, help="Synthetic documents in the local index")
+    parser.add_argument("--top_k", type=int, default=3, help="Chunks returned per search")
+    parser.add_argument("--latency", type=float, default=0.5, help="Simulated model round-trip in seconds")
+    parser.add_argument("--output", "-o", type=str, default=None, help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args.requests, args.documents, args.top_k, args.latency))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {len(report['results'])} results to {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,161 @@
+# File: benchmarks/vector_compression.py
+'''
+Recall / latency / size comparison of vector compression settings (aisearch.VectorCompression)
+for one Azure AI Search index.
+
+Copies up to --docs chunks (with their vectors, so the source index needs stored vectors) of
+--index into one scratch index per setting, then runs the same vector queries against each:
+- recall@k against exact nearest neighbours (exhaustive search of the uncompressed copy)
+- p50/p95 query latency
+- vector index and storage size from the index statistics
+
+Queries are the vectors of randomly picked chunks, or with --queries-file one text query per
+line, embedded by the index vectorizer. The scratch indexes are deleted afterwards unless --keep.
+
+Run from the backend folder (needs the same environment as aisearch.py):
+    python -m benchmarks.vector_compression --index ag-demo-retail --settings none,scalar,binary,binary:1024
+'''
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from azure.core.exceptions import ResourceNotFoundError
+from azure.identity import DefaultAzureCredential
+from azure.search.documents import SearchClient
+from azure.search.documents.indexes import SearchIndexClient
+from azure.search.documents.models import VectorizableTextQuery, VectorizedQuery
+
+import aisearch
+from benchmarks.load_test import percentile
+
+FIELDS = ["chunk_id", "parent_id", "title", "chunk", "text_vector"]
+UPLOAD_BATCH = 100
+
+
+def fetch_documents(client: SearchClient, count: int) -> List[dict]:
+    documents = []
+    for result in client.search(search_text="*", select=FIELDS, top=count):
+        document = {field: result.get(field) for field in FIELDS}
+        if not document["text_vector"]:
+            raise SystemExit("The source index does not return text_vector; copy an index created with stored vectors")
+        documents.append(document)
+    return documents
+
+
+def create_copy(index_client: SearchIndexClient, credential, name: str, compression: aisearch.VectorCompression, documents: List[dict], timeout: float) -> SearchClient:
+    try:
+        index_client.delete_index(name)
+    except ResourceNotFoundError:
+        pass
+    index_client.create_index(aisearch.search_index_definition(
+        name, os.environ["UAMI_RESOURCE_ID"], os.environ["AZURE_OPENAI_ENDPOINT"],
+        os.environ["AZURE_OPENAI_EMBEDDING_MODEL"], os.environ["AZURE_OPENAI_EMBEDDING_MODEL"], compression,
+    ))
+    client = SearchClient(os.environ["AZURE_SEARCH_SERVICE_ENDPOINT"], name, credential)
+    for i in range(0, len(documents), UPLOAD_BATCH):
+        client.upload_documents(documents=documents[i:i + UPLOAD_BATCH])
+    deadline = time.monotonic() + timeout
+    while client.get_document_count() < len(documents):
+        if time.monotonic() > deadline:
+            raise SystemExit(f"Index {name} did not reach {len(documents)} documents in {timeout}s")
+        time.sleep(2)
+    return client
+
+
+def make_queries(documents: List[dict], count: int, queries_file: Optional[str], k: int) -> List[dict]:
+    """Query keyword arguments (without exhaustive / oversampling)."""
+    if queries_file:
+        with open(queries_file) as f:
+            texts = [line.strip() for line in f if line.strip()][:count]
+        return [{"text": text, "k_nearest_neighbors": k, "fields": "text_vector"} for text in texts]
+    picked = random.Random(0).sample(documents, min(count, len(documents)))
+    return [{"vector": document["text_vector"], "k_nearest_neighbors": k, "fields": "text_vector"} for document in picked]
+
+
+def run_query(client: SearchClient, query: dict, k: int, exhaustive: bool = False, oversampling: Optional[float] = None) -> Tuple[List[str], float]:
+    query_type = VectorizableTextQuery if "text" in query else VectorizedQuery
+    vector_query = query_type(exhaustive=exhaustive, oversampling=oversampling, **query)
+    started = time.perf_counter()
+    ids = [result["chunk_id"] for result in client.search(search_text=None, vector_queries=[vector_query], select=["chunk_id"], top=k)]
+    return ids, time.perf_counter() - started
+
+
+def run(index: str, settings: List[str], docs: int, queries: int, k: int, queries_file: Optional[str], keep: bool, timeout: float) -> dict:
+    endpoint = os.environ["AZURE_SEARCH_SERVICE_ENDPOINT"]
+    credential = DefaultAzureCredential()
+    index_client = SearchIndexClient(endpoint, credential)
+    documents = fetch_documents(SearchClient(endpoint, index, credential), docs)
+    query_args = make_queries(documents, queries, queries_file, k)
+
+    compressions = [aisearch.VectorCompression.parse(setting) for setting in settings]
+    if not any(compression.kind == "none" for compression in compressions):
+        compressions.insert(0, aisearch.VectorCompression())
+    copies = {}
+    results = []
+    try:
+        for compression in compressions:
+            name = f"{index}-cmp-{compression.name}"
+            copies[compression.name] = create_copy(index_client, credential, name, compression, documents, timeout)
+
+        # exact neighbours: exhaustive search over the full precision vectors
+        baseline = copies["none"]
+        truth = [set(run_query(baseline, query, k, exhaustive=True)[0]) for query in query_args]
+
+        for compression in compressions:
+            client = copies[compression.name]
+            run_query(client, query_args[0], k)  # warm up
+            recalls, latencies = [], []
+            for query, expected in zip(query_args, truth):
+                ids, seconds = run_query(client, query, k, oversampling=compression.oversampling)
+                recalls.append(len(expected.intersection(ids)) / max(len(expected), 1))
+                latencies.append(seconds)
+            statistics = index_client.get_index_statistics(f"{index}-cmp-{compression.name}")
+            results.append({
+                "setting": compression.name,
+                "oversampling": compression.oversampling,
+                f"recall@{k}": round(sum(recalls) / len(recalls), 4),
+                "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+                "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+                "vector_index_bytes": statistics.get("vector_index_size"),
+                "storage_bytes": statistics.get("storage_size"),
+            })
+    finally:
+        if not keep:
+            for name in copies:
+                index_client.delete_index(f"{index}-cmp-{name}")
+    return {
+        "meta": {"index": index, "documents": len(documents), "queries": len(query_args), "k": k,
+                 "query_source": "text" if queries_file else "chunk vectors",
+                 "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare recall, latency and size of vector compression settings on copies of an index.")
+    parser.add_argument("--index", required=True, help="Source index (with stored vectors)")
+    parser.add_argument("--settings", type=str, default="none,scalar,binary,scalar:1024,binary:1024",
+                        help="Comma separated kind[:truncation_dimension] settings")
+    parser.add_argument("--docs", type=int, default=1000, help="Chunks copied from the source index")
+    parser.add_argument("--queries", type=int, default=50, help="Number of queries")
+    parser.add_argument("--queries-file", type=str, default=None, help="Text queries, one per line (default: chunk vectors)")
+    parser.add_argument("--k", type=int, default=10, help="Neighbours per query")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch indexes")
+    parser.add_argument("--timeout", type=float, default=600, help="Seconds to wait for a copy to be indexed")
+    parser.add_argument("--output", "-o", type=str, default=None, help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    aisearch.load_azd_env()
+    report = run(args.index, args.settings.split(","), args.docs, args.queries, args.k, args.queries_file, args.keep, args.timeout)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {len(report['results'])} results to {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
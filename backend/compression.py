@@ -0,0 +1,120 @@
+import os
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+'''
+gzip / deflate compression of HTTP responses, negotiated with Accept-Encoding.
+
+Unlike Starlette's GZipMiddleware this also compresses streaming responses such as the
+/chat-stream SSE events: every chunk is flushed (Z_SYNC_FLUSH), so events still reach the
+client as soon as they are sent. Already compressed content (images) and responses that set
+their own Content-Encoding are passed through.
+
+Settings (environment): COMPRESSION_MINIMUM_SIZE (bytes, default 500; non-streaming responses
+below it are sent as is), COMPRESSION_LEVEL (default 6).
+'''
+ENCODINGS = ("gzip", "deflate")
+UNCOMPRESSED_CONTENT_TYPES = ("image/", "video/", "audio/", "application/zip", "application/gzip")
+
+
+def select_encoding(accept_encoding: str) -> Optional[str]:
+    """The first supported encoding accepted by the client (q=0 means not acceptable)."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in ENCODINGS:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def _compressor(encoding: str, level: int):
+    # gzip container for "gzip", zlib container for "deflate" (RFC 9110)
+    wbits = 16 + zlib.MAX_WBITS if encoding == "gzip" else zlib.MAX_WBITS
+    return zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size: Optional[int] = None, level: Optional[int] = None) -> None:
+        self.app = app
+        self.minimum_size = minimum_size if minimum_size is not None else int(os.getenv("COMPRESSION_MINIMUM_SIZE", "500"))
+        self.level = level if level is not None else int(os.getenv("COMPRESSION_LEVEL", "6"))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = select_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await _CompressionResponder(self.app, encoding, self.minimum_size, self.level)(scope, receive, send)
+
+
+class _CompressionResponder:
+    def __init__(self, app: ASGIApp, encoding: str, minimum_size: int, level: int) -> None:
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.level = level
+        self.send: Optional[Send] = None
+        self.start_message: Optional[Message] = None
+        self.compressor = None
+        self.passthrough = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            # headers are sent with the first body chunk, once we know whether to compress
+            self.start_message = message
+            headers = Headers(raw=message["headers"])
+            self.passthrough = "content-encoding" in headers or headers.get("content-type", "").startswith(UNCOMPRESSED_CONTENT_TYPES)
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.start_message is not None:
+            start_message, self.start_message = self.start_message, None
+            if self.passthrough or (not more_body and len(body) < self.minimum_size):
+                self.passthrough = True
+                await self.send(start_message)
+                await self.send(message)
+                return
+            self.compressor = _compressor(self.encoding, self.level)
+            headers = MutableHeaders(raw=start_message["headers"])
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                body = self.compressor.compress(body) + self.compressor.flush()
+                headers["Content-Length"] = str(len(body))
+                await self.send(start_message)
+                await self.send({"type": "http.response.body", "body": body})
+                return
+            await self.send(start_message)
+
+        if self.passthrough:
+            await self.send(message)
+            return
+        # sync flush after every chunk, so streamed events are not held back in the compressor
+        chunk = self.compressor.compress(body)
+        chunk += self.compressor.flush(zlib.Z_FINISH if not more_body else zlib.Z_SYNC_FLUSH)
+        await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
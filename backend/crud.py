@@ -15,7 +15,7 @@ def get_conversation_filepath(user_id: str, session_id: str) -> str:
     return os.path.join(DATA_DIR, f"{user_id}_{session_id}.json")
 
 # Save a message to a conversation JSON file.
-def save_message(id: str, user_id: str, session_id: str, message: dict, agents: dict, run_mode_locally: bool, timestamp: str):
+def save_message(id: str, user_id: str, session_id: str, message: dict, agents: dict, run_mode_locally: bool, timestamp: str, orchestrator: dict = None):
     filepath = get_conversation_filepath(user_id, session_id)
     if os.path.exists(filepath):
         with open(filepath, "r") as f:
@@ -28,6 +28,7 @@ def save_message(id: str, user_id: str, session_id: str, message: dict, agents:
             "messages": [],
             "agents": agents,
             "run_mode_locally": run_mode_locally,
+            "orchestrator": orchestrator,
             "timestamp": timestamp
         }
     # Append message with timestamp
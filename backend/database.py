@@ -4,9 +4,12 @@ from azure.identity import DefaultAzureCredential
 from typing import Optional, List, Dict
 
 from autogen_agentchat.base import TaskResult
-from autogen_agentchat.messages import MultiModalMessage, TextMessage, ToolCallExecutionEvent, ToolCallRequestEvent
+from autogen_agentchat.messages import MultiModalMessage, TextMessage, ToolCallExecutionEvent, ToolCallRequestEvent, ToolCallSummaryMessage
 
 from schemas import AutoGenMessage
+from magentic_one_custom_group_chat import ContextCompactionEvent
+from image_store import get_image_store
+from image_processing import get_image_processor
 import uuid
 from dotenv import load_dotenv
 import time
@@ -62,11 +65,15 @@ class CosmosDB:
             _response.type = _log_entry_json.type
             _response.source = _log_entry_json.source
             _response.content = _log_entry_json.content[0]
-            _response.content_image = _log_entry_json.content[1].data_uri
+            _response.content_image = get_image_store().put_bytes(*get_image_processor().thumbnail(_log_entry_json.content[1]))
         elif isinstance(_log_entry_json, TextMessage):
             _response.type = _log_entry_json.type
             _response.source = _log_entry_json.source
             _response.content = _log_entry_json.content
+        elif isinstance(_log_entry_json, ToolCallSummaryMessage):
+            _response.type = _log_entry_json.type
+            _response.source = _log_entry_json.source
+            _response.content = _log_entry_json.content
         elif isinstance(_log_entry_json, ToolCallExecutionEvent):
             _response.type = _log_entry_json.type
             _response.source = _log_entry_json.source
@@ -75,6 +82,10 @@ class CosmosDB:
             _response.type = _log_entry_json.type
             _response.source = _log_entry_json.source
             _response.content = _log_entry_json.content[0].arguments
+        elif isinstance(_log_entry_json, ContextCompactionEvent):
+            _response.type = _log_entry_json.type
+            _response.source = _log_entry_json.source
+            _response.content = _log_entry_json.to_text()
         else:
             _response.type = "N/A"
             _response.source = "N/A"
@@ -196,6 +207,7 @@ class CosmosDB:
             "logo": team["logo"],
             "plan": team["plan"],
             "starting_tasks": team["starting_tasks"],
+            "orchestrator": team.get("orchestrator"),
         }
         response = container.create_item(body=team_document)
         return response
@@ -0,0 +1,271 @@
+import asyncio
+import collections
+import hashlib
+import importlib.metadata
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from markitdown import MarkItDown
+from markitdown._markitdown import DocumentConverterResult
+
+'''
+Shared cache of the markdown conversions FileSurfer's file browser makes (MarkItDown.convert_local),
+so every session does not convert the same data/ files again.
+
+A conversion is stored under the SHA-256 of the file content, its extension (markitdown picks
+the converter by extension) and the markitdown version, in memory (LRU) and as JSON in
+FILE_CONVERSION_CACHE_DIR, so it survives restarts. Files are only re-hashed when their size or
+mtime changes, and a changed file is converted again on its next open.
+
+At startup the documents of data/ (DOCUMENT_EXTENSIONS) are converted in a process pool in
+the background, so FileSurfer pages load without converting. The backend's own stores under
+data/ (screenshots, conversation logs, local indexes, caches) are never prewarmed or cached, the
+browser converts them uncached if it opens them. Documents that fail to convert get a failure
+marker under their key, so they are not converted again on every startup (FileSurfer still
+reports their error on open).
+
+Settings (environment):
+- FILE_CONVERSION_CACHE_DIR: the JSON conversions (default .cache/conversions)
+- FILE_CONVERSION_CACHE_SIZE: conversions kept in memory (default 128)
+- FILE_CONVERSION_PREWARM: convert the documents of data/ at startup (default true)
+- FILE_CONVERSION_WORKERS: processes of the prewarm (default: up to 4)
+'''
+MARKITDOWN_VERSION = importlib.metadata.version("markitdown")
+HASH_BLOCK_SIZE = 1024 * 1024
+# what FileSurfer is pointed at in data/: the demo documents and team definitions
+DOCUMENT_EXTENSIONS = (".pdf", ".docx", ".doc", ".pptx", ".xlsx", ".xls", ".csv", ".txt", ".md", ".html", ".htm", ".json")
+
+
+def conversion_cache_dir() -> str:
+    return os.getenv("FILE_CONVERSION_CACHE_DIR", os.path.join(os.path.dirname(__file__), ".cache", "conversions"))
+
+
+def file_sha256(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def store_dirs() -> List[str]:
+    """Folders of the backend's own stores, which may be under data/ but are not documents."""
+    import crud
+    import image_store
+    import local_index
+    return [os.path.realpath(folder) for folder in (
+        crud.DATA_DIR, os.getenv("IMAGE_STORE_DIR", image_store.DEFAULT_IMAGE_STORE_DIR),
+        local_index.local_index_dir(), conversion_cache_dir(),
+    )]
+
+
+def _under(path: str, folders: List[str]) -> bool:
+    return any(path == folder or path.startswith(folder + os.sep) for folder in folders)
+
+
+_markitdown: Optional[MarkItDown] = None
+
+
+def _convert(path: str) -> Tuple[Optional[str], str]:
+    """(title, markdown) of the file at path. Runs in the prewarm worker processes."""
+    global _markitdown
+    if _markitdown is None:
+        _markitdown = MarkItDown()
+    result = _markitdown.convert_local(path)
+    return result.title, result.text_content
+
+
+class ConversionCache:
+    def __init__(self, cache_dir: Optional[str] = None, max_entries: int = 128):
+        self.cache_dir = cache_dir or conversion_cache_dir()
+        self.max_entries = max_entries
+        # realpath -> (mtime_ns, size, key)
+        self._versions: Dict[str, Tuple[int, int, str]] = {}
+        self._results: "collections.OrderedDict[str, DocumentConverterResult]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.converted_seconds = 0.0
+        self.uncached = 0
+        self._store_dirs: Optional[List[str]] = None
+
+    @classmethod
+    def from_env(cls) -> "ConversionCache":
+        return cls(max_entries=int(os.getenv("FILE_CONVERSION_CACHE_SIZE", "128")))
+
+    def key(self, path: str) -> str:
+        """Cache key of the current version of the file at path."""
+        path = os.path.realpath(path)
+        stat = os.stat(path)
+        with self._lock:
+            version = self._versions.get(path)
+        if version is not None and version[:2] == (stat.st_mtime_ns, stat.st_size):
+            return version[2]
+        extension = os.path.splitext(path)[1].lower().lstrip(".") or "none"
+        key = f"{file_sha256(path)}.{extension}.{MARKITDOWN_VERSION}"
+        with self._lock:
+            self._versions[path] = (stat.st_mtime_ns, stat.st_size, key)
+        return key
+
+    def is_document(self, path: str) -> bool:
+        """Whether conversions of path are cached: a document, not a file of the backend's stores."""
+        if self._store_dirs is None:
+            self._store_dirs = store_dirs()
+        path = os.path.realpath(path)
+        return path.lower().endswith(DOCUMENT_EXTENSIONS) and not _under(path, self._store_dirs)
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[DocumentConverterResult]:
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                self._results.move_to_end(key)
+                return result
+        try:
+            with open(self._file(key)) as f:
+                stored = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if "failed" in stored:
+            return None
+        result = DocumentConverterResult(title=stored["title"], text_content=stored["text_content"])
+        self._remember(key, result)
+        return result
+
+    def put(self, key: str, title: Optional[str], text_content: str, path: str = "") -> DocumentConverterResult:
+        result = DocumentConverterResult(title=title, text_content=text_content)
+        self._remember(key, result)
+        self._write_json(key, {"path": path, "title": title, "text_content": text_content, "converted": time.time()})
+        return result
+
+    def put_failure(self, key: str, error: str, path: str = "") -> None:
+        """Mark the file version as not convertible, so warm skips it."""
+        self._write_json(key, {"path": path, "failed": error, "converted": time.time()})
+
+    def _write_json(self, key: str, stored: dict) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temporary = f"{self._file(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(stored, f)
+        # atomic, concurrent readers see the whole conversion or none
+        os.replace(temporary, self._file(key))
+
+    def _remember(self, key: str, result: DocumentConverterResult) -> None:
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+
+    def convert_local(self, path: str) -> DocumentConverterResult:
+        if not self.is_document(path):
+            self.uncached += 1
+            title, text_content = _convert(path)
+            return DocumentConverterResult(title=title, text_content=text_content)
+        key = self.key(path)
+        result = self.get(key)
+        if result is not None:
+            self.hits += 1
+            return result
+        self.misses += 1
+        started = time.perf_counter()
+        title, text_content = _convert(path)
+        self.converted_seconds += time.perf_counter() - started
+        return self.put(key, title, text_content, path)
+
+    def documents(self, folder: str) -> List[str]:
+        """The documents under folder, without walking into the store folders."""
+        if self._store_dirs is None:
+            self._store_dirs = store_dirs()
+        paths = []
+        for root, folders, names in os.walk(folder):
+            folders[:] = [name for name in folders if not name.startswith(".")
+                          and not _under(os.path.realpath(os.path.join(root, name)), self._store_dirs)]
+            paths.extend(path for path in (os.path.join(root, name) for name in names if not name.startswith("."))
+                         if self.is_document(path))
+        return paths
+
+    async def warm(self, folder: str, workers: Optional[int] = None) -> Dict[str, object]:
+        """Convert the documents under folder that are not cached yet, in a process pool."""
+        started = time.perf_counter()
+        paths = await asyncio.to_thread(self.documents, folder)
+        keys = await asyncio.to_thread(lambda: {path: self.key(path) for path in paths})
+        missing = [path for path in paths if not os.path.exists(self._file(keys[path]))]
+        failed: List[str] = []
+        if missing:
+            loop = asyncio.get_running_loop()
+            pool = ProcessPoolExecutor(max_workers=workers or min(4, os.cpu_count() or 1))
+            try:
+                results = await asyncio.gather(*(loop.run_in_executor(pool, _convert, path) for path in missing), return_exceptions=True)
+            finally:
+                # on cancellation (shutdown) drop the queued conversions instead of waiting for them
+                pool.shutdown(wait=False, cancel_futures=True)
+            for path, result in zip(missing, results):
+                if isinstance(result, BaseException):
+                    # unsupported formats and broken files are left to FileSurfer to report
+                    failed.append(path)
+                    await asyncio.to_thread(self.put_failure, keys[path], f"{type(result).__name__}: {str(result).splitlines()[0] if str(result) else ''}", path)
+                else:
+                    await asyncio.to_thread(self.put, keys[path], result[0], result[1], path)
+        return {"files": len(paths), "converted": len(missing) - len(failed), "failed": len(failed),
+                "seconds": round(time.perf_counter() - started, 3)}
+
+    def summary(self) -> Dict[str, object]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "converted_ms": round(self.converted_seconds * 1000, 1),
+            "uncached": self.uncached,
+            "in_memory": len(self._results),
+        }
+
+
+class CachedMarkItDown(MarkItDown):
+    """MarkItDown with local file conversions served from a ConversionCache, for FileSurfer's browser."""
+
+    def __init__(self, cache: ConversionCache):
+        super().__init__()
+        self.cache = cache
+
+    def convert_local(self, path, **kwargs) -> DocumentConverterResult:
+        if kwargs:
+            return super().convert_local(path, **kwargs)
+        return self.cache.convert_local(str(path))
+
+
+_conversion_cache: Optional[ConversionCache] = None
+_cached_markitdown: Optional[CachedMarkItDown] = None
+
+
+def get_conversion_cache() -> ConversionCache:
+    global _conversion_cache
+    if _conversion_cache is None:
+        _conversion_cache = ConversionCache.from_env()
+    return _conversion_cache
+
+
+def get_cached_markitdown() -> CachedMarkItDown:
+    global _cached_markitdown
+    if _cached_markitdown is None:
+        _cached_markitdown = CachedMarkItDown(get_conversion_cache())
+    return _cached_markitdown
+
+
+async def prewarm(folder: str) -> None:
+    if os.getenv("FILE_CONVERSION_PREWARM", "true").lower() != "true" or not os.path.isdir(folder):
+        return
+    workers = os.getenv("FILE_CONVERSION_WORKERS")
+    try:
+        result = await get_conversion_cache().warm(folder, int(workers) if workers else None)
+        logging.getLogger("document_cache").info(f"FileSurfer conversions of {folder}: {result}")
+    except Exception as e:
+        logging.getLogger("document_cache").warning(f"Prewarming FileSurfer conversions failed: {e}")
@@ -0,0 +1,199 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from retrieval_cache import normalize_query
+
+'''
+Query embeddings computed by the RAG agents themselves ("query_vectorization": "client", see
+magentic_one_custom_rag_agent), instead of the search service vectorizing every query.
+
+Queries are normalized (lower case, collapsed whitespace, no trailing punctuation), so repeated
+and trivially rephrased questions share one vector. Vectors are kept in an SQLite file keyed by
+model, dimensions and the SHA-256 of the normalized text, so they survive restarts. Misses that
+arrive together (concurrent sessions, federated searches) are embedded in one batched call.
+
+Settings (environment):
+- EMBEDDING_CACHE_PATH: the SQLite file (default data/embedding-cache.sqlite3)
+- EMBEDDING_CACHE_BATCH_WINDOW_MS: how long a miss waits for others to share its call (default 5)
+- EMBEDDING_CACHE_BATCH_SIZE: texts per embedding call (default 64)
+- AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_EMBEDDING_MODEL: the deployment, with the index dimensions
+'''
+
+
+def embedding_cache_path() -> str:
+    return os.getenv("EMBEDDING_CACHE_PATH", os.path.join(os.path.dirname(__file__), "data", "embedding-cache.sqlite3"))
+
+
+def embedding_text(query: str) -> str:
+    return normalize_query(query).rstrip("?!. ")
+
+
+class EmbeddingStore:
+    """Vectors by (model, text hash) in an SQLite file, safe to share between threads."""
+
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (model TEXT, text_hash TEXT, vector BLOB, PRIMARY KEY (model, text_hash))")
+        self._db.commit()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def get_many(self, model: str, texts: List[str]) -> Dict[str, np.ndarray]:
+        hashes = {self.text_hash(text): text for text in texts}
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({','.join('?' * len(hashes))})",
+                (model, *hashes),
+            ).fetchall()
+        return {hashes[text_hash]: np.frombuffer(vector, dtype=np.float32) for text_hash, vector in rows}
+
+    def put_many(self, model: str, vectors: Dict[str, np.ndarray]) -> None:
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)",
+                [(model, self.text_hash(text), np.asarray(vector, dtype=np.float32).tobytes()) for text, vector in vectors.items()],
+            )
+            self._db.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class QueryEmbedder:
+    """Cached, batched query embeddings with one of the local_index embedders."""
+
+    def __init__(self, embedder=None, store: Optional[EmbeddingStore] = None, batch_window: float = 0.005, batch_size: int = 64):
+        self._embedder = embedder
+        self._store = store
+        self.batch_window = batch_window
+        self.batch_size = batch_size
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._flush: Optional[asyncio.TimerHandle] = None
+        self.hits = 0
+        self.misses = 0
+        # lookups that joined a pending embedding of the same text (no call of their own)
+        self.coalesced = 0
+        self.embedding_calls = 0
+
+    @classmethod
+    def from_env(cls) -> "QueryEmbedder":
+        return cls(batch_window=float(os.getenv("EMBEDDING_CACHE_BATCH_WINDOW_MS", "5")) / 1000,
+                   batch_size=int(os.getenv("EMBEDDING_CACHE_BATCH_SIZE", "64")))
+
+    @property
+    def embedder(self):
+        if self._embedder is None:
+            from local_index import AzureOpenAIEmbedder
+            self._embedder = AzureOpenAIEmbedder()
+        return self._embedder
+
+    @property
+    def store(self) -> EmbeddingStore:
+        if self._store is None:
+            self._store = EmbeddingStore(embedding_cache_path())
+        return self._store
+
+    @property
+    def model(self) -> str:
+        return f"{getattr(self.embedder, 'deployment', self.embedder.name)}:{self.embedder.dimensions}"
+
+    async def embed(self, query: str) -> List[float]:
+        text = embedding_text(query)
+        future = self._pending.get(text)
+        if future is None:
+            cached = (await asyncio.to_thread(self.store.get_many, self.model, [text])).get(text)
+            if cached is not None:
+                self.hits += 1
+                return cached.tolist()
+            # a concurrent miss of the same text may have queued it in the meantime
+            future = self._pending.get(text)
+            if future is None:
+                self.misses += 1
+                future = self._pending[text] = asyncio.get_running_loop().create_future()
+                self._schedule_flush()
+            else:
+                self.coalesced += 1
+        else:
+            self.coalesced += 1
+        return (await asyncio.shield(future)).tolist()
+
+    def _schedule_flush(self) -> None:
+        loop = asyncio.get_running_loop()
+        if len(self._pending) >= self.batch_size:
+            if self._flush is not None:
+                self._flush.cancel()
+            self._flush = None
+            loop.create_task(self._embed_pending())
+        elif self._flush is None:
+            self._flush = loop.call_later(self.batch_window, lambda: loop.create_task(self._embed_pending()))
+
+    async def _embed_pending(self) -> None:
+        self._flush = None
+        batch: List[Tuple[str, asyncio.Future]] = list(self._pending.items())[:self.batch_size]
+        for text, _ in batch:
+            del self._pending[text]
+        if self._pending:
+            self._schedule_flush()
+        if not batch:
+            return
+        texts = [text for text, _ in batch]
+        try:
+            self.embedding_calls += 1
+            vectors = await self.embedder.embed(texts)
+            await asyncio.to_thread(self.store.put_many, self.model, dict(zip(texts, vectors)))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
+
+    def summary(self) -> Dict[str, object]:
+        lookups = self.hits + self.coalesced + self.misses
+        return {
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            # share of lookups served without an embedding of their own
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            "embedding_calls": self.embedding_calls,
+            "stored": self.store.count() if self._store is not None else None,
+        }
+
+    async def close(self) -> None:
+        embedder, self._embedder = self._embedder, None
+        if embedder is not None:
+            await embedder.close()
+        store, self._store = self._store, None
+        if store is not None:
+            store.close()
+
+
+_query_embedder: Optional[QueryEmbedder] = None
+
+
+def get_query_embedder() -> QueryEmbedder:
+    global _query_embedder
+    if _query_embedder is None:
+        _query_embedder = QueryEmbedder.from_env()
+    return _query_embedder
@@ -0,0 +1,213 @@
+import asyncio
+import collections
+import json
+import os
+import time
+from typing import AsyncGenerator, Awaitable, Callable, Optional
+
+from schemas import AutoGenMessage
+
+try:
+    import orjson
+except ImportError:  # optional, events are serialized with the json module instead
+    orjson = None
+
+'''
+Bounded per-subscriber event queue between an agent run and its HTTP stream.
+
+The run pushes formatted events, the response pulls them. When the subscriber is slow and
+the queue is full, SSE_SLOW_CONSUMER_POLICY decides what happens:
+- "block": the run waits until the subscriber catches up
+- "drop_images": new events lose their screenshot reference, their text is still queued
+- "coalesce_images" (default): only the newest queued screenshot is kept, older queued events
+  lose their screenshot reference, text is still queued
+Text is never dropped. Screenshots stay in the image store and in the saved conversation.
+Because the image policies keep queueing text past SSE_QUEUE_SIZE, they fall back to blocking
+once SSE_QUEUE_HARD_LIMIT events are queued, so a stalled subscriber cannot grow the queue
+without bound.
+
+Settings (environment): SSE_QUEUE_SIZE (default 100), SSE_QUEUE_HARD_LIMIT (default 10 times
+SSE_QUEUE_SIZE), SSE_SLOW_CONSUMER_POLICY and SSE_HEARTBEAT_INTERVAL (seconds between
+keep-alive comments on an idle stream, default 15).
+
+Events are serialized by EventSerializer, with orjson when it is installed. In compact mode
+(opt-in, /chat-stream?compact=true or "compact": true on /ws) the constant session_id and
+session_user fields are only sent with the first event and empty fields are left out.
+'''
+SLOW_CONSUMER_BLOCK = "block"
+SLOW_CONSUMER_DROP_IMAGES = "drop_images"
+SLOW_CONSUMER_COALESCE_IMAGES = "coalesce_images"
+SLOW_CONSUMER_POLICIES = (SLOW_CONSUMER_BLOCK, SLOW_CONSUMER_DROP_IMAGES, SLOW_CONSUMER_COALESCE_IMAGES)
+
+# SSE comment line, ignored by EventSource but keeps proxies from closing an idle connection
+SSE_HEARTBEAT = ": keep-alive\n\n"
+
+
+class EventQueue:
+    """Bounded queue of AutoGenMessage events for one subscriber."""
+
+    def __init__(self, maxsize: int = 100, policy: str = SLOW_CONSUMER_COALESCE_IMAGES, hard_limit: Optional[int] = None):
+        if policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Unknown slow consumer policy '{policy}', use one of: {', '.join(SLOW_CONSUMER_POLICIES)}")
+        self.maxsize = maxsize
+        # queued events past which the image policies block as well
+        self.hard_limit = max(hard_limit or 10 * maxsize, maxsize)
+        self.policy = policy
+        self._events = collections.deque()
+        self._changed = asyncio.Condition()
+        self._closed = False
+        self._error: Optional[BaseException] = None
+        self.dropped_images = 0
+        self.coalesced_images = 0
+        self.blocked_seconds = 0.0
+        self.hard_limit_blocks = 0
+
+    @classmethod
+    def from_env(cls) -> "EventQueue":
+        return cls(
+            maxsize=int(os.getenv("SSE_QUEUE_SIZE", "100")),
+            policy=os.getenv("SSE_SLOW_CONSUMER_POLICY", SLOW_CONSUMER_COALESCE_IMAGES),
+            hard_limit=int(os.getenv("SSE_QUEUE_HARD_LIMIT", "0")) or None,
+        )
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    async def put(self, event: AutoGenMessage) -> None:
+        async with self._changed:
+            if len(self._events) >= self.maxsize:
+                if self.policy == SLOW_CONSUMER_BLOCK:
+                    await self._wait_below(self.maxsize)
+                elif event.content_image and self.policy == SLOW_CONSUMER_DROP_IMAGES:
+                    event = event.model_copy(update={"content_image": None})
+                    self.dropped_images += 1
+                elif event.content_image and self.policy == SLOW_CONSUMER_COALESCE_IMAGES:
+                    for i, queued in enumerate(self._events):
+                        if queued.content_image:
+                            self._events[i] = queued.model_copy(update={"content_image": None})
+                            self.coalesced_images += 1
+                if len(self._events) >= self.hard_limit:
+                    # text alone outgrew the queue, hold the run back instead of buffering without bound
+                    self.hard_limit_blocks += 1
+                    await self._wait_below(self.hard_limit)
+            if self._closed:
+                return
+            self._events.append(event)
+            self._changed.notify_all()
+
+    async def _wait_below(self, size: int) -> None:
+        """Wait, holding the condition, until fewer than size events are queued or the queue is closed."""
+        started = time.perf_counter()
+        await self._changed.wait_for(lambda: len(self._events) < size or self._closed)
+        self.blocked_seconds += time.perf_counter() - started
+
+    async def close(self, error: Optional[BaseException] = None) -> None:
+        """No more events; queued events are still delivered, then `error` is raised to the subscriber."""
+        async with self._changed:
+            self._closed = True
+            self._error = error
+            self._changed.notify_all()
+
+    async def get(self) -> Optional[AutoGenMessage]:
+        """Next event, or None once the queue is closed and drained."""
+        async with self._changed:
+            await self._changed.wait_for(lambda: self._events or self._closed)
+            if self._events:
+                event = self._events.popleft()
+                self._changed.notify_all()
+                return event
+            if self._error is not None:
+                raise self._error
+            return None
+
+    async def events(self, heartbeat_interval: Optional[float] = None) -> AsyncGenerator[Optional[AutoGenMessage], None]:
+        """Yield events until the queue is closed; yield None after `heartbeat_interval` seconds without one."""
+        while True:
+            try:
+                event = await asyncio.wait_for(self.get(), timeout=heartbeat_interval)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            if event is None:
+                return
+            yield event
+
+    def summary(self) -> dict:
+        return {
+            "policy": self.policy,
+            "dropped_images": self.dropped_images,
+            "coalesced_images": self.coalesced_images,
+            "blocked_ms": round(self.blocked_seconds * 1000, 1),
+            "hard_limit_blocks": self.hard_limit_blocks,
+        }
+
+
+async def pump(stream, queue: EventQueue, format_event: Callable[[object], Awaitable[AutoGenMessage]]) -> None:
+    """Format every entry of the team stream and put it on the queue; closes the queue when done."""
+    try:
+        async for log_entry in stream:
+            await queue.put(await format_event(log_entry))
+    except asyncio.CancelledError:
+        await queue.close()
+        raise
+    except Exception as e:
+        await queue.close(e)
+    else:
+        await queue.close()
+
+
+def dumps(value) -> bytes:
+    """Compact UTF-8 JSON."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class EventSerializer:
+    """Serializes the events of one session straight from the AutoGenMessage fields.
+
+    The constant session fields are serialized once up front (the envelope) and spliced into
+    every event, or in compact mode only into the first one."""
+
+    def __init__(self, session_id: str, session_user: str, compact: bool = False):
+        self.compact = compact
+        self._envelope = dumps({"session_id": session_id, "session_user": session_user})[1:-1]
+        self._ws_prefix = b'{"type":"event","session_id":' + dumps(session_id) + b',"event":'
+        self._first = True
+
+    def encode(self, event: AutoGenMessage) -> bytes:
+        """The event as JSON, the same object as AutoGenMessage.to_json() (compact mode aside)."""
+        fields = {
+            "time": event.time,
+            "type": event.type,
+            "source": event.source,
+            "content": event.content,
+            "stop_reason": event.stop_reason,
+            "models_usage": event.models_usage,
+            "content_image": event.content_image,
+        }
+        if self.compact:
+            fields = {key: value for key, value in fields.items() if value is not None}
+        payload = dumps(fields)
+        if self._first or not self.compact:
+            payload = payload[:-1] + (b"," if fields else b"") + self._envelope + b"}"
+        self._first = False
+        return payload
+
+    def sse(self, event: AutoGenMessage) -> bytes:
+        return b"data: " + self.encode(event) + b"\n\n"
+
+    def websocket(self, event: AutoGenMessage) -> str:
+        """The /ws message {"type": "event", "session_id": ..., "event": {...}}."""
+        return (self._ws_prefix + self.encode(event) + b"}").decode()
+
+
+def heartbeat_interval_from_env() -> float:
+    return float(os.getenv("SSE_HEARTBEAT_INTERVAL", "15"))
+
+
+def encode_image_frame(reference: str, content_type: str, data: bytes) -> bytes:
+    """Binary WebSocket frame with an image: 4 byte big-endian header length, JSON header
+    {"type": "image", "ref": ..., "content_type": ...}, then the image bytes."""
+    header = json.dumps({"type": "image", "ref": reference, "content_type": content_type}).encode()
+    return len(header).to_bytes(4, "big") + header + data
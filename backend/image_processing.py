@@ -0,0 +1,270 @@
+import asyncio
+import base64
+import io
+import math
+import os
+import weakref
+from typing import Any, Dict, Mapping, Optional, Sequence, Tuple
+
+from autogen_core import CancellationToken, Image
+from autogen_core.models import ChatCompletionClient, CreateResult, LLMMessage, ModelInfo, RequestUsage, UserMessage
+from PIL import Image as PILImage
+
+'''
+Screenshot processing before images reach the model and the UI.
+
+WebSurfer screenshots are PNGs at the browser resolution. Every model call that carries one is
+rewritten to a downscaled, WebP/JPEG encoded "model" variant, and the UI gets a smaller
+"thumbnail" variant. Settings (environment):
+- SCREENSHOT_PROCESSING: "true" (default) or "false" to send and show the original PNGs
+- SCREENSHOT_FORMAT: "webp" (default) or "jpeg"
+- SCREENSHOT_MODEL_MAX_DIM / SCREENSHOT_MODEL_QUALITY: defaults 1024 / 80
+- SCREENSHOT_THUMBNAIL_MAX_DIM / SCREENSHOT_THUMBNAIL_QUALITY: defaults 480 / 70
+
+Variant sizes and (estimated) vision token savings are collected per session in
+ImageProcessingStats; originals are counted by their raw pixel size, which needs no encoding.
+Encoding runs in a worker thread in the async paths (create, create_stream, thumbnail_async).
+'''
+FORMATS = {"webp": ("WEBP", "image/webp"), "jpeg": ("JPEG", "image/jpeg"), "jpg": ("JPEG", "image/jpeg")}
+
+
+def estimate_vision_tokens(width: int, height: int) -> int:
+    """Estimated gpt-4o image tokens at high detail: 85 + 170 per 512px tile after the
+    service scales the image to fit 2048x2048 and its short side to 768."""
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+def _raw_size(image: Image) -> int:
+    """Uncompressed size of the pixels: width * height * channels."""
+    width, height = image.image.size
+    return width * height * len(image.image.getbands())
+
+
+class EncodedImage(Image):
+    """An Image that keeps its encoded (WebP / JPEG) bytes, so the data URI sent to the
+    model is not re-encoded as PNG."""
+
+    def __init__(self, data: bytes):
+        super().__init__(PILImage.open(io.BytesIO(data)))
+        self.data = data
+
+    def to_base64(self) -> str:
+        return base64.b64encode(self.data).decode("utf-8")
+
+
+class ImageProcessingStats:
+    """Per session byte and token savings of the processed screenshots."""
+
+    def __init__(self):
+        self.model_images = 0
+        self.model_raw_bytes = 0
+        self.model_bytes = 0
+        self.model_original_tokens = 0
+        self.model_tokens = 0
+        self.thumbnails = 0
+        self.thumbnail_raw_bytes = 0
+        self.thumbnail_bytes = 0
+
+    def record_model(self, original: Image, variant: Image, variant_bytes: int) -> None:
+        self.model_images += 1
+        self.model_raw_bytes += _raw_size(original)
+        self.model_bytes += variant_bytes
+        self.model_original_tokens += estimate_vision_tokens(*original.image.size)
+        self.model_tokens += estimate_vision_tokens(*variant.image.size)
+
+    def record_thumbnail(self, original: Image, thumbnail_bytes: int) -> None:
+        self.thumbnails += 1
+        self.thumbnail_raw_bytes += _raw_size(original)
+        self.thumbnail_bytes += thumbnail_bytes
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "model_images": self.model_images,
+            "model_bytes": self.model_bytes,
+            "model_raw_bytes": self.model_raw_bytes,
+            "model_tokens_estimated": self.model_tokens,
+            "model_tokens_saved_estimated": self.model_original_tokens - self.model_tokens,
+            "thumbnails": self.thumbnails,
+            "thumbnail_bytes": self.thumbnail_bytes,
+            "thumbnail_raw_bytes": self.thumbnail_raw_bytes,
+        }
+
+
+class ImageProcessor:
+    """Produces the model and thumbnail variants of an image. Variants are memoized per Image
+    object, as the same screenshot is sent again with every later turn of the conversation."""
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        image_format: str = "webp",
+        model_max_dim: int = 1024,
+        model_quality: int = 80,
+        thumbnail_max_dim: int = 480,
+        thumbnail_quality: int = 70,
+    ):
+        if image_format.lower() not in FORMATS:
+            raise ValueError(f"Unsupported screenshot format '{image_format}', use one of: {', '.join(FORMATS)}")
+        self.enabled = enabled
+        self.pil_format, self.content_type = FORMATS[image_format.lower()]
+        self.model_max_dim = model_max_dim
+        self.model_quality = model_quality
+        self.thumbnail_max_dim = thumbnail_max_dim
+        self.thumbnail_quality = thumbnail_quality
+        self._model_variants = weakref.WeakKeyDictionary()
+        self._thumbnails = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def from_env(cls) -> "ImageProcessor":
+        return cls(
+            enabled=os.getenv("SCREENSHOT_PROCESSING", "true").lower() != "false",
+            image_format=os.getenv("SCREENSHOT_FORMAT", "webp"),
+            model_max_dim=int(os.getenv("SCREENSHOT_MODEL_MAX_DIM", "1024")),
+            model_quality=int(os.getenv("SCREENSHOT_MODEL_QUALITY", "80")),
+            thumbnail_max_dim=int(os.getenv("SCREENSHOT_THUMBNAIL_MAX_DIM", "480")),
+            thumbnail_quality=int(os.getenv("SCREENSHOT_THUMBNAIL_QUALITY", "70")),
+        )
+
+    def _encode(self, image: Image, max_dim: int, quality: int) -> bytes:
+        pil_image = image.image
+        if max(pil_image.size) > max_dim:
+            pil_image = pil_image.copy()
+            pil_image.thumbnail((max_dim, max_dim), PILImage.LANCZOS)
+        buffer = io.BytesIO()
+        pil_image.save(buffer, format=self.pil_format, quality=quality)
+        return buffer.getvalue()
+
+    def model_variant(self, image: Image, stats: Optional[ImageProcessingStats] = None) -> Image:
+        """The downscaled image to send to the model."""
+        if not self.enabled or isinstance(image, EncodedImage):
+            return image
+        variant = self._model_variants.get(image)
+        if variant is None:
+            data = self._encode(image, self.model_max_dim, self.model_quality)
+            variant = EncodedImage(data)
+            self._model_variants[image] = variant
+            if stats is not None:
+                stats.record_model(image, variant, len(data))
+        return variant
+
+    def thumbnail(self, image: Image, stats: Optional[ImageProcessingStats] = None) -> Tuple[bytes, str]:
+        """(bytes, content_type) of the image to show in the UI."""
+        thumbnail = self._thumbnails.get(image)
+        if thumbnail is None:
+            if self.enabled:
+                thumbnail = (self._encode(image, self.thumbnail_max_dim, self.thumbnail_quality), self.content_type)
+            else:
+                buffer = io.BytesIO()
+                image.image.save(buffer, format="PNG")
+                thumbnail = (buffer.getvalue(), "image/png")
+            self._thumbnails[image] = thumbnail
+            if stats is not None:
+                stats.record_thumbnail(image, len(thumbnail[0]))
+        return thumbnail
+
+    async def thumbnail_async(self, image: Image, stats: Optional[ImageProcessingStats] = None) -> Tuple[bytes, str]:
+        thumbnail = self._thumbnails.get(image)
+        if thumbnail is not None:
+            return thumbnail
+        return await asyncio.to_thread(self.thumbnail, image, stats)
+
+    def _needs_encoding(self, messages: Sequence[LLMMessage]) -> bool:
+        return self.enabled and any(
+            isinstance(part, Image) and not isinstance(part, EncodedImage) and part not in self._model_variants
+            for message in messages if isinstance(message, UserMessage) and isinstance(message.content, list)
+            for part in message.content
+        )
+
+    async def process_messages_async(self, messages: Sequence[LLMMessage], stats: Optional[ImageProcessingStats] = None) -> Sequence[LLMMessage]:
+        """process_messages, with new images encoded in a worker thread."""
+        if self._needs_encoding(messages):
+            return await asyncio.to_thread(self.process_messages, messages, stats)
+        return self.process_messages(messages, stats)
+
+    def process_messages(self, messages: Sequence[LLMMessage], stats: Optional[ImageProcessingStats] = None) -> Sequence[LLMMessage]:
+        """Replace the images of user messages with their model variants."""
+        if not self.enabled:
+            return messages
+        processed = []
+        for message in messages:
+            if isinstance(message, UserMessage) and isinstance(message.content, list) and any(isinstance(part, Image) for part in message.content):
+                content = [self.model_variant(part, stats) if isinstance(part, Image) else part for part in message.content]
+                message = message.model_copy(update={"content": content})
+            processed.append(message)
+        return processed
+
+
+class ImageOptimizingChatCompletionClient(ChatCompletionClient):
+    """Sends the model variant of every image in the messages to `client`."""
+
+    def __init__(self, client: ChatCompletionClient, processor: ImageProcessor, stats: ImageProcessingStats):
+        self._client = client
+        self._processor = processor
+        self._stats = stats
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Any] = [],
+        json_output: Optional[Any] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        return await self._client.create(
+            await self._processor.process_messages_async(messages, self._stats), tools=tools, json_output=json_output,
+            extra_create_args=extra_create_args, cancellation_token=cancellation_token,
+        )
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Any] = [],
+        json_output: Optional[Any] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ):
+        async for chunk in self._client.create_stream(
+            await self._processor.process_messages_async(messages, self._stats), tools=tools, json_output=json_output,
+            extra_create_args=extra_create_args, cancellation_token=cancellation_token,
+        ):
+            yield chunk
+
+    async def close(self) -> None:
+        await self._client.close()
+
+    def actual_usage(self) -> RequestUsage:
+        return self._client.actual_usage()
+
+    def total_usage(self) -> RequestUsage:
+        return self._client.total_usage()
+
+    def count_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Any] = []) -> int:
+        return self._client.count_tokens(self._processor.process_messages(messages, self._stats), tools=tools)
+
+    def remaining_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Any] = []) -> int:
+        return self._client.remaining_tokens(self._processor.process_messages(messages, self._stats), tools=tools)
+
+    @property
+    def capabilities(self) -> Any:
+        return self._client.model_info
+
+    @property
+    def model_info(self) -> ModelInfo:
+        return self._client.model_info
+
+
+_image_processor: Optional[ImageProcessor] = None
+
+
+def get_image_processor() -> ImageProcessor:
+    """The process wide image processor, configured from the environment on first use."""
+    global _image_processor
+    if _image_processor is None:
+        _image_processor = ImageProcessor.from_env()
+    return _image_processor
@@ -0,0 +1,199 @@
+import abc
+import asyncio
+import base64
+import hashlib
+import io
+import logging
+import os
+import threading
+import weakref
+from typing import Optional, Tuple
+
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+from azure.identity import DefaultAzureCredential
+from azure.storage.blob import BlobServiceClient, ContentSettings
+
+'''
+Content-addressed store for images (e.g. WebSurfer screenshots) so that events, conversation
+files and Cosmos documents only carry a short reference URL instead of the base64 image.
+
+Images are keyed by the sha256 of their bytes, so duplicate screenshots are stored once.
+Backends:
+- local folder (default): IMAGE_STORE_DIR, defaults to ./data/images
+- Azure Blob Storage: set IMAGE_STORE_CONTAINER (uses AZURE_STORAGE_ACCOUNT_ENDPOINT)
+
+References are "{IMAGE_STORE_PUBLIC_URL}/images/<sha256>.<ext>", served by GET /images/{name}.
+Async code uses put_bytes_async / get_async, which keep the file and Blob round-trips off the
+event loop.
+'''
+IMAGE_ROUTE = "/images"
+DEFAULT_IMAGE_STORE_DIR = "./data/images"
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+CONTENT_TYPES = {
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+    "gif": "image/gif",
+}
+EXTENSIONS = {content_type: ext for ext, content_type in CONTENT_TYPES.items() if ext != "jpeg"}
+
+
+def parse_data_uri(data_uri: str) -> Tuple[str, bytes]:
+    """Split a base64 data URI into (content_type, bytes)."""
+    header, _, data = data_uri.partition(",")
+    content_type = header[len("data:"):].split(";")[0] or "image/png"
+    return content_type, base64.b64decode(data)
+
+
+def is_image_reference(value: Optional[str]) -> bool:
+    return bool(value) and not value.startswith("data:")
+
+
+class ImageStore(abc.ABC):
+    """Stores image bytes once per content hash and hands out reference URLs."""
+
+    def __init__(self, public_url: str = ""):
+        self.public_url = public_url.rstrip("/")
+        self._known = set()
+        # Image objects already stored (the TaskResult repeats the streamed messages)
+        self._image_refs = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.stored_images = 0
+        self.deduplicated_images = 0
+        self.stored_bytes = 0
+
+    def put_bytes(self, data: bytes, content_type: str = "image/png") -> str:
+        """Store the image if it is not stored yet and return its reference URL."""
+        name = f"{hashlib.sha256(data).hexdigest()}.{EXTENSIONS.get(content_type, 'bin')}"
+        with self._lock:
+            known = name in self._known
+        if known or not self._write(name, data, content_type):
+            self.deduplicated_images += 1
+        else:
+            self.stored_images += 1
+            self.stored_bytes += len(data)
+        with self._lock:
+            self._known.add(name)
+        return f"{self.public_url}{IMAGE_ROUTE}/{name}"
+
+    def put_data_uri(self, data_uri: str) -> str:
+        if is_image_reference(data_uri):
+            return data_uri
+        content_type, data = parse_data_uri(data_uri)
+        return self.put_bytes(data, content_type)
+
+    def put_image(self, image) -> str:
+        """Store an autogen_core.Image (encoded as PNG, like Image.data_uri)."""
+        ref = self._image_refs.get(image)
+        if ref is None:
+            buffer = io.BytesIO()
+            image.image.save(buffer, format="PNG")
+            ref = self.put_bytes(buffer.getvalue(), "image/png")
+            self._image_refs[image] = ref
+        return ref
+
+    async def put_bytes_async(self, data: bytes, content_type: str = "image/png") -> str:
+        return await asyncio.to_thread(self.put_bytes, data, content_type)
+
+    async def get_async(self, name: str) -> Optional[Tuple[bytes, str]]:
+        return await asyncio.to_thread(self.get, name)
+
+    @abc.abstractmethod
+    def get(self, name: str) -> Optional[Tuple[bytes, str]]:
+        """Return (bytes, content_type) of a stored image or None."""
+
+    @abc.abstractmethod
+    def _write(self, name: str, data: bytes, content_type: str) -> bool:
+        """Write the image, return False if it already existed."""
+
+
+def _content_type(name: str) -> str:
+    return CONTENT_TYPES.get(name.rsplit(".", 1)[-1].lower(), "application/octet-stream")
+
+
+def _valid_name(name: str) -> bool:
+    digest, _, ext = name.partition(".")
+    return len(digest) == 64 and all(c in "0123456789abcdef" for c in digest) and ext in CONTENT_TYPES
+
+
+class LocalImageStore(ImageStore):
+    def __init__(self, directory: str, public_url: str = ""):
+        super().__init__(public_url)
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, name: str) -> str:
+        # two-level fan-out keeps directories small
+        return os.path.join(self.directory, name[:2], name)
+
+    def _write(self, name: str, data: bytes, content_type: str) -> bool:
+        path = self._path(name)
+        if os.path.exists(path):
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return True
+
+    def get(self, name: str) -> Optional[Tuple[bytes, str]]:
+        if not _valid_name(name):
+            return None
+        path = self._path(name)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return f.read(), _content_type(name)
+
+
+class BlobImageStore(ImageStore):
+    def __init__(self, container_client, public_url: str = ""):
+        super().__init__(public_url)
+        self.container_client = container_client
+        try:
+            if not self.container_client.exists():
+                self.container_client.create_container()
+        except ResourceExistsError:
+            pass
+
+    def _write(self, name: str, data: bytes, content_type: str) -> bool:
+        try:
+            self.container_client.upload_blob(
+                name, data, overwrite=False,
+                content_settings=ContentSettings(content_type=content_type, cache_control=IMAGE_CACHE_CONTROL),
+            )
+            return True
+        except ResourceExistsError:
+            return False
+
+    def get(self, name: str) -> Optional[Tuple[bytes, str]]:
+        if not _valid_name(name):
+            return None
+        try:
+            data = self.container_client.download_blob(name).readall()
+        except ResourceNotFoundError:
+            return None
+        return data, _content_type(name)
+
+
+_image_store: Optional[ImageStore] = None
+
+
+def get_image_store() -> ImageStore:
+    """The process wide image store, configured from the environment on first use."""
+    global _image_store
+    if _image_store is None:
+        public_url = os.getenv("IMAGE_STORE_PUBLIC_URL", "")
+        container = os.getenv("IMAGE_STORE_CONTAINER")
+        if container:
+            blob_service_client = BlobServiceClient(
+                account_url=os.getenv("AZURE_STORAGE_ACCOUNT_ENDPOINT"), credential=DefaultAzureCredential()
+            )
+            _image_store = BlobImageStore(blob_service_client.get_container_client(container), public_url)
+            logging.getLogger("image_store").info(f"Storing images in blob container {container}")
+        else:
+            _image_store = LocalImageStore(os.getenv("IMAGE_STORE_DIR", DEFAULT_IMAGE_STORE_DIR), public_url)
+    return _image_store
@@ -0,0 +1,245 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from azure.identity.aio import DefaultAzureCredential as AsyncDefaultAzureCredential
+from azure.search.documents.indexes.aio import SearchIndexerClient as AsyncSearchIndexerClient
+
+import aisearch
+from retrieval_cache import get_retrieval_cache
+
+'''
+Background indexing jobs for /upload.
+
+/upload stores the files and returns a job id; the job provisions the index (aisearch.provision_index),
+runs the indexer if any blob was new or changed and is then tracked by one shared poller for all
+in-flight jobs (cached RAG results of the index are invalidated as new documents are indexed):
+- GET /upload/jobs/{job_id} returns the job status
+- GET /upload/jobs/{job_id}/events streams every status change as SSE, ending with "completed" or "failed"
+
+Polling backs off adaptively per job: it starts at INDEXING_POLL_MIN_INTERVAL seconds (default 2),
+grows by 1.5x up to INDEXING_POLL_MAX_INTERVAL (default 30) while nothing changes, and drops back
+to the minimum when the indexer makes progress. A job whose indexer run has not finished after
+INDEXING_JOB_TIMEOUT seconds (default 3600) fails with a timeout error, so a run that is never
+reported does not keep it polling forever. Finished jobs are kept for INDEXING_JOB_RETENTION
+seconds (default 3600).
+'''
+JOB_PROVISIONING = "provisioning"
+JOB_INDEXING = "indexing"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+FINISHED_STATES = (JOB_COMPLETED, JOB_FAILED)
+# indexer_status of jobs that did not need an indexer run
+INDEXER_SKIPPED = "skipped"
+
+POLL_BACKOFF = 1.5
+# indexer runs that started this long before the job asked for a run still count (clock skew)
+RUN_START_SKEW = timedelta(seconds=30)
+
+
+class IndexingJob:
+    def __init__(self, index_name: str, upload: Optional[dict] = None):
+        self.id = str(uuid.uuid4())
+        self.index_name = index_name
+        self.upload = upload
+        self.status = JOB_PROVISIONING
+        self.indexer_status: Optional[str] = None
+        self.items_processed = 0
+        self.items_failed = 0
+        self.errors: List[str] = []
+        self.created = time.time()
+        self.updated = self.created
+        self.run_requested_at: Optional[datetime] = None
+        self.indexing_started = 0.0
+        self.next_poll = 0.0
+        self.poll_interval = 0.0
+        self.polls = 0
+        self._subscribers: List[asyncio.Queue] = []
+
+    def to_json(self) -> dict:
+        return {
+            "job_id": self.id,
+            "index_name": self.index_name,
+            "status": self.status,
+            "indexer_status": self.indexer_status,
+            "items_processed": self.items_processed,
+            "items_failed": self.items_failed,
+            "errors": self.errors,
+            "upload": self.upload,
+            "polls": self.polls,
+            "elapsed_s": round(self.updated - self.created, 1),
+        }
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue()
+        queue.put_nowait(self.to_json())
+        self._subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        if queue in self._subscribers:
+            self._subscribers.remove(queue)
+
+    def update(self, **fields) -> None:
+        changed = any(getattr(self, key) != value for key, value in fields.items())
+        for key, value in fields.items():
+            setattr(self, key, value)
+        self.updated = time.time()
+        if changed:
+            snapshot = self.to_json()
+            for queue in self._subscribers:
+                queue.put_nowait(snapshot)
+
+
+class IndexingJobManager:
+    """Tracks the indexing jobs and polls the indexers of all in-flight jobs from one task."""
+
+    def __init__(self, search_endpoint: Optional[str] = None, min_interval: Optional[float] = None,
+                 max_interval: Optional[float] = None, retention: Optional[float] = None, timeout: Optional[float] = None):
+        self.search_endpoint = search_endpoint
+        self.min_interval = min_interval if min_interval is not None else float(os.getenv("INDEXING_POLL_MIN_INTERVAL", "2"))
+        self.max_interval = max_interval if max_interval is not None else float(os.getenv("INDEXING_POLL_MAX_INTERVAL", "30"))
+        self.retention = retention if retention is not None else float(os.getenv("INDEXING_JOB_RETENTION", "3600"))
+        self.timeout = timeout if timeout is not None else float(os.getenv("INDEXING_JOB_TIMEOUT", "3600"))
+        self.jobs: Dict[str, IndexingJob] = {}
+        self._poller: Optional[asyncio.Task] = None
+        self._tasks = set()
+        self._wakeup = asyncio.Event()
+
+    def get(self, job_id: str) -> Optional[IndexingJob]:
+        self._prune()
+        return self.jobs.get(job_id)
+
+    def start(self, index_name: str, upload: Optional[dict] = None) -> IndexingJob:
+        """Create a job and provision / run the index of `index_name` in the background."""
+        self._prune()
+        job = IndexingJob(index_name, upload)
+        self.jobs[job.id] = job
+        task = asyncio.create_task(self._provision(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.retention
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.finished and job.updated < cutoff]:
+            del self.jobs[job_id]
+
+    async def _provision(self, job: IndexingJob) -> None:
+        logger = logging.getLogger("indexing_jobs")
+        try:
+            # the search index SDK calls are synchronous, keep them off the event loop
+            run_indexer = job.upload is None or job.upload.get("uploaded", 1) > 0
+            running = await asyncio.to_thread(aisearch.provision_index, job.index_name, run_indexer)
+        except Exception as e:
+            logger.error(f"Provisioning index {job.index_name} failed: {str(e)}")
+            job.update(status=JOB_FAILED, errors=[str(e)])
+            return
+        if not running:
+            # nothing new or changed was uploaded, the index is up to date
+            job.update(status=JOB_COMPLETED, indexer_status=INDEXER_SKIPPED)
+            return
+        job.run_requested_at = datetime.now(timezone.utc)
+        job.poll_interval = self.min_interval
+        job.indexing_started = time.monotonic()
+        job.next_poll = job.indexing_started + self.min_interval
+        job.update(status=JOB_INDEXING)
+        self._ensure_poller()
+
+    def _ensure_poller(self) -> None:
+        self._wakeup.set()
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.create_task(self._poll_loop())
+
+    def _in_flight(self) -> List[IndexingJob]:
+        return [job for job in self.jobs.values() if job.status == JOB_INDEXING]
+
+    async def _poll_loop(self) -> None:
+        logger = logging.getLogger("indexing_jobs")
+        endpoint = self.search_endpoint or os.environ["AZURE_SEARCH_SERVICE_ENDPOINT"]
+        # re-checked after the client is closed, a job may have started in the meantime
+        while self._in_flight():
+            async with AsyncDefaultAzureCredential() as credential, AsyncSearchIndexerClient(endpoint, credential) as client:
+                await self._poll_in_flight(client, logger)
+
+    async def _poll_in_flight(self, client, logger) -> None:
+        while True:
+            jobs = self._in_flight()
+            if not jobs:
+                return
+            now = time.monotonic()
+            due = [job for job in jobs if job.next_poll <= now]
+            if not due:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=min(job.next_poll for job in jobs) - now)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            # one status call per indexer, shared by the jobs of the same index
+            by_index: Dict[str, List[IndexingJob]] = {}
+            for job in due:
+                by_index.setdefault(job.index_name, []).append(job)
+            results = await asyncio.gather(
+                *(client.get_indexer_status(index_name) for index_name in by_index), return_exceptions=True
+            )
+            for (index_name, index_jobs), status in zip(by_index.items(), results):
+                for job in index_jobs:
+                    if isinstance(status, Exception):
+                        logger.warning(f"Polling indexer {index_name} failed: {str(status)}")
+                        self._reschedule(job, progressed=False)
+                    else:
+                        self._apply_status(job, status)
+
+    def _apply_status(self, job: IndexingJob, status) -> None:
+        job.polls += 1
+        last_result = status.last_result
+        current = getattr(last_result, "status", None)
+        # ignore the result of a run that finished before this job asked for one
+        start_time = getattr(last_result, "start_time", None)
+        if start_time is not None and job.run_requested_at is not None and start_time < job.run_requested_at - RUN_START_SKEW:
+            current = None
+        processed, failed = 0, 0
+        if current is not None:
+            processed = getattr(last_result, "item_count", None) or 0
+            failed = getattr(last_result, "failed_item_count", None) or 0
+        progressed = processed != job.items_processed or failed != job.items_failed or current != job.indexer_status
+        if processed != job.items_processed or (current is not None and current.lower() != "inprogress"):
+            # new documents are searchable, cached retrieval results of the index may be stale
+            get_retrieval_cache().invalidate(job.index_name)
+        if current is not None and current.lower() != "inprogress":
+            errors = [getattr(error, "error_message", str(error)) for error in (getattr(last_result, "errors", None) or [])]
+            job.update(
+                status=JOB_COMPLETED if current.lower() == "success" else JOB_FAILED,
+                indexer_status=current, items_processed=processed, items_failed=failed, errors=errors,
+            )
+            logging.getLogger("indexing_jobs").info(f"Indexing {job.index_name} finished with status {current} after {job.polls} polls")
+            return
+        job.update(indexer_status=current, items_processed=processed, items_failed=failed)
+        self._reschedule(job, progressed)
+
+    def _reschedule(self, job: IndexingJob, progressed: bool) -> None:
+        if time.monotonic() - job.indexing_started > self.timeout:
+            logging.getLogger("indexing_jobs").warning(f"Indexing {job.index_name} did not finish within {self.timeout:g}s, giving up")
+            job.update(status=JOB_FAILED, errors=job.errors + [f"Timed out: the indexer run did not finish within {self.timeout:g}s"])
+            return
+        job.poll_interval = self.min_interval if progressed else min(self.max_interval, job.poll_interval * POLL_BACKOFF)
+        job.next_poll = time.monotonic() + job.poll_interval
+
+
+_job_manager: Optional[IndexingJobManager] = None
+
+
+def get_job_manager() -> IndexingJobManager:
+    global _job_manager
+    if _job_manager is None:
+        _job_manager = IndexingJobManager()
+    return _job_manager
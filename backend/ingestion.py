@@ -0,0 +1,295 @@
+import argparse
+import asyncio
+import base64
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from azure.core.exceptions import ResourceNotFoundError
+from azure.identity.aio import DefaultAzureCredential as AsyncDefaultAzureCredential, get_bearer_token_provider
+from azure.search.documents.aio import SearchClient
+from azure.search.documents.indexes.aio import SearchIndexClient
+from openai import AsyncAzureOpenAI
+
+import aisearch
+
+'''
+Client-side ingestion into an Azure AI Search index, an alternative to the indexer + skillset
+(SplitSkill, AzureOpenAIEmbeddingSkill) set up by aisearch.setup_index.
+
+Documents are converted to text with markitdown in a process pool, split into chunks with the
+skillset's page length and overlap (aisearch.SPLIT_PAGE_LENGTH / SPLIT_PAGE_OVERLAP), embedded
+in batches and pushed straight into the index with the same fields (chunk_id, parent_id, title,
+chunk, text_vector), so the RAG agent reads both the same way. Each batch is uploaded as soon
+as its embeddings arrive.
+
+Settings (environment, or the command line options of `python ingestion.py`):
+- INGESTION_CONVERT_WORKERS: processes converting documents (default: CPU count)
+- INGESTION_EMBEDDING_BATCH_SIZE: chunks per embedding request and index upload (default 64)
+- INGESTION_EMBEDDING_CONCURRENCY: embedding requests in flight (default 4)
+- INGESTION_EMBEDDING_TPM: embedding tokens per minute to stay under, 0 for no limit (default 0);
+  throttled (429) requests are retried by the OpenAI client, honouring Retry-After
+'''
+API_VERSION = "2024-12-01-preview"
+# rough tokens per character of English text, for the rate limiter
+TOKENS_PER_CHAR = 0.25
+
+_markitdown = None
+
+
+def _init_converter() -> None:
+    global _markitdown
+    from markitdown import MarkItDown
+    _markitdown = MarkItDown()
+
+
+def convert_document(path: str) -> str:
+    """Text (markdown) of the document at path. Runs in the conversion worker processes."""
+    if _markitdown is None:
+        _init_converter()
+    return _markitdown.convert(path).text_content or ""
+
+
+async def convert_documents(paths: List[str], workers: Optional[int] = None) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """(text by path, error by path) of the documents, converted in a pool of `workers` processes."""
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_converter) as pool:
+        results = await asyncio.gather(
+            *(loop.run_in_executor(pool, convert_document, path) for path in paths), return_exceptions=True
+        )
+    texts, errors = {}, {}
+    for path, result in zip(paths, results):
+        if isinstance(result, BaseException):
+            errors[path] = str(result)
+        else:
+            texts[path] = result
+    return texts, errors
+
+
+def _split_point(text: str, start: int, end: int) -> int:
+    """Where to end the chunk text[start:end]: the last paragraph, sentence or word boundary in
+    its second half, else end."""
+    middle = start + (end - start) // 2
+    for separator in ("\n\n", "\n", ". ", "! ", "? ", " "):
+        position = text.rfind(separator, middle, end)
+        if position != -1:
+            return position + len(separator)
+    return end
+
+
+def split_pages(text: str, page_length: int = aisearch.SPLIT_PAGE_LENGTH, overlap: int = aisearch.SPLIT_PAGE_OVERLAP) -> List[str]:
+    """Chunks of at most page_length characters, each starting `overlap` characters before the
+    previous one ended (moved forward to a word boundary), like SplitSkill in "pages" mode."""
+    text = text.strip()
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + page_length, len(text))
+        if end < len(text):
+            end = _split_point(text, start, end)
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        next_start = max(end - overlap, start + 1)
+        space = text.find(" ", next_start, end)
+        start = space + 1 if space != -1 else next_start
+    return chunks
+
+
+def document_key(filename: str) -> str:
+    """parent_id of a document: url safe base64 of its name (keys may only use letters, digits, _ - =)."""
+    return base64.urlsafe_b64encode(filename.encode()).decode()
+
+
+def chunk_documents(texts: Dict[str, str]) -> List[dict]:
+    """Index documents (without vectors) of every chunk of the texts, by path."""
+    documents = []
+    for path, text in texts.items():
+        title = os.path.basename(path)
+        parent_id = document_key(title)
+        for i, chunk in enumerate(split_pages(text)):
+            documents.append({"chunk_id": f"{parent_id}_pages_{i}", "parent_id": parent_id, "title": title, "chunk": chunk})
+    return documents
+
+
+class TokenRateLimiter:
+    """Token bucket of `tokens_per_minute` embedding tokens."""
+
+    def __init__(self, tokens_per_minute: int):
+        self.tokens_per_minute = tokens_per_minute
+        self._available = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+        self.waited_seconds = 0.0
+
+    async def acquire(self, tokens: int) -> None:
+        if self.tokens_per_minute <= 0:
+            return
+        tokens = min(tokens, self.tokens_per_minute)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._available = min(self.tokens_per_minute, self._available + (now - self._updated) * self.tokens_per_minute / 60)
+                self._updated = now
+                if self._available >= tokens:
+                    self._available -= tokens
+                    return
+                wait = (tokens - self._available) * 60 / self.tokens_per_minute
+                self.waited_seconds += wait
+                await asyncio.sleep(wait)
+
+
+class IngestionPipeline:
+    """Converts, chunks, embeds and uploads documents into one index."""
+
+    def __init__(
+        self,
+        search_client: SearchClient,
+        embedding_client: AsyncAzureOpenAI,
+        embedding_deployment: str,
+        dimensions: int = aisearch.EMBEDDINGS_DIMENSIONS,
+        convert_workers: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        concurrency: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+    ):
+        self.search_client = search_client
+        self.embedding_client = embedding_client
+        self.embedding_deployment = embedding_deployment
+        self.dimensions = dimensions
+        self.convert_workers = convert_workers or int(os.getenv("INGESTION_CONVERT_WORKERS", "0")) or os.cpu_count()
+        self.batch_size = batch_size or int(os.getenv("INGESTION_EMBEDDING_BATCH_SIZE", "64"))
+        self.concurrency = concurrency or int(os.getenv("INGESTION_EMBEDDING_CONCURRENCY", "4"))
+        self.rate_limiter = TokenRateLimiter(tokens_per_minute if tokens_per_minute is not None else int(os.getenv("INGESTION_EMBEDDING_TPM", "0")))
+
+    async def convert(self, paths: List[str]) -> Tuple[Dict[str, str], Dict[str, str]]:
+        return await convert_documents(paths, self.convert_workers)
+
+    def chunk(self, texts: Dict[str, str]) -> List[dict]:
+        return chunk_documents(texts)
+
+    async def embed_and_upload(self, batch: List[dict]) -> int:
+        """Embed the chunks of batch and upload them; returns the number of chunks indexed."""
+        await self.rate_limiter.acquire(int(sum(len(document["chunk"]) for document in batch) * TOKENS_PER_CHAR))
+        response = await self.embedding_client.embeddings.create(
+            input=[document["chunk"] for document in batch], model=self.embedding_deployment, dimensions=self.dimensions
+        )
+        for document, item in zip(batch, sorted(response.data, key=lambda item: item.index)):
+            document["text_vector"] = item.embedding
+        results = await self.search_client.merge_or_upload_documents(documents=batch)
+        failed = [result for result in results if not result.succeeded]
+        for result in failed:
+            logging.getLogger("ingestion").warning(f"Indexing chunk {result.key} failed: {result.error_message}")
+        return len(batch) - len(failed)
+
+    async def delete_stale_chunks(self, documents: List[dict]) -> int:
+        """Delete the chunks left over from a longer earlier version of the documents."""
+        chunk_ids: Dict[str, set] = {}
+        for document in documents:
+            chunk_ids.setdefault(document["parent_id"], set()).add(document["chunk_id"])
+        stale = []
+        for parent_id, current in chunk_ids.items():
+            results = await self.search_client.search(search_text="*", filter=f"parent_id eq '{parent_id}'", select=["chunk_id"])
+            stale.extend([{"chunk_id": result["chunk_id"]} async for result in results if result["chunk_id"] not in current])
+        if stale:
+            await self.search_client.delete_documents(documents=stale)
+        return len(stale)
+
+    async def run(self, paths: List[str]) -> dict:
+        """Ingest the documents at paths; returns the timings and chunks per second."""
+        logger = logging.getLogger("ingestion")
+        started = time.perf_counter()
+        texts, errors = await self.convert(paths)
+        for path, error in errors.items():
+            logger.warning(f"Converting {path} failed: {error}")
+        converted = time.perf_counter()
+
+        documents = self.chunk(texts)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def process(batch: List[dict]) -> int:
+            async with semaphore:
+                return await self.embed_and_upload(batch)
+
+        batches = [documents[i:i + self.batch_size] for i in range(0, len(documents), self.batch_size)]
+        indexed = sum(await asyncio.gather(*(process(batch) for batch in batches)))
+        embedded = time.perf_counter()
+        deleted = await self.delete_stale_chunks(documents)
+        finished = time.perf_counter()
+
+        metrics = {
+            "documents": len(texts),
+            "failed_documents": len(errors),
+            "chunks": len(documents),
+            "indexed_chunks": indexed,
+            "deleted_chunks": deleted,
+            "convert_seconds": round(converted - started, 3),
+            "embed_seconds": round(embedded - converted, 3),
+            "rate_limited_seconds": round(self.rate_limiter.waited_seconds, 3),
+            "seconds": round(finished - started, 3),
+            "chunks_per_s": round(indexed / (finished - started), 2) if finished > started else 0.0,
+        }
+        logger.info(f"Indexed {indexed} chunks of {len(texts)} documents in {metrics['seconds']}s ({metrics['chunks_per_s']} chunks/s)")
+        return metrics
+
+
+async def ingest_folder(index_name: str, source_folder: str, **options) -> dict:
+    """Create the index of index_name if missing and ingest the files of source_folder into it."""
+    search_endpoint = os.environ["AZURE_SEARCH_SERVICE_ENDPOINT"]
+    embedding_deployment = os.environ["AZURE_OPENAI_EMBEDDING_MODEL"]
+    paths = [entry.path for entry in os.scandir(source_folder) if entry.is_file()]
+
+    async with AsyncDefaultAzureCredential() as credential:
+        async with SearchIndexClient(search_endpoint, credential) as index_client:
+            try:
+                await index_client.get_index(index_name)
+            except ResourceNotFoundError:
+                await index_client.create_index(aisearch.search_index_definition(
+                    index_name, os.environ["UAMI_RESOURCE_ID"], os.environ["AZURE_OPENAI_ENDPOINT"], embedding_deployment, embedding_deployment
+                ))
+        embedding_client = AsyncAzureOpenAI(
+            api_version=API_VERSION,
+            azure_endpoint=os.environ["AZURE_OPENAI_ENDPOINT"],
+            azure_ad_token_provider=get_bearer_token_provider(credential, "https://cognitiveservices.azure.com/.default"),
+            max_retries=8,
+        )
+        async with embedding_client, SearchClient(search_endpoint, index_name, credential) as search_client:
+            pipeline = IngestionPipeline(search_client, embedding_client, embedding_deployment, **options)
+            return await pipeline.run(paths)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format="%(message)s", datefmt="[%X]")
+    logging.getLogger("ingestion").setLevel(logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Chunk, embed and index the documents of data/ai-search-index (or --folder) without an indexer.")
+    parser.add_argument("--index", help="index name, with --folder; by default every folder of data/ai-search-index is its own index")
+    parser.add_argument("--folder", help="folder with the documents of --index")
+    parser.add_argument("--convert-workers", type=int, help="document conversion processes")
+    parser.add_argument("--batch-size", type=int, help="chunks per embedding request")
+    parser.add_argument("--concurrency", type=int, help="embedding requests in flight")
+    parser.add_argument("--tokens-per-minute", type=int, help="embedding token rate limit, 0 for none")
+    args = parser.parse_args()
+    if bool(args.index) != bool(args.folder):
+        parser.error("--index and --folder go together")
+
+    aisearch.load_azd_env()
+    options = {
+        "convert_workers": args.convert_workers, "batch_size": args.batch_size,
+        "concurrency": args.concurrency, "tokens_per_minute": args.tokens_per_minute,
+    }
+    if args.index:
+        folders = {args.index: args.folder}
+    else:
+        source_directory = f"{os.path.dirname(__file__)}/./data/ai-search-index"
+        folders = {entry.name: entry.path for entry in os.scandir(source_directory) if entry.is_dir()}
+
+    for index_name, folder in sorted(folders.items()):
+        metrics = asyncio.run(ingest_folder(index_name, folder, **options))
+        print(f"{index_name}: {metrics['indexed_chunks']}/{metrics['chunks']} chunks of {metrics['documents']} documents, "
+              f"convert {metrics['convert_seconds']}s, embed + upload {metrics['embed_seconds']}s, "
+              f"total {metrics['seconds']}s, {metrics['chunks_per_s']} chunks/s")
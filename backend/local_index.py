@@ -0,0 +1,279 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import hnswlib
+except ImportError:  # optional, local indexes are searched by brute force instead
+    hnswlib = None
+
+'''
+Embedded (in-process) vector index for RAG agents, an alternative to Azure AI Search for offline
+development, CI and small corpora where the search round-trip dominates.
+
+An index is a folder LOCAL_INDEX_DIR/<index> (default data/local-index) built by
+`python local_index.py` from the same data/ai-search-index/<index> folders, with the chunking of
+ingestion.py:
+- vectors.npy: float32 matrix of L2-normalized chunk vectors, memory-mapped when searched
+- chunks.json: chunk_id, parent_id, title and chunk of every row
+- meta.json: embedder, dimensions, algorithm and build time
+- hnsw.bin: the HNSW graph, when built with --algorithm hnsw (needs the optional hnswlib package)
+
+Queries are embedded with the embedder the index was built with:
+- "azure-openai": the AZURE_OPENAI_EMBEDDING_MODEL deployment, like the Azure AI Search index
+- "hashing": feature hashing of the words, no model or network needed (CI, offline development)
+
+A RAG agent uses a local index with "search_backend": "local" in its team definition (or
+RAG_SEARCH_BACKEND=local). Rebuilt indexes are reloaded on the next search.
+'''
+BRUTE_FORCE = "brute_force"
+HNSW = "hnsw"
+HASHING_DIMENSIONS = 1024
+EMBEDDING_BATCH_SIZE = 64
+
+_WORD = re.compile(r"\w+")
+
+
+def local_index_dir() -> str:
+    return os.getenv("LOCAL_INDEX_DIR", os.path.join(os.path.dirname(__file__), "data", "local-index"))
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class HashingEmbedder:
+    """Bag of words feature hashing with signed buckets."""
+
+    name = "hashing"
+
+    def __init__(self, dimensions: int = HASHING_DIMENSIONS):
+        self.dimensions = dimensions
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in _WORD.findall(text.lower()):
+                digest = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+                vectors[row, digest % self.dimensions] += 1.0 if digest >> 63 else -1.0
+        return _normalize(vectors)
+
+    async def close(self) -> None:
+        pass
+
+
+class AzureOpenAIEmbedder:
+    """Embeddings of the AZURE_OPENAI_EMBEDDING_MODEL deployment, in batches."""
+
+    name = "azure-openai"
+
+    def __init__(self, dimensions: Optional[int] = None):
+        from azure.identity.aio import DefaultAzureCredential, get_bearer_token_provider
+        from openai import AsyncAzureOpenAI
+
+        import aisearch
+        self.dimensions = dimensions or aisearch.EMBEDDINGS_DIMENSIONS
+        self.deployment = os.environ["AZURE_OPENAI_EMBEDDING_MODEL"]
+        self._credential = DefaultAzureCredential()
+        self._client = AsyncAzureOpenAI(
+            api_version="2024-12-01-preview",
+            azure_endpoint=os.environ["AZURE_OPENAI_ENDPOINT"],
+            azure_ad_token_provider=get_bearer_token_provider(self._credential, "https://cognitiveservices.azure.com/.default"),
+            max_retries=8,
+        )
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = []
+        for i in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+            response = await self._client.embeddings.create(
+                input=texts[i:i + EMBEDDING_BATCH_SIZE], model=self.deployment, dimensions=self.dimensions
+            )
+            vectors.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+        return _normalize(np.asarray(vectors, dtype=np.float32).reshape(len(texts), self.dimensions))
+
+    async def close(self) -> None:
+        await self._client.close()
+        await self._credential.close()
+
+
+def make_embedder(name: str, dimensions: Optional[int] = None):
+    if name == HashingEmbedder.name:
+        return HashingEmbedder(dimensions or HASHING_DIMENSIONS)
+    if name == AzureOpenAIEmbedder.name:
+        return AzureOpenAIEmbedder(dimensions)
+    raise ValueError(f"Unknown embedder '{name}', use one of: {HashingEmbedder.name}, {AzureOpenAIEmbedder.name}")
+
+
+class LocalVectorIndex:
+    """A built local index: memory-mapped vectors, chunk metadata and optionally an HNSW graph."""
+
+    def __init__(self, path: str, make_embedder: Callable = make_embedder):
+        self.path = path
+        self._make_embedder = make_embedder
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        with open(os.path.join(path, "chunks.json")) as f:
+            self.chunks: List[dict] = json.load(f)
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.loaded_mtime = os.stat(os.path.join(path, "meta.json")).st_mtime
+        self.hnsw = None
+        if self.meta.get("algorithm") == HNSW and hnswlib is not None and len(self.chunks):
+            self.hnsw = hnswlib.Index(space="ip", dim=self.meta["dimensions"])
+            self.hnsw.load_index(os.path.join(path, "hnsw.bin"), max_elements=len(self.chunks))
+        self._embedder = None
+
+    @property
+    def embedder(self):
+        if self._embedder is None:
+            self._embedder = self._make_embedder(self.meta["embedder"], self.meta["dimensions"])
+        return self._embedder
+
+    def search_vector(self, vector: np.ndarray, top_k: int, k_nearest_neighbors: Optional[int] = None, exhaustive: bool = False) -> List[dict]:
+        """The top_k chunks closest to `vector` (normalized), each with its "@search.score" (cosine)."""
+        count = len(self.chunks)
+        top_k = min(top_k, count)
+        if top_k == 0:
+            return []
+        if self.hnsw is not None and not exhaustive:
+            self.hnsw.set_ef(max(k_nearest_neighbors or top_k, top_k))
+            labels, distances = self.hnsw.knn_query(vector, k=top_k)
+            rows, scores = labels[0], 1.0 - distances[0]
+        else:
+            similarities = self.vectors @ vector
+            rows = np.argpartition(-similarities, top_k - 1)[:top_k]
+            rows = rows[np.argsort(-similarities[rows])]
+            scores = similarities[rows]
+        return [{**self.chunks[row], "@search.score": float(score)} for row, score in zip(rows, scores)]
+
+    async def search(self, query: str, top_k: int, k_nearest_neighbors: Optional[int] = None, exhaustive: bool = False) -> List[dict]:
+        vector = (await self.embedder.embed([query]))[0]
+        # large brute force searches take a while, keep them off the event loop
+        return await asyncio.to_thread(self.search_vector, vector, top_k, k_nearest_neighbors, exhaustive)
+
+
+class LocalIndexRegistry:
+    """Loaded local indexes by name, reloaded when their meta.json changes (a rebuild).
+
+    Indexes share one embedder per (embedder, dimensions), so a reload does not leave the
+    previous index's client open; the embedders are closed with the registry.
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = root or local_index_dir()
+        self._indexes: Dict[str, LocalVectorIndex] = {}
+        self._embedders: Dict[Tuple[str, int], object] = {}
+        self._lock = threading.Lock()
+
+    def _embedder(self, name: str, dimensions: int):
+        with self._lock:
+            embedder = self._embedders.get((name, dimensions))
+            if embedder is None:
+                embedder = self._embedders[(name, dimensions)] = make_embedder(name, dimensions)
+            return embedder
+
+    def _mtime(self, index_name: str) -> float:
+        try:
+            return os.stat(os.path.join(self.root, index_name, "meta.json")).st_mtime
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Local index {index_name} not found in {self.root}, build it with: python local_index.py --index {index_name}")
+
+    def get(self, index_name: str) -> LocalVectorIndex:
+        path = os.path.join(self.root, index_name)
+        mtime = self._mtime(index_name)
+        with self._lock:
+            index = self._indexes.get(index_name)
+            if index is None or index.loaded_mtime != mtime:
+                index = self._indexes[index_name] = LocalVectorIndex(path, self._embedder)
+            return index
+
+    async def get_async(self, index_name: str) -> LocalVectorIndex:
+        """get, loading a new or rebuilt index (chunks.json, vectors, graph) in a worker thread."""
+        index = self._indexes.get(index_name)
+        if index is not None and index.loaded_mtime == self._mtime(index_name):
+            return index
+        return await asyncio.to_thread(self.get, index_name)
+
+    async def close(self) -> None:
+        self._indexes = {}
+        embedders, self._embedders = self._embedders, {}
+        for embedder in embedders.values():
+            await embedder.close()
+
+
+_local_indexes: Optional[LocalIndexRegistry] = None
+
+
+def get_local_indexes() -> LocalIndexRegistry:
+    global _local_indexes
+    if _local_indexes is None:
+        _local_indexes = LocalIndexRegistry()
+    return _local_indexes
+
+
+async def build_local_index(index_name: str, source_folder: str, embedder_name: str = HashingEmbedder.name, algorithm: str = BRUTE_FORCE,
+                            root: Optional[str] = None, convert_workers: Optional[int] = None) -> dict:
+    """Convert, chunk and embed the files of source_folder into the local index index_name."""
+    import ingestion
+
+    if algorithm == HNSW and hnswlib is None:
+        raise RuntimeError("The hnsw algorithm needs the hnswlib package (pip install hnswlib)")
+    started = time.perf_counter()
+    paths = sorted(entry.path for entry in os.scandir(source_folder) if entry.is_file())
+    texts, errors = await ingestion.convert_documents(paths, convert_workers)
+    for path, error in errors.items():
+        logging.getLogger("local_index").warning(f"Converting {path} failed: {error}")
+    chunks = ingestion.chunk_documents(texts)
+
+    embedder = make_embedder(embedder_name)
+    try:
+        vectors = await embedder.embed([chunk["chunk"] for chunk in chunks]) if chunks else np.zeros((0, embedder.dimensions), dtype=np.float32)
+    finally:
+        await embedder.close()
+
+    path = os.path.join(root or local_index_dir(), index_name)
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, "vectors.npy"), vectors.astype(np.float32))
+    with open(os.path.join(path, "chunks.json"), "w") as f:
+        json.dump(chunks, f)
+    if algorithm == HNSW and len(chunks):
+        graph = hnswlib.Index(space="ip", dim=embedder.dimensions)
+        graph.init_index(max_elements=len(chunks), ef_construction=200, M=16)
+        graph.add_items(vectors, np.arange(len(chunks)))
+        graph.save_index(os.path.join(path, "hnsw.bin"))
+    # written last: readers reload when it changes
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump({"index_name": index_name, "embedder": embedder_name, "dimensions": embedder.dimensions,
+                   "algorithm": algorithm, "documents": len(texts), "chunks": len(chunks), "built": time.time()}, f)
+    return {"index_name": index_name, "documents": len(texts), "failed_documents": len(errors), "chunks": len(chunks),
+            "seconds": round(time.perf_counter() - started, 3)}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format="%(message)s", datefmt="[%X]")
+
+    parser = argparse.ArgumentParser(description="Build local vector indexes from the folders of data/ai-search-index.")
+    parser.add_argument("--index", help="build only this index")
+    parser.add_argument("--embedder", default=HashingEmbedder.name, choices=[HashingEmbedder.name, AzureOpenAIEmbedder.name])
+    parser.add_argument("--algorithm", default=BRUTE_FORCE, choices=[BRUTE_FORCE, HNSW])
+    parser.add_argument("--convert-workers", type=int, help="document conversion processes")
+    args = parser.parse_args()
+
+    if args.embedder == AzureOpenAIEmbedder.name:
+        import aisearch
+        aisearch.load_azd_env()
+    source_directory = os.path.join(os.path.dirname(__file__), "data", "ai-search-index")
+    folders = sorted(entry.name for entry in os.scandir(source_directory) if entry.is_dir() and (not args.index or entry.name == args.index))
+    for index_name in folders:
+        result = asyncio.run(build_local_index(index_name, os.path.join(source_directory, index_name), args.embedder, args.algorithm,
+                                               convert_workers=args.convert_workers))
+        print(f"{index_name}: {result['chunks']} chunks of {result['documents']} documents in {result['seconds']}s")
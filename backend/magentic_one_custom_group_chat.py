@@ -0,0 +1,377 @@
+import json
+from typing import Any, Dict, List, Literal, Optional
+
+from autogen_agentchat.base import Response
+from autogen_agentchat.messages import BaseAgentEvent, BaseChatMessage, TextMessage
+from autogen_agentchat.teams import MagenticOneGroupChat
+from autogen_agentchat.teams._group_chat._events import (
+    GroupChatAgentResponse,
+    GroupChatMessage,
+    GroupChatRequestPublish,
+)
+from autogen_agentchat.teams._group_chat._magentic_one._magentic_one_orchestrator import MagenticOneOrchestrator
+from autogen_agentchat.utils import remove_images
+from autogen_core import CancellationToken, DefaultTopicId, MessageContext, event
+from autogen_core.models import ChatCompletionClient, SystemMessage, UserMessage
+
+'''
+Team definitions can tune the orchestrator with an optional "orchestrator" block, e.g.:
+"orchestrator": {
+    "compaction": {"enabled": true, "token_threshold": 30000, "keep_last_messages": 6},
+    "fan_out": {"enabled": true, "max_parallel": 3}
+}
+'''
+DEFAULT_COMPACTION_TOKEN_THRESHOLD = 30000
+DEFAULT_COMPACTION_KEEP_LAST_MESSAGES = 6
+DEFAULT_FAN_OUT_MAX_PARALLEL = 3
+
+COMPACTION_SYSTEM_MESSAGE = "You are a project manager keeping notes for a team of agents."
+
+COMPACTION_PROMPT = """Summarize the conversation below so the team can continue working from the summary alone.
+Keep every fact, figure, file name, URL, decision and open question that may still be needed. Drop repetition, page dumps and tool noise.
+If the conversation starts with an earlier summary, merge it into the new one.
+
+Conversation:
+{conversation}
+"""
+
+COMPACTION_SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+FAN_OUT_LEDGER_PROMPT = """
+If the plan has several steps that are independent of each other (no step needs the result of another, e.g. lookups in different sources), different team members can work on them at the same time.
+In that case also add the following key to the JSON object. List at most {max_parallel} steps, each for a different team member, starting with the next speaker and instruction given above:
+
+    {{
+        "parallel_steps": {{
+            "reason": string,
+            "answer": [{{"speaker": string (select from: {names}), "instruction": string}}]
+        }}
+    }}
+
+Only add "parallel_steps" when the steps are truly independent, otherwise leave it out.
+"""
+
+FAN_OUT_INSTRUCTION = "Please work on the following independent steps in parallel. Each team member should only work on their own step.\n"
+
+
+class ContextCompactionEvent(BaseAgentEvent):
+    """An event signaling that older turns of the orchestrator history were replaced by a summary."""
+
+    content: str
+    """The summary that replaced the older turns."""
+
+    compacted_messages: int
+    """Number of messages replaced by the summary."""
+
+    tokens_before: int
+    """Tokens in the orchestrator history before compaction."""
+
+    tokens_after: int
+    """Tokens in the orchestrator history after compaction."""
+
+    type: Literal["ContextCompactionEvent"] = "ContextCompactionEvent"
+
+    def to_text(self) -> str:
+        return (f"Context compacted: {self.compacted_messages} messages summarized, "
+                f"{self.tokens_before} -> {self.tokens_after} tokens.\n\n{self.content}")
+
+
+class MagenticOneCustomOrchestrator(MagenticOneOrchestrator):
+    """MagenticOneOrchestrator with optional context compaction and parallel fan-out.
+
+    Compaction: before each progress ledger step, if the orchestrator history exceeds the token
+    threshold, everything between the task ledger and the last `keep_last_messages` messages is
+    replaced with a rolling LLM summary. Agent-local histories are left untouched, resetting them
+    would e.g. send the WebSurfer back to its start page.
+
+    Fan-out: the progress ledger may list independent `parallel_steps` for different team members.
+    Those members are asked to speak at the same time, and the next ledger step only runs once all
+    of them answered. Their answers are merged into the history in dispatch order.
+    """
+
+    def __init__(
+        self,
+        *args: Any,
+        compaction: Optional[Dict[str, Any]] = None,
+        fan_out: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ):
+        super().__init__(*args, **kwargs)
+        compaction = compaction or {}
+        self._compaction_enabled = bool(compaction.get("enabled", False))
+        self._compaction_token_threshold = int(compaction.get("token_threshold", DEFAULT_COMPACTION_TOKEN_THRESHOLD))
+        self._compaction_keep_last = max(1, int(compaction.get("keep_last_messages", DEFAULT_COMPACTION_KEEP_LAST_MESSAGES)))
+        fan_out = fan_out or {}
+        self._fan_out_enabled = bool(fan_out.get("enabled", False)) and len(self._participant_names) > 1
+        self._fan_out_max_parallel = max(2, int(fan_out.get("max_parallel", DEFAULT_FAN_OUT_MAX_PARALLEL)))
+        self._pending_speakers: List[str] = []
+        self._pending_responses: Dict[str, Response] = {}
+        self._ignored_speakers: set = set()
+
+    def _get_progress_ledger_prompt(self, task: str, team: str, names: List[str]) -> str:
+        prompt = super()._get_progress_ledger_prompt(task, team, names)
+        if self._fan_out_enabled:
+            prompt += FAN_OUT_LEDGER_PROMPT.format(max_parallel=self._fan_out_max_parallel, names=", ".join(names))
+        return prompt
+
+    async def reset(self) -> None:
+        await super().reset()
+        self._pending_speakers = []
+        self._pending_responses = {}
+        self._ignored_speakers = set()
+
+    @event
+    async def handle_agent_response(self, message: GroupChatAgentResponse, ctx: MessageContext) -> None:  # type: ignore
+        source = message.agent_response.chat_message.source
+        if source in self._ignored_speakers:
+            # Late answer of a fan-out step after the team already terminated
+            self._ignored_speakers.discard(source)
+            return
+        if not self._pending_speakers:
+            await super().handle_agent_response(message, ctx)
+            return
+
+        self._pending_responses[source] = message.agent_response
+        if self._termination_condition is not None:
+            delta: List[BaseAgentEvent | BaseChatMessage] = list(message.agent_response.inner_messages or [])
+            delta.append(message.agent_response.chat_message)
+            stop_message = await self._termination_condition(delta)
+            if stop_message is not None:
+                await self._termination_condition.reset()
+                self._ignored_speakers = set(self._pending_speakers) - set(self._pending_responses)
+                self._pending_speakers = []
+                self._pending_responses = {}
+                await self._signal_termination(stop_message)
+                return
+
+        if any(speaker not in self._pending_responses for speaker in self._pending_speakers):
+            return
+
+        # All parallel steps are done, merge the answers in dispatch order
+        for speaker in self._pending_speakers:
+            self._message_thread.append(self._pending_responses[speaker].chat_message)
+        self._pending_speakers = []
+        self._pending_responses = {}
+        await self._orchestrate_step(ctx.cancellation_token)
+
+    async def _orchestrate_step(self, cancellation_token: CancellationToken) -> None:
+        if self._compaction_enabled:
+            await self._compact_thread(cancellation_token)
+        if not self._fan_out_enabled:
+            await super()._orchestrate_step(cancellation_token)
+            return
+        await self._orchestrate_fan_out_step(cancellation_token)
+
+    async def _orchestrate_fan_out_step(self, cancellation_token: CancellationToken) -> None:
+        """Same as MagenticOneOrchestrator._orchestrate_step, but dispatches `parallel_steps` of the
+        progress ledger to several team members at once."""
+        # Check if we reached the maximum number of rounds
+        if self._max_turns is not None and self._n_rounds > self._max_turns:
+            await self._prepare_final_answer("Max rounds reached.", cancellation_token)
+            return
+        self._n_rounds += 1
+
+        progress_ledger = await self._get_progress_ledger(cancellation_token)
+
+        # Check for task completion
+        if progress_ledger["is_request_satisfied"]["answer"]:
+            await self._log_message("Task completed, preparing final answer...")
+            await self._prepare_final_answer(progress_ledger["is_request_satisfied"]["reason"], cancellation_token)
+            return
+
+        # Check for stalling
+        if not progress_ledger["is_progress_being_made"]["answer"]:
+            self._n_stalls += 1
+        elif progress_ledger["is_in_loop"]["answer"]:
+            self._n_stalls += 1
+        else:
+            self._n_stalls = max(0, self._n_stalls - 1)
+
+        # Too much stalling
+        if self._n_stalls >= self._max_stalls:
+            await self._log_message("Stall count exceeded, re-planning with the outer loop...")
+            await self._update_task_ledger(cancellation_token)
+            await self._reenter_outer_loop(cancellation_token)
+            return
+
+        steps = self._parallel_steps(progress_ledger)
+        if len(steps) > 1:
+            content = FAN_OUT_INSTRUCTION + "\n".join(f"- {speaker}: {instruction}" for speaker, instruction in steps)
+            await self._log_message(f"Fan-out to: {', '.join(speaker for speaker, _ in steps)}")
+        else:
+            content = progress_ledger["instruction_or_question"]["answer"]
+            await self._log_message(f"Next Speaker: {progress_ledger['next_speaker']['answer']}")
+
+        # Broadcast the next step(s)
+        message = TextMessage(content=content, source=self._name)
+        self._message_thread.append(message)  # My copy
+        await self.publish_message(
+            GroupChatMessage(message=message),
+            topic_id=DefaultTopicId(type=self._output_topic_type),
+        )
+        await self._output_message_queue.put(message)
+        await self.publish_message(
+            GroupChatAgentResponse(agent_response=Response(chat_message=message)),
+            topic_id=DefaultTopicId(type=self._group_topic_type),
+            cancellation_token=cancellation_token,
+        )
+
+        # Request that the step(s) be completed
+        if len(steps) > 1:
+            self._pending_speakers = [speaker for speaker, _ in steps]
+            self._pending_responses = {}
+        for speaker, _ in steps:
+            await self.publish_message(
+                GroupChatRequestPublish(),
+                topic_id=DefaultTopicId(type=self._participant_name_to_topic_type[speaker]),
+                cancellation_token=cancellation_token,
+            )
+
+    async def _get_progress_ledger(self, cancellation_token: CancellationToken) -> Dict[str, Any]:
+        """Ask for the progress ledger and validate it, retrying on malformed JSON."""
+        context = self._thread_to_context()
+        context.append(UserMessage(
+            content=self._get_progress_ledger_prompt(self._task, self._team_description, self._participant_names),
+            source=self._name,
+        ))
+        required_keys = [
+            "is_request_satisfied",
+            "is_progress_being_made",
+            "is_in_loop",
+            "instruction_or_question",
+            "next_speaker",
+        ]
+        for _ in range(self._max_json_retries):
+            response = await self._model_client.create(
+                self._get_compatible_context(context), json_output=True, cancellation_token=cancellation_token
+            )
+            try:
+                assert isinstance(response.content, str)
+                progress_ledger = json.loads(response.content)
+            except (json.JSONDecodeError, AssertionError):
+                await self._log_message("Invalid ledger format encountered, retrying...")
+                continue
+            key_error = any(
+                key not in progress_ledger
+                or not isinstance(progress_ledger[key], dict)
+                or "answer" not in progress_ledger[key]
+                or "reason" not in progress_ledger[key]
+                for key in required_keys
+            )
+            if not key_error and (
+                progress_ledger["is_request_satisfied"]["answer"]
+                or progress_ledger["next_speaker"]["answer"] in self._participant_names
+            ):
+                await self._log_message(f"Progress Ledger: {progress_ledger}")
+                return progress_ledger
+            await self._log_message(f"Failed to parse ledger information, retrying: {response.content}")
+        raise ValueError("Failed to parse ledger information after multiple retries.")
+
+    def _parallel_steps(self, progress_ledger: Dict[str, Any]) -> List[tuple]:
+        """(speaker, instruction) pairs to dispatch: the next speaker first, then the other
+        independent steps of distinct, valid team members, capped at max_parallel."""
+        steps = [(progress_ledger["next_speaker"]["answer"], progress_ledger["instruction_or_question"]["answer"])]
+        parallel = progress_ledger.get("parallel_steps")
+        answer = parallel.get("answer") if isinstance(parallel, dict) else None
+        if not isinstance(answer, list):
+            return steps
+        for step in answer:
+            if len(steps) >= self._fan_out_max_parallel:
+                break
+            if not isinstance(step, dict):
+                continue
+            speaker, instruction = step.get("speaker"), step.get("instruction")
+            if speaker in self._participant_names and isinstance(instruction, str) and speaker not in [s for s, _ in steps]:
+                steps.append((speaker, instruction))
+        return steps
+
+    async def _compact_thread(self, cancellation_token: CancellationToken) -> None:
+        """Replace older turns of the message thread with a summary once it exceeds the token threshold."""
+        tokens_before = self._model_client.count_tokens(self._thread_to_context())
+        if tokens_before <= self._compaction_token_threshold:
+            return
+
+        # The first message is always the task ledger, keep it verbatim
+        head = self._message_thread[:1]
+        older = self._message_thread[1:-self._compaction_keep_last]
+        recent = self._message_thread[-self._compaction_keep_last:]
+        if len(older) < 2:
+            return
+
+        summary = await self._summarize(older, cancellation_token)
+        summary_message = TextMessage(content=COMPACTION_SUMMARY_PREFIX + summary, source=self._name)
+        self._message_thread[:] = head + [summary_message] + recent
+        tokens_after = self._model_client.count_tokens(self._thread_to_context())
+
+        await self._log_message(f"Compacted {len(older)} messages: {tokens_before} -> {tokens_after} tokens")
+        await self._output_message_queue.put(ContextCompactionEvent(
+            source=self._name,
+            content=summary,
+            compacted_messages=len(older),
+            tokens_before=tokens_before,
+            tokens_after=tokens_after,
+        ))
+
+    async def _summarize(self, messages: List[Any], cancellation_token: CancellationToken) -> str:
+        conversation = "\n\n".join(f"{m.source}: {m.to_model_text()}" for m in messages)
+        context = remove_images([
+            SystemMessage(content=COMPACTION_SYSTEM_MESSAGE),
+            UserMessage(content=COMPACTION_PROMPT.format(conversation=conversation), source=self._name),
+        ])
+        response = await self._model_client.create(context, cancellation_token=cancellation_token)
+        assert isinstance(response.content, str)
+        return response.content
+
+
+class MagenticOneCustomGroupChat(MagenticOneGroupChat):
+    """MagenticOneGroupChat managed by the MagenticOneCustomOrchestrator.
+
+    Args:
+        compaction: Optional context compaction settings, see MagenticOneCustomOrchestrator.
+        fan_out: Optional parallel fan-out settings, see MagenticOneCustomOrchestrator.
+    """
+
+    def __init__(
+        self,
+        participants: List[Any],
+        model_client: ChatCompletionClient,
+        *,
+        compaction: Optional[Dict[str, Any]] = None,
+        fan_out: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ):
+        super().__init__(participants, model_client, **kwargs)
+        self._base_group_chat_manager_class = MagenticOneCustomOrchestrator
+        self._compaction = compaction
+        self._fan_out = fan_out
+
+    def _create_group_chat_manager_factory(
+        self,
+        name,
+        group_topic_type,
+        output_topic_type,
+        participant_topic_types,
+        participant_names,
+        participant_descriptions,
+        output_message_queue,
+        termination_condition,
+        max_turns,
+        message_factory,
+    ):
+        return lambda: MagenticOneCustomOrchestrator(
+            name,
+            group_topic_type,
+            output_topic_type,
+            participant_topic_types,
+            participant_names,
+            participant_descriptions,
+            max_turns,
+            message_factory,
+            self._model_client,
+            self._max_stalls,
+            self._final_answer_prompt,
+            output_message_queue,
+            termination_condition,
+            compaction=self._compaction,
+            fan_out=self._fan_out,
+        )
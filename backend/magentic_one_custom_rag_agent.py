@@ -1,24 +1,158 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
 from autogen_agentchat.agents import AssistantAgent
 from autogen_core.models import (
     ChatCompletionClient,
 )
-from azure.search.documents import SearchClient
+from azure.search.documents.aio import SearchClient
 from azure.core.credentials import AzureKeyCredential
-from azure.search.documents.models import VectorizableTextQuery
-from azure.identity import DefaultAzureCredential
+from azure.search.documents.models import VectorizableTextQuery, VectorizedQuery
+from azure.identity.aio import DefaultAzureCredential
+
+from embedding_cache import get_query_embedder
+from local_index import get_local_indexes
+from retrieval_cache import get_retrieval_cache
 
 '''
 Please provide the following environment variables in your .env file:
 AZURE_SEARCH_SERVICE_ENDPOINT=""
 AZURE_SEARCH_ADMIN_KEY=""
+
+Searches go through one long-lived async SearchClient per (endpoint, index), shared by all RAG
+agents and sessions (get_search_client_pool); the pool is closed on application shutdown.
+Results are cached per index, query and search parameters, see retrieval_cache.
+
+Search settings (RAGSearchSettings), per agent in the team definition or from the environment:
+- search_backend / RAG_SEARCH_BACKEND: "azure" (Azure AI Search, default) or "local" (an embedded
+  vector index built with local_index.py, vector search only)
+- search_mode / RAG_SEARCH_MODE: "hybrid" (keyword + vector, default) or "vector"
+- top_k / RAG_TOP_K: chunks returned to the agent (default 3)
+- k_nearest_neighbors / RAG_K_NEAREST_NEIGHBORS: approximate (HNSW) vector candidates (default 50)
+- exhaustive / RAG_EXHAUSTIVE: exact instead of approximate vector search (default false)
+- semantic_ranker / RAG_SEMANTIC_RANKER: rerank with the "default" semantic configuration
+  (default false, needs the semantic ranker enabled on the search service)
+- direct_return / RAG_DIRECT_RETURN: hand the retrieved chunks, with their citations, straight to
+  the team instead of having the model restate them (saves one model call per search, default false)
+- query_vectorization / RAG_QUERY_VECTORIZATION: "service" (the index vectorizer embeds every
+  query, default) or "client" (the agent embeds queries itself through the persistent, batched
+  embedding cache of embedding_cache and sends the vector; repeated queries skip the embedding call)
+- fusion / RAG_FUSION: how a federated agent merges the rankings of its indexes, "rrf"
+  (reciprocal rank fusion, default) or "score" (min-max normalized scores)
+
+A federated RAG agent ("type": "FederatedRAG" with "index_names", or a comma separated
+"index_name") searches all its indexes concurrently with the settings above and returns the
+top_k chunks of the merged ranking, each cited with its index. An index that fails is logged and
+left out, the search only fails when all of them do.
 '''
 MAGENTIC_ONE_RAG_DESCRIPTION = "An agent that has access to internal index and can handle RAG tasks, call this agent if you are getting questions on your internal index"
 
+MAGENTIC_ONE_FEDERATED_RAG_DESCRIPTION = "An agent that has access to several internal indexes and can handle RAG tasks across them, call this agent if you are getting questions on your internal indexes"
+
 MAGENTIC_ONE_RAG_SYSTEM_MESSAGE = """
         You are a helpful AI Assistant.
         When given a user query, use available tools to help the user with their request.
         Reply "TERMINATE" in the end when everything is done."""
 
+
+class SearchClientPool:
+    """Async SearchClients by (endpoint, index name), sharing one credential and its token cache."""
+
+    def __init__(self):
+        self._clients: Dict[Tuple[str, str], SearchClient] = {}
+        self._credential: Optional[DefaultAzureCredential] = None
+
+    def get(self, endpoint: str, index_name: str) -> SearchClient:
+        client = self._clients.get((endpoint, index_name))
+        if client is None:
+            if self._credential is None:
+                self._credential = DefaultAzureCredential()
+            client = SearchClient(endpoint=endpoint, index_name=index_name, credential=self._credential)
+            self._clients[(endpoint, index_name)] = client
+        return client
+
+    async def close(self) -> None:
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.close()
+        if self._credential is not None:
+            credential, self._credential = self._credential, None
+            await credential.close()
+
+
+_search_client_pool: Optional[SearchClientPool] = None
+
+
+def get_search_client_pool() -> SearchClientPool:
+    global _search_client_pool
+    if _search_client_pool is None:
+        _search_client_pool = SearchClientPool()
+    return _search_client_pool
+
+
+SEARCH_BACKENDS = ("azure", "local")
+SEARCH_MODES = ("hybrid", "vector")
+QUERY_VECTORIZATIONS = ("service", "client")
+FUSIONS = ("rrf", "score")
+# rank constant of reciprocal rank fusion, as in Azure AI Search hybrid queries
+RRF_K = 60
+
+
+def _flag(value: Any) -> bool:
+    return value if isinstance(value, bool) else str(value).lower() == "true"
+
+
+class RAGSearchSettings:
+    def __init__(self, search_mode: str = "hybrid", top_k: int = 3, k_nearest_neighbors: int = 50,
+                 exhaustive: bool = False, semantic_ranker: bool = False, search_backend: str = "azure",
+                 direct_return: bool = False, fusion: str = "rrf", query_vectorization: str = "service"):
+        if search_backend not in SEARCH_BACKENDS:
+            raise ValueError(f"Unknown search backend '{search_backend}', use one of: {', '.join(SEARCH_BACKENDS)}")
+        if search_mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode '{search_mode}', use one of: {', '.join(SEARCH_MODES)}")
+        if query_vectorization not in QUERY_VECTORIZATIONS:
+            raise ValueError(f"Unknown query vectorization '{query_vectorization}', use one of: {', '.join(QUERY_VECTORIZATIONS)}")
+        if fusion not in FUSIONS:
+            raise ValueError(f"Unknown fusion '{fusion}', use one of: {', '.join(FUSIONS)}")
+        self.search_mode = search_mode
+        self.top_k = top_k
+        # at least as many candidates as results
+        self.k_nearest_neighbors = max(k_nearest_neighbors, top_k)
+        self.exhaustive = exhaustive
+        self.semantic_ranker = semantic_ranker
+        self.search_backend = search_backend
+        self.direct_return = direct_return
+        self.fusion = fusion
+        self.query_vectorization = query_vectorization
+
+    @classmethod
+    def from_agent(cls, agent: Dict[str, Any]) -> "RAGSearchSettings":
+        """Settings of an agent definition, missing ones from the environment."""
+        def setting(key: str, default: str) -> Any:
+            value = agent.get(key)
+            return value if value not in (None, "") else os.getenv(f"RAG_{key.upper()}", default)
+
+        return cls(
+            search_mode=setting("search_mode", "hybrid"),
+            top_k=int(setting("top_k", "3")),
+            k_nearest_neighbors=int(setting("k_nearest_neighbors", "50")),
+            exhaustive=_flag(setting("exhaustive", "false")),
+            semantic_ranker=_flag(setting("semantic_ranker", "false")),
+            search_backend=setting("search_backend", "azure"),
+            direct_return=_flag(setting("direct_return", "false")),
+            fusion=setting("fusion", "rrf"),
+            query_vectorization=setting("query_vectorization", "service"),
+        )
+
+    def cache_params(self) -> Dict[str, Any]:
+        return dict(backend=self.search_backend, search_mode=self.search_mode, top=self.top_k, k=self.k_nearest_neighbors,
+                    exhaustive=self.exhaustive, semantic=self.semantic_ranker, vectorization=self.query_vectorization)
+
+
 class MagenticOneRAGAgent(AssistantAgent):
     """An agent, used by MagenticOne that provides coding assistance using an LLM model client.
 
@@ -33,50 +167,181 @@ class MagenticOneRAGAgent(AssistantAgent):
         AZURE_SEARCH_SERVICE_ENDPOINT: str,
         # AZURE_SEARCH_ADMIN_KEY: str = None,
         description: str = MAGENTIC_ONE_RAG_DESCRIPTION,
-
+        search_settings: Optional[RAGSearchSettings] = None,
     ):
+        search_settings = search_settings or RAGSearchSettings.from_agent({})
         super().__init__(
             name,
             model_client,
             description=description,
             system_message=MAGENTIC_ONE_RAG_SYSTEM_MESSAGE,
             tools=[self.do_search],
-            reflect_on_tool_use=True,
+            # with direct_return the search result itself is the agent's reply
+            reflect_on_tool_use=not search_settings.direct_return,
         )
 
         self.index_name = index_name    
         self.AZURE_SEARCH_SERVICE_ENDPOINT = AZURE_SEARCH_SERVICE_ENDPOINT
         # self.AZURE_SEARCH_ADMIN_KEY = AZURE_SEARCH_ADMIN_KEY
+        self.search_settings = search_settings
 
         
-    def config_search(self) -> SearchClient:
-        service_endpoint = self.AZURE_SEARCH_SERVICE_ENDPOINT
+    def config_search(self, index_name: Optional[str] = None) -> SearchClient:
         # key = self.AZURE_SEARCH_ADMIN_KEY
-        index_name = self.index_name
         # credential = AzureKeyCredential(key)
-        credential = DefaultAzureCredential()
-        return SearchClient(endpoint=service_endpoint, index_name=index_name, credential=credential)
+        return get_search_client_pool().get(self.AZURE_SEARCH_SERVICE_ENDPOINT, index_name or self.index_name)
+
+    def _cache_key_index(self):
+        return self.index_name
 
     async def do_search(self, query: str) -> str:
         """Search indexed data using Azure Cognitive Search with vector-based queries."""
-        aia_search_client = self.config_search()
-        fields = "text_vector" # TODO: Check if this is the correct field name
-        vector_query = VectorizableTextQuery(text=query, k_nearest_neighbors=1, fields=fields, exhaustive=True)
- 
-
-        results = aia_search_client.search(  
-            search_text=None,  
-            vector_queries= [vector_query],
-            select=["parent_id", "chunk_id", "chunk"], #TODO: Check if these are the correct field names
-            top=1 #TODO: Check if this is the correct number of results
-        )  
-        answer = ''
-        for result in results:  
-            # print(f"parent_id: {result['parent_id']}")  
-            # print(f"chunk_id: {result['chunk_id']}")  
-            # print(f"Score: {result['@search.score']}")  
-            # print(f"Content: {result['chunk']}")
-            answer = answer + result['chunk']
+        cache = get_retrieval_cache()
+        index_key = self._cache_key_index()
+        key = cache.key(index_key, query, endpoint=self.AZURE_SEARCH_SERVICE_ENDPOINT, **self._cache_params())
+        answer = cache.get(key)
+        if answer is not None:
+            return answer
+        generation = cache.generation(index_key)
+        started = time.perf_counter()
+        answer = await self._search(query)
+        cache.put(key, answer, time.perf_counter() - started, generation)
         return answer
 
+    def _cache_params(self) -> Dict[str, Any]:
+        return self.search_settings.cache_params()
+
+    async def _search(self, query: str) -> str:
+        return self._format(await self._retrieve(self.index_name, query))
+
+    async def _retrieve(self, index_name: str, query: str) -> List[dict]:
+        settings = self.search_settings
+        if settings.search_backend == "local":
+            index = await get_local_indexes().get_async(index_name)
+            return await index.search(query, settings.top_k, settings.k_nearest_neighbors, settings.exhaustive)
+
+        aia_search_client = self.config_search(index_name)
+        if settings.query_vectorization == "client":
+            vector_query = VectorizedQuery(
+                vector=await get_query_embedder().embed(query), k_nearest_neighbors=settings.k_nearest_neighbors,
+                fields="text_vector", exhaustive=settings.exhaustive
+            )
+        else:
+            vector_query = VectorizableTextQuery(
+                text=query, k_nearest_neighbors=settings.k_nearest_neighbors, fields="text_vector", exhaustive=settings.exhaustive
+            )
+        options = {}
+        if settings.semantic_ranker:
+            options = dict(query_type="semantic", semantic_configuration_name="default")
+            if settings.search_mode == "vector":
+                # the reranker needs the query text even without keyword search
+                options["semantic_query"] = query
+
+        results = await aia_search_client.search(
+            search_text=query if settings.search_mode == "hybrid" else None,
+            vector_queries=[vector_query],
+            select=["parent_id", "chunk_id", "title", "chunk"],
+            top=settings.top_k,
+            **options,
+        )
+        return [result async for result in results]
+
+    @staticmethod
+    def _format(results) -> str:
+        """The chunks, each under a citation line: [title] (index, parent_id, chunk_id, score)."""
+        formatted = []
+        for result in results:
+            score = result["@fusion.score"] if "@fusion.score" in result else _score(result)
+            citation = f"parent_id={result.get('parent_id')}, chunk_id={result.get('chunk_id')}"
+            if result.get("@index"):
+                citation = f"index={result['@index']}, {citation}"
+            if score is not None:
+                citation += f", score={score:.3f}"
+            formatted.append(f"[{result.get('title') or 'source'}] ({citation})\n{result['chunk']}")
+        return "\n\n".join(formatted)
+
+
+def _score(result: dict) -> Optional[float]:
+    score = result.get("@search.reranker_score")
+    return score if score is not None else result.get("@search.score")
+
+
+def _content_key(result: dict) -> Optional[Tuple[Any, ...]]:
+    """Identity of a chunk across indexes: its title and the SHA-256 of its text."""
+    chunk = result.get("chunk")
+    if chunk is None:
+        return None
+    return (result.get("title"), hashlib.sha256(chunk.encode()).hexdigest())
+
+
+def fuse_results(rankings: Dict[str, List[dict]], top_k: int, fusion: str = "rrf") -> List[dict]:
+    """Merge the ranked results of several indexes into one ranking of at most top_k results.
+
+    "rrf" scores a result 1 / (RRF_K + rank) in its index, so it only uses the order and copes
+    with scores on different scales (BM25, cosine, reranker): distinct results are interleaved by
+    rank. "score" min-max normalizes the scores of every index to [0, 1], keeping how much better
+    a result is than the next one. A chunk found in several indexes (same title and chunk text,
+    e.g. a document indexed twice; indexers give it different keys in every index) is kept once,
+    with the sum of its scores; ties keep the order of the indexes. Every result is tagged with
+    its "@index" and merged "@fusion.score".
+    """
+    fused: Dict[Tuple[Any, ...], dict] = {}
+    for index_name, results in rankings.items():
+        scores = [_score(result) or 0.0 for result in results]
+        low, high = (min(scores), max(scores)) if scores else (0.0, 0.0)
+        for rank, (result, score) in enumerate(zip(results, scores), start=1):
+            if fusion == "rrf":
+                value = 1.0 / (RRF_K + rank)
+            else:
+                value = (score - low) / (high - low) if high > low else 1.0
+            key = _content_key(result) or (index_name, rank)
+            if key in fused:
+                fused[key]["@fusion.score"] += value
+                fused[key]["@index"] += f",{index_name}"
+            else:
+                fused[key] = {**result, "@index": index_name, "@fusion.score": value}
+    return sorted(fused.values(), key=lambda result: result["@fusion.score"], reverse=True)[:top_k]
+
+
+class MagenticOneFederatedRAGAgent(MagenticOneRAGAgent):
+    """A RAG agent over several indexes, searched concurrently and merged into one ranked context."""
+
+    def __init__(
+        self,
+        name: str,
+        model_client: ChatCompletionClient,
+        index_names: Sequence[str],
+        AZURE_SEARCH_SERVICE_ENDPOINT: str,
+        description: str = MAGENTIC_ONE_FEDERATED_RAG_DESCRIPTION,
+        search_settings: Optional[RAGSearchSettings] = None,
+    ):
+        if not index_names:
+            raise ValueError(f"Federated RAG agent {name} needs at least one index")
+        super().__init__(name, model_client, index_names[0], AZURE_SEARCH_SERVICE_ENDPOINT, description, search_settings)
+        self.index_names = list(dict.fromkeys(index_names))
+
+    def _cache_key_index(self):
+        return tuple(self.index_names)
+
+    def _cache_params(self) -> Dict[str, Any]:
+        return dict(self.search_settings.cache_params(), fusion=self.search_settings.fusion)
+
+    async def _search(self, query: str) -> str:
+        outcomes = await asyncio.gather(*(self._retrieve(index_name, query) for index_name in self.index_names), return_exceptions=True)
+        rankings = {}
+        for index_name, outcome in zip(self.index_names, outcomes):
+            if isinstance(outcome, BaseException):
+                logging.getLogger("rag").warning(f"Search of index {index_name} failed: {outcome!r}")
+            else:
+                rankings[index_name] = outcome
+        if not rankings:
+            raise outcomes[0]
+        return self._format(fuse_results(rankings, self.search_settings.top_k, self.search_settings.fusion))
+
 
+def index_names_of(agent: Dict[str, Any]) -> List[str]:
+    """The indexes of a federated agent definition: "index_names", or a comma separated "index_name"."""
+    names = agent.get("index_names") or agent.get("index_name") or []
+    if isinstance(names, str):
+        names = names.split(",")
+    return [name.strip() for name in names if name and name.strip()]
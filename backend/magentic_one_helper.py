@@ -25,7 +25,11 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from magentic_one_custom_agent import MagenticOneCustomAgent
-from magentic_one_custom_rag_agent import MagenticOneRAGAgent
+from document_cache import get_cached_markitdown
+from magentic_one_custom_rag_agent import MagenticOneFederatedRAGAgent, MagenticOneRAGAgent, RAGSearchSettings, index_names_of
+from magentic_one_custom_group_chat import MagenticOneCustomGroupChat
+from model_routing import ModelRouter, ROUTE_DEFAULT, ROUTE_FAST, ROUTE_REASONING, ROUTING_AUTO
+from image_processing import ImageOptimizingChatCompletionClient, ImageProcessingStats, get_image_processor
 
 azure_credential = DefaultAzureCredential()
 token_provider = get_bearer_token_provider(
@@ -74,6 +78,8 @@ class MagenticOneHelper:
         # self.log_handler: Optional[LogHandler] = None
         self.save_screenshots = save_screenshots
         self.run_locally = run_locally
+        self.model_router: Optional[ModelRouter] = None
+        self.image_stats = ImageProcessingStats()
 
         self.max_rounds = 50
         self.max_time = 25 * 60
@@ -84,9 +90,14 @@ class MagenticOneHelper:
         if not os.path.exists(self.logs_dir):
             os.makedirs(self.logs_dir)
 
-    async def initialize(self, agents, session_id = None) -> None:
+    async def initialize(self, agents, session_id = None, orchestrator = None) -> None:
         """
         Initialize the MagenticOne system, setting up agents and runtime.
+
+        Args:
+            agents: Agent definitions of the team
+            session_id: Session id, generated if not provided
+            orchestrator: Optional orchestrator settings of the team (e.g. context compaction)
         """
         # Create the runtime
         self.runtime = SingleThreadedAgentRuntime()
@@ -97,6 +108,8 @@ class MagenticOneHelper:
         else:
             self.session_id = session_id
 
+        self.orchestrator_config = orchestrator or {}
+
         self.client = AzureOpenAIChatCompletionClient(
             model="gpt-4o-2024-11-20",
             azure_deployment="gpt-4o",
@@ -125,6 +138,35 @@ class MagenticOneHelper:
             }
         )
 
+        # Optional cheaper / faster deployment (e.g. gpt-4o-mini) for short classification-style calls
+        fast_deployment = os.getenv("AZURE_OPENAI_FAST_DEPLOYMENT")
+        if fast_deployment:
+            self.client_fast = AzureOpenAIChatCompletionClient(
+                model=os.getenv("AZURE_OPENAI_FAST_MODEL", fast_deployment),
+                azure_deployment=fast_deployment,
+                api_version="2025-03-01-preview",
+                azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+                azure_ad_token_provider=token_provider,
+                model_info={
+                    "vision": True,
+                    "function_calling": True,
+                    "json_output": True,
+                    "family": "gpt-4o"
+                }
+            )
+        else:
+            self.client_fast = self.client
+
+        # Screenshots are downscaled / transcoded before they are sent to any of the models
+        image_processor = get_image_processor()
+        self.model_router = ModelRouter(
+            clients={
+                ROUTE_DEFAULT: ImageOptimizingChatCompletionClient(self.client, image_processor, self.image_stats),
+                ROUTE_REASONING: ImageOptimizingChatCompletionClient(self.client_reasoning, image_processor, self.image_stats),
+                ROUTE_FAST: ImageOptimizingChatCompletionClient(self.client_fast, image_processor, self.image_stats),
+            },
+            auto=self.orchestrator_config.get("model_routing") == ROUTING_AUTO,
+        )
 
         # Set up agents
         self.agents = await self.setup_agents(agents, self.client, self.logs_dir) 
@@ -134,6 +176,9 @@ class MagenticOneHelper:
     async def setup_agents(self, agents, client, logs_dir):
         agent_list = []
         for agent in agents:
+            # Per agent model route from the team definition ("default", "reasoning" or "fast")
+            if self.model_router is not None:
+                client = self.model_router.client_for(agent["name"], agent.get("model"))
             # This is default MagenticOne agent - Coder
             if (agent["type"] == "MagenticOne" and agent["name"] == "Coder"):
                 coder = MagenticOneCoderAgent("Coder", model_client=client)
@@ -177,6 +222,8 @@ class MagenticOneHelper:
             elif (agent["type"] == "MagenticOne" and agent["name"] == "FileSurfer"):
                 file_surfer = FileSurfer("FileSurfer", model_client=client)
                 file_surfer._browser.set_path(os.path.join(os.getcwd(), "data"))  # Set the path to the data folder in the current working directory
+                # conversions shared by all sessions and prewarmed at startup, see document_cache
+                file_surfer._browser._markdown_converter = get_cached_markitdown()
                 agent_list.append(file_surfer)
                 print("FileSurfer added!")
             
@@ -202,25 +249,51 @@ class MagenticOneHelper:
                     description=agent["description"],
                     AZURE_SEARCH_SERVICE_ENDPOINT=os.getenv("AZURE_SEARCH_SERVICE_ENDPOINT"),
                     # AZURE_SEARCH_ADMIN_KEY=os.getenv("AZURE_SEARCH_ADMIN_KEY")
+                    search_settings=RAGSearchSettings.from_agent(agent),
                     )
                 agent_list.append(rag_agent)
                 print(f'{agent["name"]} (RAG) added!')
+
+            # RAG agent over several indexes (index_names, or a comma separated index_name), searched concurrently
+            elif (agent["type"] == "FederatedRAG"):
+                rag_agent = MagenticOneFederatedRAGAgent(
+                    agent["name"],
+                    model_client=client,
+                    index_names=index_names_of(agent),
+                    description=agent["description"],
+                    AZURE_SEARCH_SERVICE_ENDPOINT=os.getenv("AZURE_SEARCH_SERVICE_ENDPOINT"),
+                    search_settings=RAGSearchSettings.from_agent(agent),
+                    )
+                agent_list.append(rag_agent)
+                print(f'{agent["name"]} (FederatedRAG) added!')
             else:
                 raise ValueError('Unknown Agent!')
         return agent_list
 
     def main(self, task):
-        team = MagenticOneGroupChat(
+        orchestrator_client = self.model_router.client_for(
+            "MagenticOneOrchestrator",
+            self.orchestrator_config.get("model"),
+            classification_route=self.orchestrator_config.get("ledger_model"),
+        )
+        team = MagenticOneCustomGroupChat(
             participants=self.agents,
-            model_client=self.client,
-            # model_client=self.client_reasoning,
+            model_client=orchestrator_client,
             max_turns=self.max_rounds,
             max_stalls=self.max_stalls_before_replan,
-            
+            compaction=self.orchestrator_config.get("compaction"),
+            fan_out=self.orchestrator_config.get("fan_out"),
         )
+        self.team = team
         cancellation_token = CancellationToken()
         stream = team.run_stream(task=task, cancellation_token=cancellation_token)
         return stream, cancellation_token
+
+    def follow_up(self, task):
+        """Run a follow-up task on the team of the finished run, keeping its conversation."""
+        cancellation_token = CancellationToken()
+        stream = self.team.run_stream(task=task, cancellation_token=cancellation_token)
+        return stream, cancellation_token
     
 async def main(agents, task, run_locally) -> None:
 
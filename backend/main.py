@@ -1,5 +1,5 @@
 # File: main.py
-from fastapi import FastAPI, Depends, UploadFile, HTTPException, Query, File, Form
+from fastapi import FastAPI, Depends, UploadFile, HTTPException, Query, File, Form, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2AuthorizationCodeBearer
 from azure.identity import DefaultAzureCredential, get_bearer_token_provider
@@ -10,12 +10,23 @@ from database import CosmosDB
 import os
 import uuid
 from contextlib import asynccontextmanager
-from fastapi.responses import StreamingResponse, Response
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse, Response
 import json, asyncio
 from magentic_one_helper import MagenticOneHelper
-from autogen_agentchat.messages import MultiModalMessage, TextMessage, ToolCallExecutionEvent, ToolCallRequestEvent
+from autogen_agentchat.messages import MultiModalMessage, TextMessage, ToolCallExecutionEvent, ToolCallRequestEvent, ToolCallSummaryMessage
 from autogen_agentchat.base import TaskResult
 from magentic_one_helper import generate_session_name
+from magentic_one_custom_group_chat import ContextCompactionEvent
+from image_store import get_image_store, IMAGE_CACHE_CONTROL
+from image_processing import get_image_processor
+from event_stream import EventQueue, EventSerializer, SSE_HEARTBEAT, encode_image_frame, heartbeat_interval_from_env, orjson, pump
+from compression import CompressionMiddleware
+from indexing_jobs import FINISHED_STATES, get_job_manager
+from magentic_one_custom_rag_agent import get_search_client_pool
+from retrieval_cache import get_retrieval_cache
+from local_index import get_local_indexes
+from embedding_cache import get_query_embedder
+from document_cache import get_conversion_cache, prewarm
 import aisearch
 import logging
 
@@ -74,12 +85,23 @@ async def lifespan(app: FastAPI):
     logging.basicConfig(level=logging.INFO,
                         format='%(levelname)s: %(asctime)s - %(message)s')
     print("Database initialized.")
+    # convert FileSurfer's data/ files in the background, sessions use the cached markdown
+    conversion_warmup = asyncio.create_task(prewarm(os.path.join(os.getcwd(), "data")))
     yield
+    conversion_warmup.cancel()
+    try:
+        await conversion_warmup
+    except asyncio.CancelledError:
+        pass
     # Shutdown code (optional)
     # Cleanup database connection
     app.state.db = None
+    await get_search_client_pool().close()
+    await get_local_indexes().close()
+    await get_query_embedder().close()
 
-app = FastAPI(lifespan=lifespan)
+# orjson (optional) for the JSON responses as well
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse if orjson is not None else JSONResponse)
 
 # Allow all origins
 app.add_middleware(
@@ -89,6 +111,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# gzip / deflate for JSON and streamed responses, negotiated with Accept-Encoding
+app.add_middleware(CompressionMiddleware)
 
 
 # Azure AD Authentication (Mocked for example)
@@ -177,7 +201,7 @@ async def summarize_plan(plan, client):
     
     plan_summary = result.content
     return plan_summary
-async def display_log_message(log_entry, logs_dir, session_id, user_id, conversation=None):
+async def display_log_message(log_entry, logs_dir, session_id, user_id, conversation=None, model_stats=None, image_stats=None):
     _log_entry_json = log_entry
     _user_id = user_id
     
@@ -193,19 +217,32 @@ async def display_log_message(log_entry, logs_dir, session_id, user_id, conversa
         _response.source = "TaskResult"
         _response.content = _log_entry_json.messages[-1].content
         _response.stop_reason = _log_entry_json.stop_reason
+        if model_stats is not None:
+            # per model route latency and token usage of the run
+            usage = model_stats.summary()
+            if image_stats is not None:
+                usage["screenshots"] = image_stats.summary() # variant sizes and estimated vision tokens saved
+            _response.models_usage = json.dumps(usage)
+            logging.getLogger("model_routing").info(f"Model routes for {session_id}: {_response.models_usage}")
         app.state.db.store_conversation(_log_entry_json, _response, conversation)
 
     elif isinstance(_log_entry_json, MultiModalMessage):
         _response.type = _log_entry_json.type
         _response.source = _log_entry_json.source
         _response.content = _log_entry_json.content[0] # text wthout image
-        _response.content_image = _log_entry_json.content[1].data_uri # TODO: base64 encoded image -> text / serialize
+        # thumbnail variant of the screenshot, stored once and referenced by URL (served by /images)
+        _response.content_image = await get_image_store().put_bytes_async(*await get_image_processor().thumbnail_async(_log_entry_json.content[1], image_stats))
 
     elif isinstance(_log_entry_json, TextMessage):
         _response.type = _log_entry_json.type
         _response.source = _log_entry_json.source
         _response.content = _log_entry_json.content
 
+    elif isinstance(_log_entry_json, ToolCallSummaryMessage):
+        _response.type = _log_entry_json.type
+        _response.source = _log_entry_json.source
+        _response.content = _log_entry_json.content # tool result returned as the reply (direct_return)
+
     elif isinstance(_log_entry_json, ToolCallExecutionEvent):
         _response.type = _log_entry_json.type
         _response.source = _log_entry_json.source
@@ -217,6 +254,11 @@ async def display_log_message(log_entry, logs_dir, session_id, user_id, conversa
         _response.source = _log_entry_json.source
         _response.content = _log_entry_json.content[0].arguments # tool execution
 
+    elif isinstance(_log_entry_json, ContextCompactionEvent):
+        _response.type = _log_entry_json.type
+        _response.source = _log_entry_json.source
+        _response.content = _log_entry_json.to_text() # summary that replaced older turns
+
     else:
         _response.type = "N/A"
         _response.source = "N/A"
@@ -290,6 +332,14 @@ async def chat_endpoint(
     # print("Provided user_id:", message.user_id)
     logger.info(f"User ID: {_user_id}")
     _agents = json.loads(message.agents) if message.agents else MAGENTIC_ONE_DEFAULT_AGENTS
+    # team level orchestrator settings (e.g. context compaction)
+    _orchestrator = None
+    if message.team_id:
+        try:
+            _team = app.state.db.get_team(message.team_id)
+            _orchestrator = _team.get("orchestrator") if _team else None
+        except Exception as e:
+            logger.warning(f"Could not load orchestrator settings for team {message.team_id}: {str(e)}")
     _session_id = generate_session_name()
     conversation = crud.save_message(
         id=uuid.uuid4(),
@@ -298,7 +348,8 @@ async def chat_endpoint(
         message={"content": message.content, "role": "user"},
         agents=_agents,
         run_mode_locally=False,
-        timestamp=get_current_time()
+        timestamp=get_current_time(),
+        orchestrator=_orchestrator
     )
 
     logger.info(f"Conversation saved with session_id: {_session_id} and user_id: {_user_id}")
@@ -314,19 +365,9 @@ async def chat_endpoint(
     return db_message
 
 
-# Streaming Chat Endpoint
-@app.get("/chat-stream")
-async def chat_stream(
-    session_id: str = Query(...),
-    user_id: str = Query(...),
-    # db: Session = Depends(get_db),
-    user: dict = Depends(validate_token)
-):
-    
-   
-    logger = logging.getLogger("chat_stream")
-    logger.setLevel(logging.WARNING)
-    logger.warning(f"Chat stream started for session_id: {session_id} and user_id: {user_id}")
+async def start_agent_run(session_id: str, user_id: str, logger) -> dict:
+    """Initialize the team of a started session and pump its events into a bounded queue.
+    The run is registered in session_data, so /stop and /ws can reach it."""
     # create folder for logs if not exists
     logs_dir="./logs"
     if not os.path.exists(logs_dir):    
@@ -348,21 +389,204 @@ async def chat_stream(
     #  Initialize the MagenticOne system
     magentic_one = MagenticOneHelper(logs_dir=logs_dir, save_screenshots=False, run_locally=_run_locally)
     logger.warning(f"Initializing MagenticOne with agents: {len(_agents)} and session_id: {session_id}")
-    await magentic_one.initialize(agents=_agents, session_id=session_id)
+    await magentic_one.initialize(agents=_agents, session_id=session_id, orchestrator=conversation.get("orchestrator"))
     logger.warning(f"Initialized MagenticOne with agents: {len(_agents)} and session_id: {session_id}")
 
     stream, cancellation_token = magentic_one.main(task = task)
     logger.warning(f"Stream and cancellation token created for task: {task}")
 
+    run = {"magentic_one": magentic_one, "conversation": conversation, "user_id": user_id, "logs_dir": logs_dir}
+    pump_agent_run(run, stream, cancellation_token)
+    session_data[session_id] = run
+    return run
+
+
+def pump_agent_run(run: dict, stream, cancellation_token):
+    """Feed the events of `stream` into a new bounded queue of the run, so a slow client does
+    not directly stall the agents."""
+    magentic_one = run["magentic_one"]
+    queue = EventQueue.from_env()
+
+    async def format_event(log_entry):
+        return await display_log_message(log_entry=log_entry, logs_dir=run["logs_dir"], session_id=magentic_one.session_id, conversation=run["conversation"], user_id=run["user_id"], model_stats=magentic_one.model_router.stats, image_stats=magentic_one.image_stats)
+
+    run["cancellation_token"] = cancellation_token
+    run["queue"] = queue
+    run["producer"] = asyncio.create_task(pump(stream, queue, format_event))
+
+
+def end_agent_run(session_id: str, logger):
+    """Forget the run of a session, cancelling it if it is still going."""
+    run = session_data.pop(session_id, None)
+    if run is None:
+        return
+    if not run["producer"].done():
+        run["cancellation_token"].cancel()
+        run["producer"].cancel()
+    logger.warning(f"Agent run ended for session_id: {session_id}, queue: {run['queue'].summary()}")
+
+
+# Streaming Chat Endpoint
+@app.get("/chat-stream")
+async def chat_stream(
+    session_id: str = Query(...),
+    user_id: str = Query(...),
+    compact: bool = Query(False),
+    # db: Session = Depends(get_db),
+    user: dict = Depends(validate_token)
+):
+    
+   
+    logger = logging.getLogger("chat_stream")
+    logger.setLevel(logging.WARNING)
+    logger.warning(f"Chat stream started for session_id: {session_id} and user_id: {user_id}")
+    run = await start_agent_run(session_id, user_id, logger)
 
-    async def event_generator(stream, conversation):
 
-        async for log_entry in stream:
-            json_response = await display_log_message(log_entry=log_entry, logs_dir=logs_dir, session_id=magentic_one.session_id, conversation=conversation, user_id=user_id)    
-            yield f"data: {json.dumps(json_response.to_json())}\n\n"
+    async def event_generator(run):
+        serializer = EventSerializer(session_id, user_id, compact=compact)
+        try:
+            async for json_response in run["queue"].events(heartbeat_interval=heartbeat_interval_from_env()):
+                if json_response is None:
+                    yield SSE_HEARTBEAT
+                    continue
+                yield serializer.sse(json_response)
+        finally:
+            # client went away or the run finished
+            end_agent_run(session_id, logger)
 
 
-    return StreamingResponse(event_generator(stream, conversation), media_type="text/event-stream")
+    return StreamingResponse(event_generator(run), media_type="text/event-stream")
+
+
+# Multiplexed WebSocket transport
+@app.websocket("/ws")
+async def session_socket(websocket: WebSocket, user: dict = Depends(validate_token)):
+    """
+    Carries several sessions over one connection. Client messages (JSON text frames):
+        {"type": "subscribe", "session_id": ..., "user_id": ..., "binary_images": false, "compact": false}
+        {"type": "unsubscribe", "session_id": ...}
+        {"type": "stop", "session_id": ...}
+        {"type": "user_input", "session_id": ..., "content": ...}   # follow-up task once the run finished
+    Server messages: {"type": "event", "session_id": ..., "event": {...}} with the same event
+    schema as /chat-stream, and {"type": "subscribed" | "unsubscribed" | "stopped" | "end" | "error", "session_id": ...}.
+    With binary_images, screenshots are sent once per connection as binary frames
+    (see event_stream.encode_image_frame) before the first event that references them.
+    """
+    logger = logging.getLogger("session_socket")
+    logger.setLevel(logging.WARNING)
+    await websocket.accept()
+    send_lock = asyncio.Lock()
+    forwarders = {}
+    # subscribe requests whose run is still initializing
+    starting = {}
+    binary_images = {}
+    serializers = {}
+    sent_images = set()
+
+    async def send_json(message: dict):
+        async with send_lock:
+            await websocket.send_text(json.dumps(message))
+
+    async def send_image(reference: str):
+        if reference in sent_images:
+            return
+        sent_images.add(reference)
+        stored = await get_image_store().get_async(reference.rsplit("/", 1)[-1])
+        if stored is not None:
+            async with send_lock:
+                await websocket.send_bytes(encode_image_frame(reference, stored[1], stored[0]))
+
+    async def forward(session_id: str, previous: asyncio.Task = None):
+        if previous is not None:
+            # the previous run's events first, one forwarder at a time
+            await previous
+        run = session_data[session_id]
+        try:
+            async for json_response in run["queue"].events():
+                if binary_images[session_id] and json_response.content_image:
+                    await send_image(json_response.content_image)
+                async with send_lock:
+                    await websocket.send_text(serializers[session_id].websocket(json_response))
+            await send_json({"type": "end", "session_id": session_id})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in session {session_id}: {str(e)}")
+            await send_json({"type": "error", "session_id": session_id, "message": str(e)})
+
+    async def subscribe(session_id: str, message: dict):
+        """Initialize the run off the receive loop, which keeps serving the other sessions."""
+        try:
+            await start_agent_run(session_id, message.get("user_id"), logger)
+            binary_images[session_id] = bool(message.get("binary_images"))
+            serializers[session_id] = EventSerializer(session_id, message.get("user_id"), compact=bool(message.get("compact")))
+            forwarders[session_id] = asyncio.create_task(forward(session_id))
+            await send_json({"type": "subscribed", "session_id": session_id})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error starting session {session_id}: {str(e)}")
+            await send_json({"type": "error", "session_id": session_id, "message": str(e)})
+        finally:
+            starting.pop(session_id, None)
+
+    try:
+        while True:
+            message = await websocket.receive_json()
+            message_type = message.get("type")
+            session_id = message.get("session_id")
+            try:
+                if message_type == "subscribe":
+                    if session_id in forwarders or session_id in starting:
+                        raise ValueError("Already subscribed")
+                    starting[session_id] = asyncio.create_task(subscribe(session_id, message))
+
+                elif message_type == "unsubscribe":
+                    forwarder = forwarders.pop(session_id, None) or starting.pop(session_id, None)
+                    if forwarder is None:
+                        raise ValueError("Not subscribed")
+                    forwarder.cancel()
+                    end_agent_run(session_id, logger)
+                    await send_json({"type": "unsubscribed", "session_id": session_id})
+
+                elif message_type == "stop":
+                    if session_id not in forwarders:
+                        raise ValueError("Not subscribed")
+                    session_data[session_id]["cancellation_token"].cancel()
+                    await send_json({"type": "stopped", "session_id": session_id})
+
+                elif message_type == "user_input":
+                    if session_id not in forwarders:
+                        raise ValueError("Not subscribed")
+                    run = session_data[session_id]
+                    if not run["producer"].done():
+                        raise ValueError("Session is still running")
+                    crud.save_message(
+                        id=None,
+                        user_id=run["user_id"],
+                        session_id=session_id,
+                        message={"content": message["content"], "role": "user"},
+                        agents=None,
+                        run_mode_locally=None,
+                        timestamp=get_current_time()
+                    )
+                    stream, cancellation_token = run["magentic_one"].follow_up(message["content"])
+                    pump_agent_run(run, stream, cancellation_token)
+                    forwarders[session_id] = asyncio.create_task(forward(session_id, previous=forwarders[session_id]))
+
+                else:
+                    raise ValueError(f"Unknown message type: {message_type}")
+            except Exception as e:
+                await send_json({"type": "error", "session_id": session_id, "message": str(e)})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in starting.values():
+            task.cancel()
+        for session_id, forwarder in forwarders.items():
+            forwarder.cancel()
+            end_agent_run(session_id, logger)
 
 @app.get("/stop")
 async def stop(session_id: str = Query(...)):
@@ -432,6 +656,25 @@ async def health_check():
     # print("Health check endpoint called")
     return {"status": "healthy"}
 
+@app.get("/retrieval/cache")
+async def retrieval_cache_stats():
+    """Hit rate and saved latency of the RAG retrieval cache and of the query embedding cache."""
+    # the embedding summary counts the stored vectors in SQLite, keep it off the event loop
+    return {**get_retrieval_cache().summary(), "query_embeddings": await asyncio.to_thread(get_query_embedder().summary),
+            "file_conversions": get_conversion_cache().summary()}
+
+@app.get("/images/{name}")
+async def get_image(name: str, request: Request):
+    # content-addressed, so the ETag is the name and the content never changes
+    etag = f'"{name}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": IMAGE_CACHE_CONTROL})
+    image = await get_image_store().get_async(name)
+    if image is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    data, content_type = image
+    return Response(content=data, media_type=content_type, headers={"ETag": etag, "Cache-Control": IMAGE_CACHE_CONTROL})
+
 @app.post("/upload")
 async def upload_files(indexName: str = Form(...), files: List[UploadFile] = File(...)):
     logger = logging.getLogger("upload_files")
@@ -442,12 +685,44 @@ async def upload_files(indexName: str = Form(...), files: List[UploadFile] = Fil
         # print("Uploading file:", file.filename)
         logger.info(f"Uploading file: {file.filename}")
     try:
-        aisearch.process_upload_and_index(indexName, files)
-        logger.info(f"Files processed and indexed successfully.")
+        upload_metrics = await aisearch.upload_to_container(indexName, files)
+        # indexing runs in the background, see /upload/jobs/{job_id}
+        job = get_job_manager().start(indexName, upload_metrics)
+        logger.info(f"Files uploaded, indexing job {job.id} started.")
     except Exception as err:
         logger.error(f"Error processing upload and index: {str(err)}")
         return {"status": "error", "message": str(err)}
-    return {"status": "success", "filenames": [f.filename for f in files]}
+    return {"status": "success", "filenames": [f.filename for f in files], "upload": upload_metrics, "job_id": job.id}
+
+@app.get("/upload/jobs/{job_id}")
+async def get_indexing_job(job_id: str):
+    job = get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Indexing job not found")
+    return job.to_json()
+
+@app.get("/upload/jobs/{job_id}/events")
+async def indexing_job_events(job_id: str):
+    job = get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Indexing job not found")
+
+    async def event_generator():
+        updates = job.subscribe()
+        try:
+            while True:
+                try:
+                    update = await asyncio.wait_for(updates.get(), timeout=heartbeat_interval_from_env())
+                except asyncio.TimeoutError:
+                    yield SSE_HEARTBEAT
+                    continue
+                yield f"data: {json.dumps(update)}\n\n"
+                if update["status"] in FINISHED_STATES:
+                    break
+        finally:
+            job.unsubscribe(updates)
+
+    return StreamingResponse(event_generator(), media_type="text/event-stream")
 
 from fastapi import HTTPException
 
@@ -0,0 +1,185 @@
+import time
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+
+from autogen_core import CancellationToken
+from autogen_core.models import ChatCompletionClient, CreateResult, LLMMessage, ModelInfo, RequestUsage
+
+'''
+Model routing for MagenticOne teams.
+
+Clients are registered under a route name ("default" = gpt-4o, "reasoning" = o3-mini,
+"fast" = AZURE_OPENAI_FAST_DEPLOYMENT when set). Team definitions pick a route per agent
+with "model" and for the orchestrator with:
+"orchestrator": {
+    "model": "default",         # facts, plan and final answer
+    "ledger_model": "fast",     # progress ledger checks
+    "model_routing": "auto"     # send classification-style calls of every role to "fast"
+}
+'''
+ROUTE_DEFAULT = "default"
+ROUTE_REASONING = "reasoning"
+ROUTE_FAST = "fast"
+ROUTING_AUTO = "auto"
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+def is_classification_call(tools: Sequence[Any], json_output: Optional[Any]) -> bool:
+    """Short classification-style calls, like the progress ledger, ask for JSON and use no tools."""
+    return bool(json_output) and not tools
+
+
+class ModelRouteStats:
+    """Collects latency and token usage per route (e.g. "MagenticOneOrchestrator.ledger:fast")."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.prompt_tokens: Dict[str, int] = {}
+        self.completion_tokens: Dict[str, int] = {}
+
+    def record(self, route: str, latency: float, usage: Optional[RequestUsage]) -> None:
+        self.latencies.setdefault(route, []).append(latency)
+        if usage is not None:
+            self.prompt_tokens[route] = self.prompt_tokens.get(route, 0) + usage.prompt_tokens
+            self.completion_tokens[route] = self.completion_tokens.get(route, 0) + usage.completion_tokens
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        summary = {}
+        for route, latencies in self.latencies.items():
+            summary[route] = {
+                "calls": len(latencies),
+                "mean_ms": round(sum(latencies) / len(latencies) * 1000, 1),
+                "p50_ms": round(_percentile(latencies, 50) * 1000, 1),
+                "p95_ms": round(_percentile(latencies, 95) * 1000, 1),
+                "prompt_tokens": self.prompt_tokens.get(route, 0),
+                "completion_tokens": self.completion_tokens.get(route, 0),
+            }
+        return summary
+
+
+class RoutedChatCompletionClient(ChatCompletionClient):
+    """Sends calls to `client` and records their latency under `route`.
+
+    If a `classification_client` is given, classification-style calls (see is_classification_call)
+    are sent there instead and recorded under `classification_route`.
+    """
+
+    def __init__(
+        self,
+        client: ChatCompletionClient,
+        route: str,
+        stats: ModelRouteStats,
+        classification_client: Optional[ChatCompletionClient] = None,
+        classification_route: Optional[str] = None,
+    ):
+        self._client = client
+        self._route = route
+        self._stats = stats
+        self._classification_client = classification_client
+        self._classification_route = classification_route or route
+
+    def _select(self, tools: Sequence[Any], json_output: Optional[Any]):
+        if self._classification_client is not None and is_classification_call(tools, json_output):
+            return self._classification_client, self._classification_route
+        return self._client, self._route
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Any] = [],
+        json_output: Optional[Any] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        client, route = self._select(tools, json_output)
+        started = time.perf_counter()
+        result = await client.create(
+            messages, tools=tools, json_output=json_output,
+            extra_create_args=extra_create_args, cancellation_token=cancellation_token,
+        )
+        self._stats.record(route, time.perf_counter() - started, result.usage)
+        return result
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Any] = [],
+        json_output: Optional[Any] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ):
+        client, route = self._select(tools, json_output)
+        started = time.perf_counter()
+        async for chunk in client.create_stream(
+            messages, tools=tools, json_output=json_output,
+            extra_create_args=extra_create_args, cancellation_token=cancellation_token,
+        ):
+            if isinstance(chunk, CreateResult):
+                self._stats.record(route, time.perf_counter() - started, chunk.usage)
+            yield chunk
+
+    async def close(self) -> None:
+        # The underlying clients are shared between roles and closed by their owner
+        pass
+
+    def actual_usage(self) -> RequestUsage:
+        return self._client.actual_usage()
+
+    def total_usage(self) -> RequestUsage:
+        return self._client.total_usage()
+
+    def count_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Any] = []) -> int:
+        return self._client.count_tokens(messages, tools=tools)
+
+    def remaining_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Any] = []) -> int:
+        return self._client.remaining_tokens(messages, tools=tools)
+
+    @property
+    def capabilities(self) -> Any:
+        return self._client.model_info
+
+    @property
+    def model_info(self) -> ModelInfo:
+        return self._client.model_info
+
+
+class ModelRouter:
+    """Hands out RoutedChatCompletionClient instances per role from a set of named clients."""
+
+    def __init__(self, clients: Dict[str, ChatCompletionClient], auto: bool = False):
+        self.clients = clients
+        self.auto = auto
+        self.stats = ModelRouteStats()
+
+    def _resolve(self, route: Optional[str]) -> str:
+        route = route or ROUTE_DEFAULT
+        if route not in self.clients:
+            raise ValueError(f"Unknown model route '{route}', available: {', '.join(self.clients)}")
+        return route
+
+    def client_for(self, role: str, route: Optional[str] = None, classification_route: Optional[str] = None) -> RoutedChatCompletionClient:
+        """Client for `role` on `route`; classification-style calls go to `classification_route`
+        (or to the fast route in auto mode)."""
+        route = self._resolve(route)
+        if classification_route is None and self.auto and ROUTE_FAST in self.clients:
+            classification_route = ROUTE_FAST
+        classification_client = None
+        if classification_route is not None:
+            classification_route = self._resolve(classification_route)
+            if classification_route != route:
+                classification_client = self.clients[classification_route]
+        return RoutedChatCompletionClient(
+            self.clients[route],
+            route=f"{role}:{route}",
+            stats=self.stats,
+            classification_client=classification_client,
+            classification_route=f"{role}.classification:{classification_route}" if classification_client else None,
+        )
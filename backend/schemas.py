@@ -14,6 +14,7 @@ class ChatMessageCreate(ChatMessageBase):
     content: str
     agents: Optional[str] = None
     user_id: Optional[str] = None
+    team_id: Optional[str] = None
 
 class ChatMessageResponse(ChatMessageBase):
     id: UUID
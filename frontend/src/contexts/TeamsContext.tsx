@@ -10,6 +10,18 @@ export interface Agent {
   description: string;
   icon: string;
   index_name: string;
+  // optional RAG search settings, see MagenticOneRAGAgent on the backend
+  search_backend?: "azure" | "local";
+  search_mode?: "hybrid" | "vector";
+  top_k?: number;
+  k_nearest_neighbors?: number;
+  exhaustive?: boolean;
+  semantic_ranker?: boolean;
+  direct_return?: boolean;
+  query_vectorization?: "service" | "client";
+  // type "FederatedRAG": indexes searched together (or a comma separated index_name)
+  index_names?: string[];
+  fusion?: "rrf" | "score";
 }
 
 export interface TeamTask {
@@ -234,6 +246,26 @@ export const TeamsProvider: React.FC<{ children: React.ReactNode }> = ({ childre
           return;
         }
         console.log('Upload response:', response.data);
+        // Indexing runs in the background, wait for the job to finish
+        if (response.data.job_id) {
+          await new Promise<void>((resolve) => {
+            const source = new EventSource(`${BASE_URL}/upload/jobs/${response.data.job_id}/events`);
+            source.onmessage = (event) => {
+              const job = JSON.parse(event.data);
+              if (job.status === "completed" || job.status === "failed") {
+                if (job.status === "failed") {
+                  console.error('Indexing error:', job.errors);
+                }
+                source.close();
+                resolve();
+              }
+            };
+            source.onerror = () => {
+              source.close();
+              resolve();
+            };
+          });
+        }
       } catch (error) {
         console.error('Upload error:', error);
       } finally {
@@ -376,7 +376,7 @@ export default function PlaygroundHistory() {
                                   <p className="text-sm font-semibold">{message.source}</p>
                                   <MarkdownRenderer markdownText={message.content} />
                                   {message.content_image && (
-                                    <img src={`${message.content_image}`} alt="content" className="mt-2 max-w-[625px]" />
+                                    <img src={message.content_image.startsWith('/') ? `${BASE_URL}${message.content_image}` : message.content_image} alt="content" className="mt-2 max-w-[625px]" loading="lazy" />
                                   )}
                                 </div>
                               </div>
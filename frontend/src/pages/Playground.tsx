@@ -191,7 +191,8 @@ export default function App() {
       const response = await axios.post(`${BASE_URL}/start`, { 
         content: userMessage, 
         user_id: userInfo.email, // Use directly from context
-        agents: JSON.stringify(selectedAgents)
+        agents: JSON.stringify(selectedAgents),
+        team_id: selectedTeam?.team_id
       });
       const sessionId = response.data.response;  // Get the session ID from the response
       setSessionID(sessionId);
@@ -385,7 +386,7 @@ export default function App() {
                             <MarkdownRenderer markdownText={message.message} />
                             {/* Display image if available */}
                             {message.content_image && (
-                              <img src={`${message.content_image}`} alt="content" className="mt-2 max-w-[625px]" />
+                              <img src={message.content_image.startsWith('/') ? `${BASE_URL}${message.content_image}` : message.content_image} alt="content" className="mt-2 max-w-[625px]" loading="lazy" />
                             )}
                             {/* <MarkdownRenderer>{message.message}</MarkdownRenderer> */}
                             <p className="text-xs text-muted-foreground">{message.time && new Date(message.time).toLocaleTimeString([], { hour: '2-digit', minute: '2-digit', second: '2-digit',hour12: false })}</p>